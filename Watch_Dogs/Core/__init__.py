@@ -1,6 +1,39 @@
 #!/usr/bin/env python
 # encoding:utf-8
 
+"""
+进程监测核心功能 - 采集器注册表
+
+导入 Watch_Dogs.Core 时只定义注册表, 各采集器模块在首次 get_collector 时才导入,
+采集器模块本身在导入时也不读取/proc, 不加载 ctypes (nethogs 等在首次使用时才加载)
+"""
+
+import importlib
+
+# 采集器名称 -> 模块名
+COLLECTORS = {
+    "sys": "sys_monitor",
+    "process": "process_monitor",
+    "process_manage": "process_manage",
+    "nethogs": "nethogs_monitor",
+    "sampler": "metric_sampler",
+    "proc_events": "proc_connector",
+    "pressure": "pressure_monitor",
+    "taskstats": "taskstats",
+    "dir_size": "dir_size",
+}
+
+
+def register_collector(name, module_name):
+    """注册采集器 (模块名为 Watch_Dogs.Core 下的模块)"""
+    COLLECTORS[name] = module_name
+
+
+def get_collector(name):
+    """获取采集器模块 (首次调用时导入)"""
+    return importlib.import_module("." + COLLECTORS[name], __name__)
+
+
 # note
 
 # 1. CPU信息中时间片的单位是jiffies,jiffies记录了系统启动以来，经过了多少tick=5ms。
@@ -0,0 +1,522 @@
+#!/usr/bin/env python
+# encoding:utf-8
+
+"""
+进程监测核心功能实现 - 文件夹总大小
+
+主要包括
+- 基于 scandir 遍历 (目录项自带文件类型, 不需要再判断是否为文件夹)
+- 硬链接(st_nlink > 1)的文件按 (st_dev, st_ino) 去重, 只计算一次
+- 按层级分发到线程池中并行遍历 (os 调用时释放GIL)
+- 每个文件夹按 mtime 缓存, 文件夹 mtime 未变化且缓存未过期时不重新遍历
+- 持续关注的文件夹(日志目录,上传目录)基于 inotify 实时维护总大小, 查询为O(1)
+  (事件队列溢出时重新遍历, 达到 inotify watch 数量上限时退回按mtime增量遍历)
+
+注意 : 文件夹的 mtime 只在其中创建/删除/重命名文件时改变, 已有文件写入内容不会改变所在文件夹的 mtime,
+       因此缓存有效期(max_age)内已有文件大小的变化不会体现, max_age=0 时每次都重新获取文件大小
+       (get_path_total_size 默认 max_age=0, 可以接受延迟的调用方显式传入 max_age 使用缓存)
+       符号链接不跟随 (与 du 一致, 避免重复计算或统计到路径之外)
+
+reference   :   http://man7.org/linux/man-pages/man7/inotify.7.html
+"""
+
+import os
+import stat
+import errno
+import select
+import struct
+import threading
+from time import time
+
+from process_monitor import scandir
+
+# 文件夹缓存有效期(秒)
+DIR_SIZE_CACHE_TTL = 60
+# 并行遍历的线程数
+DIR_SIZE_WORKERS = 8
+# 实时维护停止(inotify 不可用,文件夹被删除等)后, 重新尝试实时维护的间隔(秒)
+DIR_WATCH_RETRY_INTERVAL = 60
+
+# inotify 常量
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# 文件夹关注的事件 (IN_ATTRIB 用于感知硬链接数变化)
+DIR_WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF |
+                  IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+
+INOTIFY_EVENT_HEADER = struct.Struct("=iIII")  # inotify_event : wd, mask, cookie, len
+
+# libc inotify 函数 - 首次使用时才加载, 避免导入本模块时加载 ctypes
+inotify_libc = None
+
+# 实时维护大小的文件夹 路径 -> DirSizeWatcher
+dir_size_watchers = {}
+dir_size_watchers_lock = threading.Lock()
+
+
+class DirRecord(object):
+    """单个文件夹(不含子文件夹)的统计"""
+
+    __slots__ = ("mtime", "scan_time", "size", "links", "subdirs")
+
+    def __init__(self, mtime, size=0, links=(), subdirs=()):
+        self.mtime = mtime
+        self.scan_time = time()
+        self.size = size  # 普通文件(st_nlink == 1)大小之和
+        self.links = links  # 硬链接文件 ((st_dev, st_ino, 大小), ...)
+        self.subdirs = subdirs  # 子文件夹路径
+
+
+def scan_dir(path, mtime):
+    """遍历单个文件夹 -> DirRecord (不可读时为空记录)"""
+    size = 0
+    links = []
+    subdirs = []
+    try:
+        if scandir is not None:
+            for entry in scandir(path):
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    try:
+                        entry_stat = entry.stat(follow_symlinks=False)
+                    except OSError:  # 遍历过程中被删除
+                        continue
+                    if entry_stat.st_nlink > 1:
+                        links.append((entry_stat.st_dev, entry_stat.st_ino, entry_stat.st_size))
+                    else:
+                        size += entry_stat.st_size
+        else:
+            for name in os.listdir(path):
+                entry_path = os.path.join(path, name)
+                try:
+                    entry_stat = os.lstat(entry_path)
+                except OSError:
+                    continue
+                if stat.S_ISDIR(entry_stat.st_mode):
+                    subdirs.append(entry_path)
+                elif stat.S_ISREG(entry_stat.st_mode):
+                    if entry_stat.st_nlink > 1:
+                        links.append((entry_stat.st_dev, entry_stat.st_ino, entry_stat.st_size))
+                    else:
+                        size += entry_stat.st_size
+    except OSError:  # 无权限或遍历过程中被删除
+        pass
+    return DirRecord(mtime, size, tuple(links), tuple(subdirs))
+
+
+class DirSizeEngine(object):
+    """文件夹总大小计算 (按文件夹 mtime 增量更新, 线程池并行遍历)"""
+
+    def __init__(self, workers=DIR_SIZE_WORKERS, max_age=DIR_SIZE_CACHE_TTL):
+        self.workers = workers
+        self.max_age = max_age
+        self.records = {}  # 文件夹路径 -> DirRecord
+        self.pool = None  # 首次使用时创建
+        self.lock = threading.Lock()
+        self.scanned = 0  # 累计重新遍历的文件夹数
+        self.cached = 0  # 累计使用缓存的文件夹数
+
+    def get_pool(self):
+        if self.pool is None:
+            from multiprocessing.pool import ThreadPool  # multiprocessing 导入较慢, 首次使用时才导入
+            self.pool = ThreadPool(self.workers)
+        return self.pool
+
+    def refresh_dir(self, path, max_age):
+        """获取单个文件夹的统计 -> (路径, DirRecord, 是否重新遍历) (文件夹已不存在时 DirRecord 为None)"""
+        try:
+            mtime = os.lstat(path).st_mtime
+        except OSError:
+            return path, None, False
+        record = self.records.get(path)
+        if record is not None and record.mtime == mtime and time() - record.scan_time < max_age:
+            return path, record, False
+        return path, scan_dir(path, mtime), True
+
+    def get_size(self, path, max_age=None):
+        """获取文件夹总大小(字节) - 不存在时为0"""
+        max_age = self.max_age if max_age is None else max_age
+        path = os.path.abspath(path)
+        with self.lock:
+            visited = set()
+            seen_links = set()
+            total_size = 0
+            level = [path]
+            while level:
+                if len(level) > 1:
+                    results = self.get_pool().map(lambda dir_path: self.refresh_dir(dir_path, max_age), level)
+                else:
+                    results = [self.refresh_dir(level[0], max_age)]
+                level = []
+                for dir_path, record, scanned in results:
+                    if record is None:
+                        continue
+                    if scanned:
+                        self.records[dir_path] = record
+                        self.scanned += 1
+                    else:
+                        self.cached += 1
+                    visited.add(dir_path)
+                    total_size += record.size
+                    for dev, ino, size in record.links:
+                        if (dev, ino) not in seen_links:
+                            seen_links.add((dev, ino))
+                            total_size += size
+                    level.extend(record.subdirs)
+            self.prune(path, visited)
+        return total_size
+
+    def prune(self, path, visited):
+        """移除路径下已不存在的文件夹缓存"""
+        prefix = path.rstrip(os.sep) + os.sep
+        for dir_path in [dir_path for dir_path in self.records
+                         if (dir_path == path or dir_path.startswith(prefix)) and dir_path not in visited]:
+            del self.records[dir_path]
+
+    def forget(self, path):
+        """移除路径(及其子文件夹)的缓存"""
+        path = os.path.abspath(path)
+        with self.lock:
+            self.prune(path, ())
+
+    def stats(self):
+        """缓存统计"""
+        return {"dirs": len(self.records), "scanned": self.scanned, "cached": self.cached}
+
+
+# 默认的文件夹大小计算实例
+dir_size_engine = DirSizeEngine()
+
+
+def load_inotify():
+    """加载 libc inotify 函数 -> (ctypes模块, inotify_init1, inotify_add_watch, inotify_rm_watch)"""
+    global inotify_libc
+    if inotify_libc is None:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        inotify_libc = ctypes, libc.inotify_init1, libc.inotify_add_watch, libc.inotify_rm_watch
+    return inotify_libc
+
+
+class DirNode(object):
+    """inotify 关注的单个文件夹"""
+
+    __slots__ = ("wd", "ino", "files", "subdirs")
+
+    def __init__(self, wd, ino):
+        self.wd = wd
+        self.ino = ino
+        self.files = {}  # 文件名 -> (st_dev, st_ino)
+        self.subdirs = set()  # 子文件夹名
+
+
+class DirSizeWatcher(threading.Thread):
+    """
+    基于 inotify 实时维护文件夹总大小 (首次遍历一次, 之后根据 创建/修改/删除/移动 事件增量更新)
+    - 文件按 (st_dev, st_ino) 引用计数, 硬链接只计算一次, 总大小随每次更新维护, 查询为O(1)
+    - 同一批事件中的同名文件只重新获取一次大小
+    - 事件队列溢出(IN_Q_OVERFLOW)时重新遍历
+    - inotify 实例数达到上限(EMFILE, 见 /proc/sys/fs/inotify/max_user_instances),
+      达到 watch 数量上限(ENOSPC, 见 /proc/sys/fs/inotify/max_user_watches)或文件夹本身被删除/移动时,
+      停止实时维护, 查询退回 dir_size_engine 按mtime增量遍历
+    """
+
+    def __init__(self, path):
+        threading.Thread.__init__(self, name="Watch_Dogs-DirSizeWatcher")
+        self.daemon = True
+        self.path = os.path.abspath(path)
+        self.fd = None
+        self.nodes = {}  # 文件夹路径 -> DirNode
+        self.paths = {}  # wd -> 文件夹路径
+        self.inodes = {}  # (st_dev, st_ino) -> [引用数, 大小]
+        self.total_size = 0
+        self.live = False  # 是否正在实时维护
+        self.end_time = None  # 停止实时维护的时间
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.events = 0
+        self.rescans = 0
+
+    def start(self):
+        with self.lock:
+            self.rebuild()
+        threading.Thread.start(self)
+
+    def add_watch(self, path):
+        """关注文件夹 -> wd (失败时抛出 OSError)"""
+        ctypes, inotify_init1, inotify_add_watch, inotify_rm_watch = inotify_libc or load_inotify()
+        wd = inotify_add_watch(self.fd, path, DIR_WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def rm_watch(self, wd):
+        ctypes, inotify_init1, inotify_add_watch, inotify_rm_watch = inotify_libc or load_inotify()
+        inotify_rm_watch(self.fd, wd)
+
+    def close_fd(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def rebuild(self):
+        """重新创建 inotify 并遍历整个文件夹 (需持有锁)"""
+        ctypes, inotify_init1, inotify_add_watch, inotify_rm_watch = inotify_libc or load_inotify()
+        self.close_fd()
+        self.nodes.clear()
+        self.paths.clear()
+        self.inodes.clear()
+        self.total_size = 0
+        self.rescans += 1
+        try:
+            fd = inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                err = ctypes.get_errno()
+                raise OSError(err, os.strerror(err))
+            self.fd = fd
+            self.live = self.add_tree(self.path)
+        except OSError:  # inotify 实例数/watch 数量达到上限等
+            self.live = False
+        if not self.live:
+            self.close_fd()
+            self.nodes.clear()
+            self.paths.clear()
+
+    def add_tree(self, path):
+        """关注并遍历文件夹及其子文件夹 -> 文件夹是否存在 (需持有锁, 达到watch数量上限时抛出 OSError(ENOSPC))"""
+        level = [path]
+        while level:
+            dir_path = level.pop()
+            try:
+                wd = self.add_watch(dir_path)  # 先关注再遍历, 避免遗漏遍历期间的变化
+                node = DirNode(wd, os.lstat(dir_path).st_ino)
+            except OSError as err:
+                if err.errno == errno.ENOSPC:
+                    raise
+                if dir_path == path:
+                    return False
+                continue  # 无权限或已被删除
+            self.nodes[dir_path] = node
+            self.paths[wd] = dir_path
+            try:
+                names = os.listdir(dir_path)
+            except OSError:
+                continue
+            for name in names:
+                entry_path = os.path.join(dir_path, name)
+                try:
+                    entry_stat = os.lstat(entry_path)
+                except OSError:
+                    continue
+                if stat.S_ISDIR(entry_stat.st_mode):
+                    node.subdirs.add(name)
+                    level.append(entry_path)
+                elif stat.S_ISREG(entry_stat.st_mode):
+                    self.set_file(node, name, entry_stat)
+        return True
+
+    def remove_tree(self, path):
+        """移除文件夹及其子文件夹 (需持有锁)"""
+        level = [path]
+        while level:
+            dir_path = level.pop()
+            node = self.nodes.pop(dir_path, None)
+            if node is None:
+                continue
+            for name in list(node.files):
+                self.remove_file(node, name)
+            if self.paths.get(node.wd) == dir_path:
+                del self.paths[node.wd]
+                self.rm_watch(node.wd)  # 文件夹已删除时watch已失效, 返回错误可忽略
+            level.extend(os.path.join(dir_path, name) for name in node.subdirs)
+
+    def set_file(self, node, name, entry_stat):
+        """添加/更新文件 (需持有锁)"""
+        key = (entry_stat.st_dev, entry_stat.st_ino)
+        old_key = node.files.get(name)
+        if old_key is not None and old_key != key:
+            self.remove_file(node, name)
+            old_key = None
+        inode = self.inodes.get(key)
+        if inode is None:
+            self.inodes[key] = [1, entry_stat.st_size]
+            self.total_size += entry_stat.st_size
+        else:
+            if old_key is None:
+                inode[0] += 1
+            self.total_size += entry_stat.st_size - inode[1]
+            inode[1] = entry_stat.st_size
+        node.files[name] = key
+
+    def remove_file(self, node, name):
+        """移除文件 (需持有锁)"""
+        key = node.files.pop(name, None)
+        if key is None:
+            return
+        inode = self.inodes[key]
+        inode[0] -= 1
+        if not inode[0]:
+            del self.inodes[key]
+            self.total_size -= inode[1]
+
+    def apply_events(self, data):
+        """处理一批 inotify 事件 (需持有锁)"""
+        changed = set()  # (文件夹路径, 文件名)
+        offset = 0
+        while offset + INOTIFY_EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, name_len = INOTIFY_EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + INOTIFY_EVENT_HEADER.size:offset + INOTIFY_EVENT_HEADER.size + name_len]
+            offset += INOTIFY_EVENT_HEADER.size + name_len
+            self.events += 1
+            if mask & IN_Q_OVERFLOW:  # 事件已丢失
+                self.rebuild()
+                return
+            dir_path = self.paths.get(wd)
+            if dir_path is None:
+                continue
+            name = name.rstrip("\0")
+            if name:
+                changed.add((dir_path, name))
+            elif mask & IN_IGNORED:  # 文件夹已删除, 由父文件夹的删除事件更新大小
+                del self.paths[wd]
+            if dir_path == self.path and mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                self.live = False
+                return
+
+        # 先移除已删除/替换的文件夹(移出的文件夹watch仍有效, 需要先移除再重新关注), 再添加新文件夹
+        new_dirs = []
+        for dir_path, name in changed:
+            node = self.nodes.get(dir_path)
+            if node is None:  # 所在文件夹已被移除
+                continue
+            entry_path = os.path.join(dir_path, name)
+            try:
+                entry_stat = os.lstat(entry_path)
+            except OSError:
+                entry_stat = None
+            is_dir = entry_stat is not None and stat.S_ISDIR(entry_stat.st_mode)
+            if name in node.subdirs:
+                child = self.nodes.get(entry_path)
+                if not is_dir or child is None or child.ino != entry_stat.st_ino:
+                    node.subdirs.discard(name)
+                    self.remove_tree(entry_path)
+            if entry_stat is not None and stat.S_ISREG(entry_stat.st_mode):
+                self.set_file(node, name, entry_stat)
+            else:
+                self.remove_file(node, name)
+                if is_dir and name not in node.subdirs:
+                    new_dirs.append((dir_path, name))
+
+        for dir_path, name in new_dirs:
+            node = self.nodes.get(dir_path)
+            if node is not None and name not in node.subdirs:
+                node.subdirs.add(name)
+                try:
+                    self.add_tree(os.path.join(dir_path, name))
+                except OSError:  # 达到 watch 数量上限
+                    self.live = False
+                    return
+
+    def run(self):
+        try:
+            if not self.live:
+                return
+            poller = select.poll()
+            poller.register(self.fd, select.POLLIN)
+            while self.live and not self.stop_event.is_set():
+                if not poller.poll(1000):
+                    continue
+                with self.lock:
+                    try:
+                        data = os.read(self.fd, 65536)
+                    except OSError as err:
+                        if err.errno == errno.EAGAIN:
+                            continue
+                        raise
+                    fd = self.fd
+                    self.apply_events(data)
+                    if self.live and self.fd != fd:  # 重新遍历后 inotify 已重新创建
+                        poller = select.poll()
+                        poller.register(self.fd, select.POLLIN)
+        finally:
+            with self.lock:
+                self.live = False
+                self.close_fd()
+                self.end_time = time()
+
+    def get_size(self, max_age=None):
+        """获取文件夹总大小(字节) - 实时维护时O(1), 否则(包括已停止/线程已退出)退回按mtime增量遍历"""
+        if self.live and self.is_alive() and not self.stop_event.is_set():
+            return self.total_size
+        return dir_size_engine.get_size(self.path, max_age)
+
+    def stats(self):
+        """统计 (关注的文件夹数, 文件数, 累计事件数, 遍历次数, 是否实时维护)"""
+        return {"dirs": len(self.nodes), "files": len(self.inodes), "events": self.events,
+                "rescans": self.rescans, "live": self.live}
+
+    def stop(self):
+        """停止实时维护"""
+        self.stop_event.set()
+
+
+def watch_path_size(path):
+    """
+    开始实时维护文件夹总大小 -> DirSizeWatcher (已在维护时直接返回)
+    已停止实时维护的 DirSizeWatcher 在 DIR_WATCH_RETRY_INTERVAL 后替换 (避免 inotify 不可用时每次查询都重新遍历)
+    """
+    path = os.path.abspath(path)
+    with dir_size_watchers_lock:
+        watcher = dir_size_watchers.get(path)
+        if watcher is None or not watcher.is_alive() and time() - (watcher.end_time or 0) >= DIR_WATCH_RETRY_INTERVAL:
+            watcher = dir_size_watchers[path] = DirSizeWatcher(path)
+            watcher.start()
+    return watcher
+
+
+def unwatch_path_size(path):
+    """停止实时维护文件夹总大小"""
+    with dir_size_watchers_lock:
+        watcher = dir_size_watchers.pop(os.path.abspath(path), None)
+    if watcher is not None:
+        watcher.stop()
+
+
+def get_path_total_size(path, style="M", max_age=0, watch=False):
+    """
+    获取文件夹总大小(默认MB, max_age为文件夹缓存有效期(秒), 默认0即每次重新获取文件大小, None为 DIR_SIZE_CACHE_TTL)
+    watch=True 时开始基于 inotify 实时维护 (之后的查询为O(1)), 已在实时维护的文件夹直接返回维护的大小
+    """
+    watcher = dir_size_watchers.get(os.path.abspath(path))
+    if watch and (watcher is None or not watcher.is_alive()):
+        watcher = watch_path_size(path)
+    if watcher is not None:
+        total_size = watcher.get_size(max_age)
+    else:
+        total_size = dir_size_engine.get_size(path, max_age)
+    # 调整返回单位大小
+    if style == "M":
+        return round(total_size / 1024. ** 2, 2)
+    elif style == "G":
+        return round(total_size / 1024. ** 3, 2)
+    else:  # "KB"
+        return round(total_size / 1024., 2)
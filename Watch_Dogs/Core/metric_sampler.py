@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+# encoding:utf-8
+
+"""
+进程监测核心功能实现 - 后台采样
+
+后台采样线程按固定间隔计算各项速率指标,基线数据常驻,最近的计算结果存放在环形缓冲区中.
+采样线程运行时, calc_* 系列函数直接返回最近一次的采样结果, 不再需要首次调用时 sleep(interval) 初始化基线.
+- 启动时预先采样全部系统指标, 首次调用不需要等待
+- 首次调用的进程指标开始采样并退回同步计算一次, 之后的调用直接返回采样结果
+- calc_with_age 返回指标值及其距今秒数
+
+支持的指标
+- ("cpu_percent",)                  CPU总占用率
+- ("cpu_percent_by_cores",)         CPU各核占用率
+- ("net_speed", device_name)        网卡上下载速度
+- ("net_rates",)                    所有网卡各项计数器的速率
+- ("mem_rates",)                    内存脏页增长,换入换出速度
+- ("disk_io",)                      所有块设备的IO速率
+- ("pressure", cgroup)              系统(cgroup为None)或cgroup的资源压力(PSI)
+- ("process_cpu_percent", pid)      进程CPU占用率
+- ("process_io", pid)               进程磁盘IO速度
+
+各项指标最近一次的采样结果同时发布到 sampled_metrics (MetricStore), 可获取所有指标某一时刻一致的快照
+"""
+
+import threading
+from collections import deque
+from time import time
+
+from prcess_exception import NoSuchProcess, AccessDenied
+from metric_store import MetricStore
+from sys_monitor import read_proc_stat, read_mem_snapshot, calc_mem_rates_between, \
+    get_net_dev_snapshot, calc_net_rates_between, get_default_net_device, read_diskstats_snapshot, \
+    calc_disk_io_between
+from process_monitor import get_process_cpu_time, get_process_io
+from pressure_monitor import PressureSnapshot, calc_pressure_between
+
+sample_interval = 2  # 采样间隔(秒)
+sample_ring_size = 60  # 每项指标保留的历史采样数
+
+# 正在运行的采样线程
+sampler = None
+# 各项指标最近一次的采样结果 指标 -> (采样时间, 值)
+sampled_metrics = MetricStore()
+
+# 当前线程最近一次 get_sampled_metric 返回的采样结果距今秒数 (calc_with_age 使用)
+sample_age = threading.local()
+
+# 进程相关指标 (同一进程的指标一起采样)
+PROCESS_METRICS = ("process_cpu_percent", "process_io")
+
+
+class MetricSampler(threading.Thread):
+    """后台采样线程"""
+
+    def __init__(self, interval=sample_interval, ring_size=sample_ring_size):
+        threading.Thread.__init__(self, name="Watch_Dogs-MetricSampler")
+        self.daemon = True
+        self.interval = interval
+        self.ring_size = ring_size
+        self.watching = set()  # 正在采样的指标
+        self.baseline = {}  # 指标 -> (上次采样的原始数据, 读取时间)
+        self.rings = {}  # 指标 -> 环形缓冲区 [(采样时间, 值), ...]
+        self.cond = threading.Condition()
+        self.stop_event = threading.Event()
+
+    def watch(self, key):
+        """添加采样指标 (立即记录基线,下一次采样即可得到结果)"""
+        keys = [key]
+        if key[0] in PROCESS_METRICS:
+            keys = [(metric, key[1]) for metric in PROCESS_METRICS]
+
+        snapshot = read_proc_stat()
+        for k in keys:
+            with self.cond:
+                if k in self.watching:
+                    continue
+            try:
+                raw = self.read_raw(k, snapshot)
+            except (NoSuchProcess, AccessDenied, EnvironmentError):
+                if k == key:
+                    raise
+                continue
+            with self.cond:
+                self.watching.add(k)
+                self.baseline[k] = raw, time()
+                if k not in self.rings:
+                    self.rings[k] = deque(maxlen=self.ring_size)
+
+    def unwatch(self, key):
+        """移除采样指标(保留历史数据)"""
+        with self.cond:
+            self.watching.discard(key)
+            self.baseline.pop(key, None)
+        sampled_metrics.discard(key)
+
+    def latest(self, key, wait=0):
+        """
+        获取指标最近一次的采样结果 -> (值, 距今秒数), 尚无结果时最多等待wait秒
+        无法采样(进程不存在,无权限,不支持)或等待超时时返回 None, 由调用方退回同步计算(并抛出相应异常)
+        尚未采样的指标开始采样后立即返回 None (不等待, 避免调用方等待采样后又同步计算一次)
+        """
+        if key not in self.watching:
+            try:
+                self.watch(key)
+            except (NoSuchProcess, AccessDenied, EnvironmentError):
+                pass
+            return None
+        deadline = time() + wait
+        with self.cond:
+            while not self.rings.get(key):
+                remaining = deadline - time()
+                if remaining <= 0 or key not in self.watching:
+                    return None
+                self.cond.wait(remaining)
+            sample_time, value = self.rings[key][-1]
+        return value, time() - sample_time
+
+    def history(self, key):
+        """获取指标的全部历史采样 [(采样时间, 值), ...]"""
+        with self.cond:
+            return list(self.rings.get(key, ()))
+
+    def read_raw(self, key, snapshot):
+        """读取指标对应的原始数据"""
+        metric = key[0]
+        if metric == "cpu_percent":
+            return snapshot.cpu
+        elif metric == "cpu_percent_by_cores":
+            return snapshot.cpu_by_cores
+        elif metric == "net_speed":
+            net_dev_snapshot = get_net_dev_snapshot(max_age=self.interval / 2.0)
+            counters = net_dev_snapshot.devices.get(key[1], (0,) * 9)
+            return (counters[0], counters[8]), net_dev_snapshot.time
+        elif metric == "net_rates":
+            return get_net_dev_snapshot(max_age=self.interval / 2.0)
+        elif metric == "mem_rates":
+            return read_mem_snapshot()
+        elif metric == "disk_io":
+            return read_diskstats_snapshot()
+        elif metric == "pressure":
+            return PressureSnapshot(key[1])
+        elif metric == "process_cpu_percent":
+            return get_process_cpu_time(key[1]), snapshot.cpu[0]
+        elif metric == "process_io":
+            return get_process_io(key[1]), snapshot.time
+        raise KeyError(key)
+
+    @staticmethod
+    def calc_rate(key, prev, current):
+        """根据前后两次原始数据计算指标"""
+        metric = key[0]
+        if metric == "cpu_percent":
+            if current[0] == prev[0]:
+                return 0.0
+            return (current[1] - prev[1]) * 100.0 / (current[0] - prev[0])
+        elif metric == "cpu_percent_by_cores":
+            cpu_percent_by_cores = {}
+            for cpu_name, (total_time, work_time) in current.items():
+                if cpu_name in prev and total_time != prev[cpu_name][0]:
+                    cpu_percent_by_cores[cpu_name] = \
+                        (work_time - prev[cpu_name][1]) * 100.0 / (total_time - prev[cpu_name][0])
+                else:
+                    cpu_percent_by_cores[cpu_name] = 0.0
+            return cpu_percent_by_cores
+        elif metric == "net_speed":
+            (prev_receive, prev_send), prev_time = prev
+            (current_receive, current_send), current_time = current
+            if current_time == prev_time:
+                return 0.0, 0.0
+            return (current_receive - prev_receive) / 1024.0 / (current_time - prev_time), \
+                   (current_send - prev_send) / 1024.0 / (current_time - prev_time)
+        elif metric == "net_rates":
+            return calc_net_rates_between(prev, current)
+        elif metric == "mem_rates":
+            return calc_mem_rates_between(prev, current)
+        elif metric == "disk_io":
+            return calc_disk_io_between(prev, current)
+        elif metric == "pressure":
+            return calc_pressure_between(prev, current)
+        elif metric == "process_cpu_percent":
+            if current[1] == prev[1]:
+                return 0.0
+            return (current[0] - prev[0]) * 100.0 / (current[1] - prev[1])
+        elif metric == "process_io":
+            (prev_rchar, prev_wchar), prev_time = prev
+            (current_rchar, current_wchar), current_time = current
+            if current_time == prev_time:
+                return [0.0, 0.0]
+            # 注意,这里为了计算磁盘的IO,除以的数字是1000而不是1024
+            return [round((current_rchar - prev_rchar) / 1000. ** 2 / (current_time - prev_time), 2),
+                    round((current_wchar - prev_wchar) / 1000. ** 2 / (current_time - prev_time), 2)]
+
+    def sample(self):
+        """进行一次采样"""
+        snapshot = read_proc_stat()
+        with self.cond:
+            keys = list(self.watching)
+
+        results = {}
+        for key in keys:
+            try:
+                results[key] = self.read_raw(key, snapshot), time()
+            except (NoSuchProcess, AccessDenied, EnvironmentError):  # 进程已退出,无权限或不支持(如PSI),停止采样
+                self.unwatch(key)
+
+        with self.cond:
+            for key, (current, current_time) in results.items():
+                if key not in self.watching:
+                    continue
+                prev, prev_time = self.baseline.get(key, (None, None))
+                if prev is not None and current_time - prev_time < self.interval / 2.0:
+                    continue  # 距离基线太近(刚开始采样), 速率误差大, 保留原基线等待下一次采样
+                self.baseline[key] = current, current_time
+                if prev is not None:
+                    value = self.calc_rate(key, prev, current)
+                    self.rings[key].append((snapshot.time, value))
+                    sampled_metrics.set(key, (snapshot.time, value))
+            self.cond.notify_all()
+
+    def run(self):
+        # 基线在 watch 时已记录, 等待一个采样间隔后再进行首次采样
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        """停止采样线程"""
+        self.stop_event.set()
+        with self.cond:
+            self.cond.notify_all()
+
+
+def start_sampler(interval=sample_interval, ring_size=sample_ring_size, keys=None):
+    """启动后台采样线程 (默认预先采样全部系统指标, 不支持的指标(如内核未开启PSI)跳过)"""
+    global sampler
+    if sampler is None or not sampler.is_alive():
+        if keys is None:
+            keys = [("cpu_percent",), ("cpu_percent_by_cores",), ("mem_rates",), ("net_rates",), ("disk_io",),
+                    ("net_speed", get_default_net_device()), ("pressure", None)]
+        sampler = MetricSampler(interval, ring_size)
+        for key in keys:
+            try:
+                sampler.watch(key)
+            except (NoSuchProcess, AccessDenied, EnvironmentError):
+                continue
+        sampler.start()
+    return sampler
+
+
+def stop_sampler():
+    """停止后台采样线程"""
+    global sampler
+    if sampler is not None:
+        sampler.stop()
+        sampler = None
+
+
+def get_sampled_metric(key, wait=0):
+    """
+    获取指标最近一次的采样结果
+    :return: (值, 距今秒数), 采样线程未运行,无法采样或等待超时时返回 None
+    """
+    current_sampler = sampler
+    if current_sampler is None or not current_sampler.is_alive():
+        return None
+    sampled = current_sampler.latest(key, wait)
+    if sampled is not None:
+        sample_age.age = sampled[1]
+    return sampled
+
+
+def calc_with_age(calc_func, *args, **kwargs):
+    """
+    调用 calc_* 函数 -> (值, 距今秒数)
+    返回采样结果时为采样结果的距今秒数, 同步计算时为0
+    例: calc_with_age(calc_cpu_percent), calc_with_age(calc_process_cpu_percent, pid)
+    """
+    sample_age.age = 0.0
+    value = calc_func(*args, **kwargs)
+    return value, sample_age.age
+
+
+def get_sampled_history(key):
+    """获取指标的历史采样 [(采样时间, 值), ...]"""
+    current_sampler = sampler
+    if current_sampler is None:
+        return []
+    return current_sampler.history(key)
+
+
+def get_sampled_snapshot():
+    """获取所有指标最近一次采样结果的一致快照 {指标: (采样时间, 值)}"""
+    return sampled_metrics.snapshot()
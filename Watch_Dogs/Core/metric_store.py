@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# encoding:utf-8
+
+"""
+进程监测核心功能实现 - 并发指标存储
+
+供多个采集线程(进程/系统/网络)同时读写的字典
+- 每个操作都是一次 dict 的C层调用(get/set/pop/setdefault/copy), 在GIL下是原子的, 读写均不需要加锁
+- snapshot 为一次 dict.copy(), 得到某一时刻一致的快照, 不阻塞写入线程
+- add/discard 提供集合语义 (值为加入时间)
+
+注意 : 原子性依赖 CPython 的GIL, 以及键为 str/int/由它们组成的tuple (哈希与比较不执行python代码, 不会中途释放GIL)
+       相比一把锁保护的字典, 省去了每次调用的加锁开销; 吞吐量受GIL限制, 不会随线程数增加
+       (见 Test/metric_store_benchmark.py)
+"""
+
+import sys
+from time import time
+
+
+class MetricStore(object):
+    """并发指标存储"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def set(self, key, value):
+        self.data[key] = value
+
+    def pop(self, key, default=None):
+        return self.data.pop(key, default)
+
+    def setdefault(self, key, value):
+        return self.data.setdefault(key, value)
+
+    def add(self, key):
+        """集合语义 - 加入键 (已存在时保留原加入时间)"""
+        self.data.setdefault(key, time())
+
+    def discard(self, key):
+        """集合语义 - 移除键"""
+        self.data.pop(key, None)
+
+    def update(self, mapping):
+        self.data.update(mapping)
+
+    def clear(self):
+        self.data.clear()
+
+    def snapshot(self):
+        """获取某一时刻一致的快照 (dict)"""
+        return self.data.copy()
+
+    def keys(self):
+        return self.snapshot().keys()
+
+    def values(self):
+        return self.snapshot().values()
+
+    def items(self):
+        return self.snapshot().items()
+
+    def sizeof(self):
+        """占用内存字节数 (不含键值引用的其他对象)"""
+        data = self.snapshot()
+        return sys.getsizeof(self) + sys.getsizeof(self.data) + sum(sys.getsizeof(value) for value in data.values())
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+
+    def __delitem__(self, key):
+        del self.data[key]
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        return iter(self.keys())
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# encoding:utf-8
+
+"""
+进程监测核心功能实现 - 进程网络监控(基于libnethogs)
+
+由 process_monitor.get_process_net_info 在首次调用时加载, 只监测进程磁盘/CPU等数据时无需导入 ctypes 及 nethogs 相关内容
+
+reference   :   https://github.com/raboof/nethogs
+"""
+
+import os
+import ctypes
+import signal
+import datetime
+import threading
+
+from prcess_exception import wrap_process_exceptions
+from process_monitor import all_process_info_dict
+from sys_monitor import get_default_net_device
+
+# Libnethogs 数据
+# 动态链接库名称
+LIBRARY_NAME = "libnethogs.so"
+# PCAP格式过滤器 eg: "port 80 or port 8080 or port 443"
+FILTER = None
+
+
+# Note : 获取进程的网络数据
+# 这里可能是整个系统最大的实现难点.
+# 实现的逻辑可以参考 https://www.jianshu.com/p/deb0ed35c1c2 中 <计算进程的网络IO数据> 这一部分
+#
+# 1. 获取进程的所有TCP链接的inode, /proc/pid/fd 目录下代表当前进程所有打开的文件描述符
+# 2. 列出系统中 TCP inode 对应的链接信息，通过命令/proc/net/tcp 可以得到当前 TCP inode 对应的链接信息列表，内容类似：
+# 3. 使用 libcap 抓包的方法，计算出每个TCP链接对应的网络流量后，
+#    然后反向通过步骤一的 pid <-> inode list 信息，最后计算出每个进程的网络流量。
+#
+# 这个完整实现的工作量基本就是一个毕设了. - -!
+#
+# 参考工具
+# nethogs : https://github.com/raboof/nethogs
+# hogwatch : https://github.com/akshayKMR/hogwatch(nethogs+python展示)
+# iftop : http://www.ex-parrot.com/~pdw/iftop/ (2017 更多的是针对链接的监控)
+# ifstat : http://gael.roualland.free.fr/ifstat/ (2004)
+#
+# Nethogs github下的
+# Nethogs监控每个进程进出机器的流量。其他工具则监控哪种类型的流量通过机器或从机器等运行。
+# 我会尝试在这里链接到这些工具。如果您了解另一个问题，请务必打开问题/公关：
+#
+# nettop显示数据包类型，按大小或数量的数据包排序。
+# ettercap是以太网的网络嗅探器/拦截器/记录器
+# darkstat通过主机，协议等来分解流量。旨在分析在较长时间内收集的流量，而不是“实时”查看。
+# iftop按服务和主机显示网络流量
+# ifstat以类似vmstat / iostat的方式通过接口显示网络流量
+# gnethogs基于GTK的GUI（正在进行中）
+# nethogs-qt基于Qt的GUI
+# hogwatch带有桌面/网络图形的带宽监视器（每个进程）。
+
+
+# #########################使用nethogs作为系统监控核心#####################
+
+# Setp - 0
+# 在nethogs的官方github页面上,提供了将nethogs编译成动态链接库供其它程序调用的方法(避免了丑陋的通过命令行方式调用)
+# 详细可参见 https://github.com/raboof/nethogs#libnethogs 这一段
+#
+# Step - 1
+# 主要步骤为:
+# apt-get install build-essential libncurses5-dev libpcap-dev
+# git clone https://github.com/raboof/nethogs.git
+# cd nethogs && make libnethogs && sudo make install_dev
+#
+# 之后根据屏幕输出的提示信息 动态链接库 libnethogs.so 已经创建在 /usr/local/lib 这个目录下了,现在就可以通过各种方式来调用它了
+#
+# Setp - 2
+# libnethogs.so 库主要函数功能说明详见 - https://github.com/raboof/nethogs/blob/master/src/libnethogs.h
+# 通过python调用的demo python-wrapper.py 可见 https://github.com/raboof/nethogs/blob/master/contrib/python-wrapper.py
+#
+
+"基于nethogs的进程网络流量监控实现"
+
+
+@wrap_process_exceptions
+def is_libnethogs_install(libnethogs_path="/usr/local/lib/libnethogs.so"):
+    """检测libnethogs环境是否安装"""
+    return os.path.exists(libnethogs_path) and os.path.isfile(libnethogs_path)
+
+
+# reference : https://github.com/raboof/nethogs/blob/master/contrib/python-wrapper.py
+
+class Action():
+    """数据动作 SET(add,update),REMOVE(removed)"""
+    SET = 1
+    REMOVE = 2
+
+    MAP = {SET: "SET", REMOVE: "REMOVE"}
+
+
+class LoopStatus():
+    """监控进程循环状态"""
+    OK = 0
+    FAILURE = 1
+    NO_DEVICE = 2
+
+    MAP = {OK: "OK", FAILURE: "FAILURE", NO_DEVICE: "NO_DEVICE"}
+
+
+# The sent/received KB/sec values are averaged over 5 seconds; see PERIOD in nethogs.h.
+# https://github.com/raboof/nethogs/blob/master/src/nethogs.h#L43
+# sent_bytes and recv_bytes are a running total
+class NethogsMonitorRecord(ctypes.Structure):
+    """nethogs进程流量监控线程 - 用于进程浏览监控的数据结构
+    ctypes version of the struct of the same name from libnethogs.h"""
+    _fields_ = (("record_id", ctypes.c_int),
+                ("name", ctypes.c_char_p),
+                ("pid", ctypes.c_int),
+                ("uid", ctypes.c_uint32),
+                ("device_name", ctypes.c_char_p),
+                ("sent_bytes", ctypes.c_uint64),
+                ("recv_bytes", ctypes.c_uint64),
+                ("sent_kbs", ctypes.c_float),
+                ("recv_kbs", ctypes.c_float),
+                )
+
+
+def signal_handler(signal, frame):
+    """nethogs进程流量监控线程 - 退出信号处理"""
+    global all_process_info_dict
+    all_process_info_dict["libnethogs"].nethogsmonitor_breakloop()
+    all_process_info_dict["libnethogs_thread"] = None
+
+
+def dev_args(devnames):
+    """
+    nethogs进程流量监控线程 - 退出信号处理
+    Return the appropriate ctypes arguments for a device name list, to pass
+    to libnethogs ``nethogsmonitor_loop_devices``. The return value is a
+    2-tuple of devc (``ctypes.c_int``) and devicenames (``ctypes.POINTER``)
+    to an array of ``ctypes.c_char``).
+
+    :param devnames: list of device names to monitor
+    :type devnames: list
+    :return: 2-tuple of devc, devicenames ctypes arguments
+    :rtype: tuple
+    """
+    devc = len(devnames)
+    devnames_type = ctypes.c_char_p * devc
+    devnames_arg = devnames_type()
+    for idx, val in enumerate(devnames):
+        devnames_arg[idx] = (val + chr(0)).encode("ascii")
+    return ctypes.c_int(devc), ctypes.cast(
+        devnames_arg, ctypes.POINTER(ctypes.c_char_p)
+    )
+
+
+def run_monitor_loop(lib, devnames):
+    """nethogs进程流量监控线程 - 主循环"""
+    global all_process_info_dict
+
+    # Create a type for my callback func. The callback func returns void (None), and accepts as
+    # params an int and a pointer to a NethogsMonitorRecord instance.
+    # The params and return type of the callback function are mandated by nethogsmonitor_loop().
+    # See libnethogs.h.
+    CALLBACK_FUNC_TYPE = ctypes.CFUNCTYPE(
+        ctypes.c_void_p, ctypes.c_int, ctypes.POINTER(NethogsMonitorRecord)
+    )
+
+    filter_arg = FILTER
+    if filter_arg is not None:
+        filter_arg = ctypes.c_char_p(filter_arg.encode("ascii"))
+
+    if len(devnames) < 1:
+        # monitor all devices
+        rc = lib.nethogsmonitor_loop(
+            CALLBACK_FUNC_TYPE(network_activity_callback),
+            filter_arg
+        )
+
+    else:
+        devc, devicenames = dev_args(devnames)
+        rc = lib.nethogsmonitor_loop_devices(
+            CALLBACK_FUNC_TYPE(network_activity_callback),
+            filter_arg,
+            devc,
+            devicenames,
+            ctypes.c_bool(False)
+        )
+
+    if rc != LoopStatus.OK:
+        print("nethogsmonitor loop returned {}".format(LoopStatus.MAP[rc]))
+    else:
+        print("exiting nethogsmonitor loop")
+
+
+def network_activity_callback(action, data):
+    """nethogs进程流量监控线程 - 回掉函数"""
+    global all_process_info_dict
+    if data.contents.pid in all_process_info_dict["watch_pid"]:
+        # 初始化一个新的进程网络监控数据,并替代原来的
+        process_net_data = {}
+        process_net_data["pid"] = data.contents.pid
+        process_net_data["uid"] = data.contents.uid
+        process_net_data["action"] = Action.MAP.get(action, "Unknown")
+        process_net_data["pid_name"] = data.contents.name
+        process_net_data["record_id"] = data.contents.record_id
+        process_net_data["time"] = datetime.datetime.now().strftime("%H:%M:%S")  # 这里获取的是本地时间
+        process_net_data["device"] = data.contents.device_name.decode("ascii")
+        process_net_data["sent_bytes"] = data.contents.sent_bytes
+        process_net_data["recv_bytes"] = data.contents.recv_bytes
+        process_net_data["sent_kbs"] = round(data.contents.sent_kbs, 2)
+        process_net_data["recv_kbs"] = round(data.contents.recv_kbs, 2)
+
+        if action == Action.REMOVE:  # 连接已关闭,不再保留流量数据
+            all_process_info_dict["libnethogs_data"].pop(str(data.contents.pid), None)
+        else:
+            all_process_info_dict["libnethogs_data"].set(str(data.contents.pid), process_net_data)
+
+
+def init_nethogs_thread():
+    """nethogs进程流量监控线程 - 初始化"""
+    global all_process_info_dict
+    # 处理退出信号
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    # 调用动态链接库
+    all_process_info_dict["libnethogs"] = ctypes.CDLL(LIBRARY_NAME)
+    # 初始化并创建监控线程
+    monitor_thread = threading.Thread(
+        target=run_monitor_loop, args=(all_process_info_dict["libnethogs"],
+                                       [get_default_net_device()],)
+    )
+    all_process_info_dict["libnethogs_thread"] = monitor_thread
+    monitor_thread.start()
+    monitor_thread.join(0.5)
+
+    return
+
+
+def get_process_net_info(pid):
+    """获取进程的网络信息(基于nethogs)"""
+    global all_process_info_dict
+
+    if not all_process_info_dict["libnethogs_thread_install"]:
+        all_process_info_dict["libnethogs_thread_install"] = is_libnethogs_install()
+        if not all_process_info_dict["libnethogs_thread_install"]:
+            print "Error : libnethogs is not installed!"
+            exit(-1)
+
+    all_process_info_dict["watch_pid"].add(int(pid))
+    if not all_process_info_dict["libnethogs_thread"]:
+        init_nethogs_thread()
+
+    return all_process_info_dict["libnethogs_data"].get(str(pid), {})
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# encoding:utf-8
+
+"""
+进程监测核心功能实现 - 资源压力监测(PSI, Pressure Stall Information)
+
+主要包括
+- 系统资源压力 /proc/pressure/{cpu,memory,io} (some/full 的 avg10/avg60/avg300 及总等待时间)
+- cgroup资源压力 <cgroup>/{cpu,memory,io}.pressure (cgroup v2)
+- 每个tick的总等待时间增量及等待时间占比
+- 压力触发器(PSI trigger) - 等待时间在时间窗口内超过阈值时由内核通知(poll), 无需轮询
+
+需要 Linux 4.20+ 且开启 CONFIG_PSI, 不支持时读取会抛出 IOError/OSError
+
+reference   :   https://www.kernel.org/doc/Documentation/accounting/psi.rst
+"""
+
+import os
+import errno
+import select
+import threading
+from time import time, sleep
+
+from proc_file_pool import read_proc_file
+
+calc_func_interval = 2
+
+# PSI 资源类型
+PRESSURE_RESOURCES = ("cpu", "memory", "io")
+
+# cgroup v2 默认挂载点 (挂载表中找不到 cgroup2 时使用)
+CGROUP2_ROOT = "/sys/fs/cgroup"
+
+# 上次计算时的快照 cgroup(系统为None) -> PressureSnapshot
+prev_pressure_snapshot = {}
+prev_pressure_snapshot_lock = threading.Lock()
+
+# 正在运行的压力触发器监听线程
+pressure_watcher = None
+
+
+def parse_pressure(pressure_data):
+    """
+    解析 PSI 文件
+        some avg10=0.00 avg60=0.00 avg300=0.00 total=0
+        full avg10=0.00 avg60=0.00 avg300=0.00 total=0
+    :return: {"some": {"avg10", "avg60", "avg300", "total"}, "full": {...}} (total单位为us, 旧内核的cpu没有full)
+    """
+    pressure = {}
+    for line in pressure_data.splitlines():
+        fields = line.split()
+        if not fields:
+            continue
+        values = {}
+        for field in fields[1:]:
+            name, _, value = field.partition("=")
+            values[name] = int(value) if name == "total" else float(value)
+        pressure[fields[0]] = values
+    return pressure
+
+
+def get_cgroup2_root():
+    """获取 cgroup v2 挂载点"""
+    from sys_monitor import mount_table
+    try:
+        for mount_point, (device, fstype, opts) in mount_table.get().items():
+            if fstype == "cgroup2":
+                return mount_point
+    except EnvironmentError:
+        pass
+    return CGROUP2_ROOT
+
+
+def get_pressure_path(resource, cgroup=None):
+    """获取 PSI 文件路径 (cgroup 可以是绝对路径, 或相对于 cgroup v2 挂载点的路径, 如 /system.slice)"""
+    if cgroup is None:
+        return "/proc/pressure/{}".format(resource)
+    if not os.path.isdir(cgroup):
+        cgroup = os.path.join(get_cgroup2_root(), cgroup.lstrip("/"))
+    return os.path.join(cgroup, "{}.pressure".format(resource))
+
+
+def get_pressure(resource, cgroup=None):
+    """获取某一资源的压力 {"some": {...}, "full": {...}}"""
+    return parse_pressure(read_proc_file(get_pressure_path(resource, cgroup)))
+
+
+def is_pressure_available(cgroup=None):
+    """系统(或cgroup)是否支持PSI"""
+    try:
+        get_pressure("cpu", cgroup)
+        return True
+    except EnvironmentError:
+        return False
+
+
+class PressureSnapshot(object):
+    """各资源PSI快照"""
+
+    __slots__ = ("time", "pressure")
+
+    def __init__(self, cgroup=None, resources=PRESSURE_RESOURCES):
+        self.time = time()
+        self.pressure = {}  # 资源 -> parse_pressure 结果
+        for resource in resources:
+            self.pressure[resource] = get_pressure(resource, cgroup)
+
+
+def calc_pressure_between(prev, current):
+    """
+    根据前后两次快照计算资源压力
+    :return: {资源: {"some"/"full": {"avg10", "avg60", "avg300", "total", "total_delta", "stall_percent"}}}
+             total_delta 为本次tick的总等待时间增量(us), stall_percent 为本次tick内的等待时间占比(%)
+    """
+    interval = current.time - prev.time
+    pressure = {}
+    for resource, current_pressure in current.pressure.items():
+        prev_pressure = prev.pressure.get(resource, {})
+        pressure[resource] = {}
+        for kind, values in current_pressure.items():
+            values = dict(values)
+            total_delta = values["total"] - prev_pressure.get(kind, {}).get("total", values["total"])
+            values["total_delta"] = total_delta
+            values["stall_percent"] = min(total_delta / 10000.0 / interval, 100.0) if interval > 0 else 0.0
+            pressure[resource][kind] = values
+    return pressure
+
+
+def calc_pressure(cgroup=None, interval=calc_func_interval):
+    """计算系统(或cgroup)的资源压力 (avg10/60/300 及每个tick的总等待时间增量)"""
+    from metric_sampler import get_sampled_metric
+    sampled = get_sampled_metric(("pressure", cgroup), wait=interval)
+    if sampled is not None:  # 后台采样线程运行中,直接返回最近一次的采样结果
+        return sampled[0]
+
+    with prev_pressure_snapshot_lock:
+        initialized = cgroup in prev_pressure_snapshot
+        if not initialized:
+            prev_pressure_snapshot[cgroup] = PressureSnapshot(cgroup)
+    if not initialized:
+        sleep(interval)
+
+    with prev_pressure_snapshot_lock:
+        current_pressure_snapshot = PressureSnapshot(cgroup)
+        pressure = calc_pressure_between(prev_pressure_snapshot[cgroup], current_pressure_snapshot)
+        prev_pressure_snapshot[cgroup] = current_pressure_snapshot
+
+    return pressure
+
+
+class PressureTrigger(object):
+    """
+    PSI 压力触发器
+    向PSI文件写入 "<some|full> <阈值us> <时间窗口us>", 窗口内等待时间超过阈值时文件描述符产生 POLLPRI 事件
+    时间窗口范围为 500ms - 10s (非特权进程需为2s的整数倍)
+    """
+
+    def __init__(self, resource, threshold, window=2000000, kind="some", cgroup=None):
+        self.resource = resource
+        self.threshold = threshold  # 阈值(us)
+        self.window = window  # 时间窗口(us)
+        self.kind = kind
+        self.cgroup = cgroup
+        self.path = get_pressure_path(resource, cgroup)
+        self.fd = os.open(self.path, os.O_RDWR | os.O_NONBLOCK)
+        try:
+            os.write(self.fd, "{} {} {}\0".format(kind, threshold, window))  # 内核会截去最后一个字符, 需以\0结尾
+        except EnvironmentError:
+            os.close(self.fd)
+            raise
+        self.triggered = 0  # 触发次数
+
+    def fileno(self):
+        return self.fd
+
+    def wait(self, timeout=None):
+        """等待触发 -> 是否触发 (timeout为秒, None为一直等待; 监测对象消失(如cgroup被删除)时抛出 OSError)"""
+        poller = select.poll()
+        poller.register(self.fd, select.POLLPRI)
+        events = poller.poll(None if timeout is None else timeout * 1000)
+        return self.check(events[0][1] if events else 0)
+
+    def check(self, event):
+        """处理poll事件 -> 是否触发"""
+        if event & select.POLLERR:
+            raise OSError(errno.ENODEV, "pressure trigger no longer valid", self.path)
+        if event & select.POLLPRI:
+            self.triggered += 1
+            return True
+        return False
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class PressureWatcher(threading.Thread):
+    """压力触发器监听线程 (一个线程监听多个触发器, 触发时调用回调函数 callback(trigger))"""
+
+    def __init__(self):
+        threading.Thread.__init__(self, name="Watch_Dogs-PressureWatcher")
+        self.daemon = True
+        self.triggers = {}  # fd -> (PressureTrigger, 回调函数)
+        self.poller = select.poll()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def add_trigger(self, trigger, callback):
+        with self.lock:
+            self.triggers[trigger.fileno()] = (trigger, callback)
+            self.poller.register(trigger.fileno(), select.POLLPRI)
+        return trigger
+
+    def remove_trigger(self, trigger):
+        with self.lock:
+            if self.triggers.pop(trigger.fileno(), None) is not None:
+                self.poller.unregister(trigger.fileno())
+        trigger.close()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            events = self.poller.poll(1000)
+            for fd, event in events:
+                with self.lock:
+                    trigger, callback = self.triggers.get(fd, (None, None))
+                if trigger is None:
+                    continue
+                try:
+                    if trigger.check(event):
+                        callback(trigger)
+                except OSError:  # 监测对象已消失
+                    self.remove_trigger(trigger)
+
+        with self.lock:
+            triggers = [trigger for trigger, callback in self.triggers.values()]
+        for trigger in triggers:
+            self.remove_trigger(trigger)
+
+    def stop(self):
+        """停止监听并关闭所有触发器"""
+        self.stop_event.set()
+
+
+def add_pressure_trigger(resource, threshold, callback, window=2000000, kind="some", cgroup=None):
+    """
+    添加压力触发器 (首次添加时启动监听线程)
+    eg : add_pressure_trigger("memory", 150000, alert) - 2秒内内存等待超过150ms时调用 alert(trigger)
+    """
+    global pressure_watcher
+    trigger = PressureTrigger(resource, threshold, window, kind, cgroup)
+    if pressure_watcher is None or not pressure_watcher.is_alive():
+        pressure_watcher = PressureWatcher()
+        pressure_watcher.start()
+    return pressure_watcher.add_trigger(trigger, callback)
+
+
+def stop_pressure_watcher():
+    """停止压力触发器监听线程"""
+    global pressure_watcher
+    if pressure_watcher is not None:
+        pressure_watcher.stop()
+        pressure_watcher = None
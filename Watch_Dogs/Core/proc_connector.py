@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# encoding:utf-8
+
+"""
+进程监测核心功能实现 - 进程事件源
+
+通过内核 proc connector (netlink) 订阅进程 fork/exec/exit 事件, 无需轮询/proc即可维护
+- 关注进程集合 all_process_info_dict["watch_pid"] (以及相应的进程数据)
+- 进程树索引 process_tree
+
+无法打开 proc connector 时(内核未开启 CONFIG_PROC_EVENTS 或缺少 CAP_NET_ADMIN 权限), 退回定时扫描/proc
+
+reference   :   https://www.kernel.org/doc/Documentation/connector/connector.txt
+reference   :   https://github.com/torvalds/linux/blob/master/include/uapi/linux/cn_proc.h
+"""
+
+import errno
+import threading
+from time import time
+
+from process_monitor import process_identity_cache, process_state_store, forget_process
+from process_manage import process_tree, process_name_index
+
+# netlink / connector 常量
+NETLINK_CONNECTOR = 11
+NLMSG_DONE = 3
+CN_IDX_PROC = 1
+CN_VAL_PROC = 1
+PROC_CN_MCAST_LISTEN = 1
+PROC_CN_MCAST_IGNORE = 2
+
+# 进程事件类型 (enum what)
+PROC_EVENT_NONE = 0x00000000
+PROC_EVENT_FORK = 0x00000001
+PROC_EVENT_EXEC = 0x00000002
+PROC_EVENT_SID = 0x00000080
+PROC_EVENT_EXIT = 0x80000000
+
+# 消息结构 (struct.Struct), 首次使用时创建 - 见 load_structs
+NLMSG_HEADER = CN_MSG_HEADER = PROC_EVENT_HEADER = PROC_EVENT_FORK_DATA = PROC_EVENT_ID_DATA = None
+
+# 正在运行的进程事件源
+proc_event_monitor = None
+
+
+def load_structs():
+    """创建消息结构 (socket/struct 推迟到首次使用时导入, 减少导入耗时)"""
+    global NLMSG_HEADER, CN_MSG_HEADER, PROC_EVENT_HEADER, PROC_EVENT_FORK_DATA, PROC_EVENT_ID_DATA
+    if NLMSG_HEADER is not None:
+        return
+    import struct
+    CN_MSG_HEADER = struct.Struct("=IIIIHH")  # cn_msg : idx, val, seq, ack, len, flags
+    PROC_EVENT_HEADER = struct.Struct("=IIQ")  # proc_event : what, cpu, timestamp_ns
+    PROC_EVENT_FORK_DATA = struct.Struct("=IIII")  # parent_pid, parent_tgid, child_pid, child_tgid
+    PROC_EVENT_ID_DATA = struct.Struct("=II")  # exec/sid/exit : process_pid, process_tgid
+    NLMSG_HEADER = struct.Struct("=IHHII")  # nlmsghdr : len, type, flags, seq, pid (最后赋值, 作为已创建的标志)
+
+
+def send_proc_connector_op(sock, op):
+    """向 proc connector 发送订阅(PROC_CN_MCAST_LISTEN)/取消订阅(PROC_CN_MCAST_IGNORE)消息"""
+    import struct
+    load_structs()
+    op_data = struct.pack("=I", op)
+    cn_msg = CN_MSG_HEADER.pack(CN_IDX_PROC, CN_VAL_PROC, 0, 0, len(op_data), 0) + op_data
+    nl_msg = NLMSG_HEADER.pack(NLMSG_HEADER.size + len(cn_msg), NLMSG_DONE, 0, 0, sock.getsockname()[0]) + cn_msg
+    sock.send(nl_msg)
+
+
+def open_proc_connector():
+    """打开并订阅 proc connector (失败时抛出 socket.error)"""
+    import socket
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_CONNECTOR)
+    try:
+        sock.bind((0, CN_IDX_PROC))
+        send_proc_connector_op(sock, PROC_CN_MCAST_LISTEN)
+    except EnvironmentError:  # 包括 socket.error
+        sock.close()
+        raise
+    return sock
+
+
+def parse_proc_events(data):
+    """
+    解析 proc connector 消息
+    :return: [(事件类型, pid, tgid, 父进程tgid(仅fork事件)), ...]
+    """
+    load_structs()
+    events = []
+    offset = 0
+    while offset + NLMSG_HEADER.size <= len(data):
+        msg_len, msg_type = NLMSG_HEADER.unpack_from(data, offset)[:2]
+        if msg_len < NLMSG_HEADER.size:
+            break
+        event_offset = offset + NLMSG_HEADER.size + CN_MSG_HEADER.size
+        if msg_type == NLMSG_DONE and event_offset + PROC_EVENT_HEADER.size <= len(data):
+            what = PROC_EVENT_HEADER.unpack_from(data, event_offset)[0]
+            data_offset = event_offset + PROC_EVENT_HEADER.size
+            if what == PROC_EVENT_FORK:
+                parent_pid, parent_tgid, child_pid, child_tgid = PROC_EVENT_FORK_DATA.unpack_from(data, data_offset)
+                events.append((what, child_pid, child_tgid, parent_tgid))
+            elif what in (PROC_EVENT_EXEC, PROC_EVENT_SID, PROC_EVENT_EXIT):
+                pid, tgid = PROC_EVENT_ID_DATA.unpack_from(data, data_offset)
+                events.append((what, pid, tgid, None))
+        offset += (msg_len + 3) & ~3  # NLMSG_ALIGN
+
+    return events
+
+
+class ProcEventMonitor(threading.Thread):
+    """进程事件源线程 (proc connector 事件驱动, 不可用时定时扫描)"""
+
+    def __init__(self, tree=process_tree, scan_interval=5):
+        threading.Thread.__init__(self, name="Watch_Dogs-ProcEventMonitor")
+        self.daemon = True
+        self.tree = tree
+        self.scan_interval = scan_interval  # 退回定时扫描时的扫描间隔(秒)
+        self.sock = None
+        self.pending_orphans = set()  # 父进程已退出,等待重新读取ppid的进程
+        self.stop_event = threading.Event()
+
+    @property
+    def event_driven(self):
+        return self.sock is not None
+
+    def start(self):
+        try:
+            self.sock = open_proc_connector()
+            self.sock.settimeout(1)
+        except EnvironmentError:  # 包括 socket.error
+            self.sock = None
+        if self.sock is not None:
+            # 先订阅再全量构建,避免遗漏构建期间的事件
+            self.tree.event_driven = True
+            self.tree.rebuild()
+        threading.Thread.start(self)
+
+    def handle_event(self, what, pid, tgid, parent_tgid):
+        """处理进程事件 (只关心进程,忽略线程)"""
+        if pid != tgid:
+            return
+        if what == PROC_EVENT_FORK:
+            parent = self.tree.processes.get(parent_tgid)
+            if parent is not None:  # 进程组与会话继承自父进程
+                self.tree.add(pid, parent_tgid, parent[1], parent[2], None)
+            else:
+                self.tree.update(pid)
+        elif what == PROC_EVENT_EXEC:  # exec 后 cmdline/exe 已改变,但pid与starttime不变
+            process_identity_cache.invalidate(pid)
+            process_name_index.invalidate(pid)
+        elif what == PROC_EVENT_SID:
+            self.tree.update(pid)
+        elif what == PROC_EVENT_EXIT:
+            self.pending_orphans.update(self.tree.remove(pid))
+            self.pending_orphans.discard(pid)
+            process_identity_cache.invalidate(pid)
+            forget_process(pid)
+
+    def forget_exited(self):
+        """清理不在进程树中(已退出)的关注进程的数据"""
+        with self.tree.lock:
+            alive_pids = list(self.tree.processes)
+        process_state_store.prune(alive_pids)
+
+    def run_events(self):
+        """事件驱动主循环"""
+        import socket
+        while not self.stop_event.is_set():
+            try:
+                data = self.sock.recv(65536)
+            except socket.timeout:
+                data = ""
+            except socket.error as e:
+                if e.errno == errno.ENOBUFS:  # 接收缓冲区溢出,事件已丢失
+                    self.tree.rebuild()
+                    self.forget_exited()  # 丢失的退出事件
+                    continue
+                raise
+
+            # 孤儿进程在父进程退出事件之后才会被重新指定父进程
+            orphans, self.pending_orphans = self.pending_orphans, set()
+            for pid in orphans:
+                self.tree.update(pid)
+            for event in parse_proc_events(data):
+                self.handle_event(*event)
+
+            # setpgid 没有对应的事件,定期全量重建
+            if time() - self.tree.last_full_refresh >= self.tree.full_refresh_interval:
+                self.tree.rebuild()
+
+    def run_scan(self):
+        """定时扫描主循环"""
+        while not self.stop_event.is_set():
+            self.tree.refresh()
+            self.forget_exited()
+            self.stop_event.wait(self.scan_interval)
+
+    def run(self):
+        try:
+            if self.event_driven:
+                try:
+                    self.run_events()
+                except EnvironmentError:  # 事件源异常(包括 socket.error),退回定时扫描
+                    self.close()
+            self.run_scan()
+        finally:
+            self.close()
+
+    def close(self):
+        if self.sock is not None:
+            self.tree.event_driven = False
+            try:
+                send_proc_connector_op(self.sock, PROC_CN_MCAST_IGNORE)
+            except EnvironmentError:
+                pass
+            self.sock.close()
+            self.sock = None
+
+    def stop(self):
+        """停止进程事件源"""
+        self.stop_event.set()
+
+
+def start_proc_event_monitor(tree=process_tree, scan_interval=5):
+    """启动进程事件源"""
+    global proc_event_monitor
+    if proc_event_monitor is None or not proc_event_monitor.is_alive():
+        proc_event_monitor = ProcEventMonitor(tree, scan_interval)
+        proc_event_monitor.start()
+    return proc_event_monitor
+
+
+def stop_proc_event_monitor():
+    """停止进程事件源"""
+    global proc_event_monitor
+    if proc_event_monitor is not None:
+        proc_event_monitor.stop()
+        proc_event_monitor = None
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# encoding:utf-8
+
+"""
+进程监测核心功能实现 - /proc 文件句柄池
+
+高频采样时, 每次 open/read/close /proc 文件的系统调用与路径查找开销占了大部分时间.
+句柄池保持文件描述符常开, 每次通过 pread(offset=0) 重新读取到线程私有的可复用缓冲区中
+- 锁只保护句柄池的查找与插入, pread 在锁外进行, 多个线程可以同时读取
+- 进程退出后其文件描述符读取返回 ESRCH, 此时关闭并移出句柄池, 重新打开一次(pid可能已被复用)
+- 打开的文件描述符数量有上限(默认根据 RLIMIT_NOFILE 计算), 超过上限时关闭最久未使用的文件描述符
+  (正在被其他线程读取的文件描述符由最后一个读取者关闭)
+- 文件按所在文件夹(/proc/[pid])索引, 进程退出时关闭其全部文件为O(该进程的文件数), 而不是遍历整个句柄池
+
+注意 : 句柄池适合反复采样的少量文件(系统文件,关注进程的文件),
+       一次性遍历所有进程(scan_processes, 进程树/进程名称索引的构建)不应使用
+
+reference   :   http://man7.org/linux/man-pages/man2/pread.2.html
+                http://man7.org/linux/man-pages/man2/getrlimit.2.html
+"""
+
+import os
+import errno
+import threading
+from collections import OrderedDict
+
+# 打开的文件描述符上限 (None: 根据 RLIMIT_NOFILE 计算)
+PROC_FILE_POOL_SIZE = None
+# 根据 RLIMIT_NOFILE 计算上限时, 句柄池最多占用的比例(其余留给套接字等其他文件)以及上下限
+PROC_FILE_POOL_NOFILE_RATIO = 0.5
+PROC_FILE_POOL_MIN_SIZE = 16
+PROC_FILE_POOL_MAX_SIZE = 65536
+# 读取缓冲区初始大小(字节), 文件超过缓冲区大小时自动扩大
+PROC_FILE_BUFFER_SIZE = 8192
+
+O_CLOEXEC = getattr(os, "O_CLOEXEC", 0o2000000)
+
+# (ctypes模块, libc pread) - 首次读取时才加载, 避免导入本模块时加载 ctypes
+libc = None
+
+
+def load_libc():
+    """加载 libc pread (python2 的 os 模块没有 pread, 通过 libc 调用, 不可用时为 None 并退回 lseek + read)"""
+    global libc
+    if libc is None:
+        import ctypes
+        try:
+            libc_pread = ctypes.CDLL(None, use_errno=True).pread
+            libc_pread.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t, ctypes.c_long]
+            libc_pread.restype = ctypes.c_ssize_t
+        except (OSError, AttributeError):
+            libc_pread = None
+        libc = ctypes, libc_pread
+    return libc
+
+
+def default_max_open():
+    """根据进程文件描述符限制(RLIMIT_NOFILE 软限制)计算句柄池上限"""
+    import resource
+    soft_limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    if soft_limit == resource.RLIM_INFINITY or soft_limit <= 0:
+        return PROC_FILE_POOL_MAX_SIZE
+    return max(PROC_FILE_POOL_MIN_SIZE, min(int(soft_limit * PROC_FILE_POOL_NOFILE_RATIO), PROC_FILE_POOL_MAX_SIZE))
+
+
+class PooledFd(object):
+    """句柄池中的文件描述符 (users: 正在读取的线程数, evicted: 已移出句柄池, 由最后一个读取者关闭)"""
+
+    __slots__ = ("fd", "users", "evicted")
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.users = 0
+        self.evicted = False
+
+
+class ProcFilePool(object):
+    """/proc 文件句柄池"""
+
+    def __init__(self, max_open=PROC_FILE_POOL_SIZE, buffer_size=PROC_FILE_BUFFER_SIZE):
+        self.max_open = max_open if max_open is not None else default_max_open()
+        self.fds = OrderedDict()  # 路径 -> PooledFd, 按最近使用排序
+        self.dirs = {}  # 所在文件夹(如 /proc/[pid]) -> set(路径)
+        self.buffer_size = buffer_size  # 新线程的缓冲区大小 (随读取到的最大文件扩大)
+        self.local = threading.local()  # 线程私有的读取缓冲区, 首次读取时创建
+        self.lock = threading.Lock()
+        self.seek_lock = threading.Lock()  # 没有 pread 时 lseek + read 需要串行
+        self.opens = 0
+        self.reads = 0
+
+    def set_max_open(self, max_open=None):
+        """修改文件描述符上限 (None: 根据当前 RLIMIT_NOFILE 重新计算)"""
+        with self.lock:
+            self.max_open = max_open if max_open is not None else default_max_open()
+            self.evict()
+
+    def acquire(self, path):
+        """从句柄池取出文件描述符 (不在句柄池中时打开并放入), 读取完成后需调用 release"""
+        with self.lock:
+            self.reads += 1
+            entry = self.fds.pop(path, None)
+            if entry is not None:
+                self.fds[path] = entry
+                entry.users += 1
+                return entry
+
+        fd = os.open(path, os.O_RDONLY | O_CLOEXEC)
+        with self.lock:
+            self.opens += 1
+            entry = self.fds.pop(path, None)
+            if entry is not None:  # 其他线程已同时打开
+                os.close(fd)
+            else:
+                entry = PooledFd(fd)
+                self.dirs.setdefault(path.rpartition("/")[0], set()).add(path)
+            self.fds[path] = entry
+            entry.users += 1
+            self.evict()
+            return entry
+
+    def release(self, entry):
+        """读取完成, 已移出句柄池的文件描述符由最后一个读取者关闭"""
+        with self.lock:
+            entry.users -= 1
+            if entry.evicted and entry.users == 0:
+                os.close(entry.fd)
+
+    def drop(self, entry):
+        """将已从句柄池移出的文件描述符标记为待关闭, 没有读取者时立即关闭 (需持有锁)"""
+        entry.evicted = True
+        if entry.users == 0:
+            os.close(entry.fd)
+
+    def evict(self):
+        """关闭超过上限的最久未使用的文件描述符 (需持有锁)"""
+        while len(self.fds) > self.max_open:
+            self.close_fd(next(iter(self.fds)))
+
+    def pread(self, fd):
+        """从偏移0读取整个文件 (不需持有锁)"""
+        ctypes, libc_pread = libc or load_libc()
+        if libc_pread is None:
+            with self.seek_lock:
+                os.lseek(fd, 0, os.SEEK_SET)
+                chunks = []
+                while True:
+                    chunk = os.read(fd, self.buffer_size)
+                    if not chunk:
+                        return "".join(chunks)
+                    chunks.append(chunk)
+
+        buffer = getattr(self.local, "buffer", None)
+        if buffer is None:
+            buffer = self.local.buffer = ctypes.create_string_buffer(self.buffer_size)
+        while True:
+            size = libc_pread(fd, buffer, len(buffer), 0)
+            if size < 0:
+                err = ctypes.get_errno()
+                raise OSError(err, os.strerror(err))
+            if size < len(buffer):
+                return ctypes.string_at(buffer, size)
+            # 缓冲区已满,文件可能尚未读完 - 扩大缓冲区重新读取
+            buffer = self.local.buffer = ctypes.create_string_buffer(len(buffer) * 2)
+            self.buffer_size = max(self.buffer_size, len(buffer))
+
+    def read_once(self, path):
+        """通过句柄池读取一次 (读取失败时将文件描述符移出句柄池)"""
+        entry = self.acquire(path)
+        try:
+            return self.pread(entry.fd)
+        except OSError:
+            with self.lock:
+                if self.fds.get(path) is entry:
+                    self.close_fd(path)
+            raise
+        finally:
+            self.release(entry)
+
+    def read(self, path):
+        """读取文件全部内容 (失败时抛出 OSError, 由调用方转换为进程异常)"""
+        try:
+            return self.read_once(path)
+        except OSError as err:
+            if err.errno != errno.ESRCH:
+                raise
+        # 文件描述符对应的进程已退出 - pid可能已被新进程复用,重新打开一次
+        return self.read_once(path)
+
+    def close_fd(self, path):
+        """将文件描述符移出句柄池并关闭 (需持有锁)"""
+        entry = self.fds.pop(path, None)
+        if entry is not None:
+            dir_path = path.rpartition("/")[0]
+            paths = self.dirs[dir_path]
+            paths.discard(path)
+            if not paths:
+                del self.dirs[dir_path]
+            self.drop(entry)
+
+    def discard(self, path):
+        """关闭文件"""
+        with self.lock:
+            self.close_fd(path)
+
+    def has_pid(self, pid, proc_path="/proc"):
+        """句柄池中是否有某一进程的文件"""
+        return "{}/{}".format(proc_path, pid) in self.dirs
+
+    def discard_pid(self, pid, proc_path="/proc"):
+        """关闭某一进程的全部文件 (/proc/[pid]/ 下的文件)"""
+        with self.lock:
+            for path in list(self.dirs.get("{}/{}".format(proc_path, pid), ())):
+                self.close_fd(path)
+
+    def clear(self):
+        """关闭全部文件"""
+        with self.lock:
+            for path in list(self.fds):
+                self.close_fd(path)
+
+    def stats(self):
+        """句柄池统计 (打开的文件数, 累计打开次数, 累计读取次数, 缓冲区大小)"""
+        with self.lock:
+            return {"open": len(self.fds), "max_open": self.max_open, "opens": self.opens,
+                    "reads": self.reads, "buffer_size": self.buffer_size}
+
+
+# 默认句柄池
+proc_file_pool = ProcFilePool()
+
+
+def read_proc_file(path):
+    """通过默认句柄池读取 /proc 文件"""
+    return proc_file_pool.read(path)
@@ -7,53 +7,91 @@
 主要包括
 - 获取所有进程名
 - 按进程名称搜索进程
+- 多关键词/正则批量搜索进程(基于增量维护的进程名称索引)
 - 关闭进程
 - 关闭进程(连同相关进程)
 - 获取同组进程
-- 获取所有子进程
+- 获取所有子进程(包括递归获取所有后代进程)
+- 进程树索引(父子进程,进程组,会话)
 - 获取进程执行文件地址
 - 后台创建一个新的进程(不随主进程退出,返回创建的进程号)
 - 重启进程
 """
 
-from process_monitor import get_all_pid, get_process_info
+from process_monitor import get_all_pid, get_process_info, get_process_identity, scan_processes, \
+    read_process_stat, process_identity_cache
 from prcess_exception import wrap_process_exceptions, NoSuchProcess, ZombieProcess, AccessDenied
 
 import os
+import re
 import signal
-import subprocess
+import threading
+from time import time
+from collections import defaultdict
 
 
 def get_all_pid_name(name_type="cmdline"):
     """获取所有进程名"""
     res = {}
     # 按照命令ps -ef的逻辑,以 cmdline 作为进程名称,当然也可以选择 comm 作为备选
-    for pid in get_all_pid():
-        process_info = get_process_info(pid)
-        process_name = process_info[name_type] if get_process_info(pid)[name_type].strip() else process_info['comm']
-        res[pid] = process_name
+    # cmdline 从进程身份信息缓存中获取,每个进程只需读取一次stat
+    table = scan_processes(("stat",))
+    for record in table:
+        comm, cmdline, exe = process_identity_cache.get(record.pid, record.starttime, record.comm)
+        process_name = cmdline if name_type == "cmdline" else comm
+        res[str(record.pid)] = process_name if process_name else comm
+    process_identity_cache.prune(record.pid for record in table)
 
     return res
 
 
 def search_pid_by_keyword(keyword, search_type='contain'):
-    """按进程名搜索进程号 (搜索类型 contain-包含关键词,match-完全匹配)"""
-    res = []
-    for pid, process_name in get_all_pid_name().items():
-        if search_type == 'contain':
-            if keyword in process_name:
-                res.append((pid, process_name))
-        elif search_type == 'match':
-            if keyword == process_name:
-                res.append((pid, process_name))
-
-    return res
+    """按进程名搜索进程号 (搜索类型 contain-包含关键词,match-完全匹配,regex-正则)"""
+    pattern = (keyword, search_type)
+    return [(str(pid), process_name) for pid, process_name in search_processes([pattern])[pattern]]
 
 
-def kill_process(pid):
-    """关闭进程"""
+def search_processes(patterns):
+    """
+    批量搜索进程 - 所有关键词在一次遍历进程名称索引中完成匹配
+    :param patterns: 关键词列表, 每一项为
+                     - 字符串 keyword (以进程名称包含关键词的方式搜索)
+                     - 元组 (keyword, search_type) 或 (keyword, search_type, field)
+                       search_type : contain-包含关键词, match-完全匹配, regex-正则(re.search)
+                       field : name-进程名称(ps -ef的逻辑,cmdline为空时使用comm), cmdline, comm, exe
+    :return: {pattern: [(pid, 进程名称), ...]}
+    """
+    fields = {"name": 0, "cmdline": 1, "comm": 2, "exe": 3}
+    matchers = []
+    for pattern in patterns:
+        if isinstance(pattern, basestring):
+            pattern_spec = (pattern,)
+        else:
+            pattern_spec = tuple(pattern)
+        keyword, search_type, field = pattern_spec + ("contain", "name")[len(pattern_spec) - 1:]
+        if search_type == "contain":
+            match = lambda text, k=keyword: k in text
+        elif search_type == "match":
+            match = keyword.__eq__
+        elif search_type == "regex":
+            match = re.compile(keyword).search
+        else:
+            raise ValueError("unknown search type : {}".format(search_type))
+        matchers.append((pattern, fields[field], match))
+
+    result = dict((pattern, []) for pattern in patterns)
+    for pid, names in process_name_index.refresh().items():
+        for pattern, field, match in matchers:
+            if match(names[field]):
+                result[pattern].append((pid, names[0]))
+
+    return result
+
+
+def kill_process(pid, pooled=True):
+    """关闭进程 (pooled=False: 读取进程状态时不占用句柄池, 用于即将关闭的进程)"""
     try:
-        if get_process_info(pid)['state'] == 'Z':  # zombie process
+        if read_process_stat(pid, pooled=pooled).state == 'Z':  # zombie process
             raise ZombieProcess(pid)
         os.kill(int(pid), signal.SIGKILL)
     except OSError as e:
@@ -64,24 +102,35 @@ def kill_process(pid):
 
 
 def kill_all_process(pid, kill_child=True, kill_process_gourp=True):
-    """关闭进程 (pid所指进程, 该进程的子进程, 该进程的同组进程)"""
-    # 获取需要关闭的进程
+    """关闭进程 (pid所指进程, 该进程的所有后代进程, 该进程的同组进程)"""
+    # 获取需要关闭的进程 (全量重建一次进程树 - 增量刷新不检查pid复用, 也无法发现重新指定父进程与setpgid)
+    pid = int(pid)
     self_pid = os.getpid()
+    process_tree.rebuild()
     need_killed_process = [pid]
     if kill_child:
-        need_killed_process.extend(get_all_child_process(pid))
-    if kill_process_gourp and get_process_group_id(pid) != get_process_group_id(self_pid):
-        need_killed_process.extend(get_same_group_process(get_process_group_id(pid)))
+        need_killed_process.extend(process_tree.get_descendants(pid))
+    pgrp = process_tree.get_group_id(pid)
+    if kill_process_gourp and pgrp is not None and pgrp != process_tree.get_group_id(self_pid):
+        need_killed_process.extend(process_tree.get_group_members(pgrp))
     need_killed_process = sorted(list(set(need_killed_process)), reverse=True)
     # 去掉监控进程本身 (因为启动进程会将启动的进程变成监控进程的子进程,这地方逻辑不是很清晰 todo:更好的进程关闭方式? )
     if self_pid in need_killed_process:
         need_killed_process.remove(self_pid)
-    # 逐一关闭
-    try:
-        for p in need_killed_process:
-            kill_process(p)
-    except NoSuchProcess as e:
-        pass
+    with process_tree.lock:
+        expected = dict((p, process_tree.processes.get(p)) for p in need_killed_process)
+    # 逐一关闭 (关闭前重新读取 ppid,pgrp,starttime, 与进程树中不一致(pid已被复用,已更换父进程或进程组)的进程跳过)
+    for p in need_killed_process:
+        if expected[p] is None:
+            continue
+        ppid, pgrp, session, starttime = expected[p]
+        try:
+            p_stat = read_process_stat(p, pooled=False)
+            if (p_stat.ppid, p_stat.pgrp, p_stat.starttime) != (ppid, pgrp, starttime):
+                continue
+            kill_process(p, pooled=False)
+        except (NoSuchProcess, ZombieProcess):  # 已退出
+            continue
 
     return True
 
@@ -96,27 +145,209 @@ def get_process_group_id(pid):
     return get_process_info(pid)['pgrp']
 
 
-def get_same_group_process(pid):
-    """获取同组进程"""
-    result = []
-    pgrp = get_process_group_id(pid)
-
-    for p in get_all_pid():
-        if pgrp == get_process_group_id(p):
-            result.append(p)
+def get_same_group_process(pid, refresh=True):
+    """获取同组进程 -> [pid(str), ...]"""
+    if refresh:
+        process_tree.refresh()
+    pgrp = process_tree.get_group_id(pid)
+    if pgrp is None:  # 进程树中尚未记录
+        pgrp = get_process_group_id(pid)
     # 一般最小的pid为组id和整个进程的父pid
-    return sorted(result, reverse=False)
+    return [str(p) for p in process_tree.get_group_members(pgrp)]
 
 
-def get_all_child_process(pid):
-    """获取所有子进程"""
-    result = []
+def get_all_child_process(pid, recursive=False, refresh=True):
+    """获取所有子进程 (recursive=True 时获取所有后代进程) -> [pid(str), ...]"""
+    if refresh:
+        process_tree.refresh()
+    if recursive:
+        return [str(p) for p in process_tree.get_descendants(pid)]
+    return [str(p) for p in process_tree.get_children(pid)]
 
-    for p in get_all_pid():
-        if pid == get_process_parent_pid(p):
-            result.append(p)
 
-    return sorted(result, reverse=False)
+class ProcessTree(object):
+    """
+    进程树索引 - 由一次进程表扫描构建, 之后增量刷新
+    - ppid -> 子进程
+    - pgrp -> 同组进程
+    - session -> 同会话进程
+    进程事件源(proc_connector)运行时由事件驱动更新, refresh() 不再扫描/proc
+    """
+
+    def __init__(self, proc_path="/proc", full_refresh_interval=60):
+        self.proc_path = proc_path
+        self.full_refresh_interval = full_refresh_interval  # 全量重建间隔(秒),用于修正增量刷新无法发现的变化
+        self.last_full_refresh = 0
+        self.event_driven = False  # 是否由进程事件源维护
+        self.lock = threading.RLock()
+        self.processes = {}  # pid -> (ppid, pgrp, session, starttime)
+        self.children = defaultdict(set)
+        self.groups = defaultdict(set)
+        self.sessions = defaultdict(set)
+
+    def add(self, pid, ppid, pgrp, session, starttime):
+        """添加(或更新)进程"""
+        with self.lock:
+            if pid in self.processes:
+                self.remove(pid)
+            self.processes[pid] = (ppid, pgrp, session, starttime)
+            self.children[ppid].add(pid)
+            self.groups[pgrp].add(pid)
+            self.sessions[session].add(pid)
+
+    def remove(self, pid):
+        """移除进程 (返回该进程的子进程,它们将被重新指定父进程)"""
+        with self.lock:
+            if pid not in self.processes:
+                return set()
+            ppid, pgrp, session, starttime = self.processes.pop(pid)
+            for key, index in ((ppid, self.children), (pgrp, self.groups), (session, self.sessions)):
+                index[key].discard(pid)
+                if not index[key]:
+                    del index[key]
+            return set(self.children.get(pid, ()))
+
+    def update(self, pid):
+        """重新读取进程信息 (进程已退出时移除)"""
+        stat = self.read_stat(pid)
+        if stat is None:
+            self.remove(pid)
+        else:
+            self.add(pid, *stat)
+
+    def read_stat(self, pid):
+        """读取进程 ppid, pgrp, session, starttime (进程已退出时返回None)"""
+        try:
+            p_stat = read_process_stat(pid, self.proc_path, pooled=False)
+        except (NoSuchProcess, AccessDenied):
+            return None
+        return p_stat.ppid, p_stat.pgrp, p_stat.session, p_stat.starttime
+
+    def rebuild(self):
+        """全量重建"""
+        table = scan_processes(("stat",), self.proc_path)
+        with self.lock:
+            self.processes = {}
+            self.children = defaultdict(set)
+            self.groups = defaultdict(set)
+            self.sessions = defaultdict(set)
+            for record in table:
+                self.add(record.pid, record.ppid, record.pgrp, record.session, record.starttime)
+            self.last_full_refresh = time()
+
+    def refresh(self):
+        """增量刷新 - 只列出/proc目录, 只读取新进程以及被重新指定父进程的进程"""
+        if self.event_driven:
+            return
+        if time() - self.last_full_refresh >= self.full_refresh_interval:
+            self.rebuild()
+            return
+
+        current_pids = set(int(pid) for pid in get_all_pid(self.proc_path))
+        with self.lock:
+            known_pids = set(self.processes)
+            need_read = current_pids - known_pids
+            for pid in known_pids - current_pids:
+                need_read.update(self.remove(pid))  # 孤儿进程的ppid已变化
+            for pid in need_read & current_pids:
+                self.update(pid)
+
+    def get_parent(self, pid):
+        process = self.processes.get(int(pid))
+        return process[0] if process else None
+
+    def get_group_id(self, pid):
+        process = self.processes.get(int(pid))
+        return process[1] if process else None
+
+    def get_children(self, pid):
+        """获取子进程"""
+        with self.lock:
+            return sorted(self.children.get(int(pid), ()))
+
+    def get_descendants(self, pid):
+        """获取所有后代进程"""
+        result = set()
+        stack = [int(pid)]
+        with self.lock:
+            while stack:
+                for child in self.children.get(stack.pop(), ()):
+                    if child not in result:
+                        result.add(child)
+                        stack.append(child)
+        return sorted(result)
+
+    def get_group_members(self, pgrp):
+        """获取进程组内所有进程"""
+        with self.lock:
+            return sorted(self.groups.get(int(pgrp), ()))
+
+    def get_session_members(self, session):
+        """获取会话内所有进程"""
+        with self.lock:
+            return sorted(self.sessions.get(int(session), ()))
+
+
+# 默认进程树 (首次刷新时构建)
+process_tree = ProcessTree()
+
+
+class ProcessNameIndex(object):
+    """
+    进程名称索引 - 随进程树增量维护, 只为新出现(或pid被复用/执行了exec)的进程读取身份信息
+    以索引自身保存的 (starttime, comm) 判断是否需要重新读取, 不依赖身份信息缓存是否被淘汰
+    exec 后 pid 与 starttime 不变: 事件驱动时由 EXEC 事件通知(invalidate), 否则每次刷新读取 stat 比较 comm
+    """
+
+    def __init__(self, tree=process_tree):
+        self.tree = tree
+        self.entries = {}  # pid -> (starttime, (进程名称, cmdline, comm, exe))
+        self.invalidated = set()  # 执行了exec的进程
+
+    def invalidate(self, pid):
+        """进程执行了exec, 下次刷新时重新读取身份信息"""
+        self.invalidated.add(int(pid))
+
+    def is_current(self, pid, starttime, entry):
+        """索引中的身份信息是否仍有效"""
+        if entry is None or (starttime is not None and entry[0] != starttime):
+            return False
+        if self.tree.event_driven:
+            return True
+        try:
+            return read_process_stat(pid, pooled=False).comm == entry[1][2]
+        except (NoSuchProcess, AccessDenied):
+            return False
+
+    def refresh(self):
+        """刷新索引 -> {pid: (进程名称, cmdline, comm, exe)}"""
+        self.tree.refresh()
+        with self.tree.lock:
+            processes = dict(self.tree.processes)
+
+        entries = self.entries
+        invalidated, self.invalidated = self.invalidated, set()
+        for pid in [pid for pid in entries if pid not in processes]:
+            del entries[pid]
+        for pid, (ppid, pgrp, session, starttime) in processes.items():
+            if pid not in invalidated and self.is_current(pid, starttime, entries.get(pid)):
+                continue
+            if pid in invalidated:
+                process_identity_cache.invalidate(pid)
+            try:
+                identity = get_process_identity(pid, pooled=False)
+            except (NoSuchProcess, AccessDenied):
+                entries.pop(pid, None)
+                continue
+            name = identity["cmdline"] if identity["cmdline"] else identity["comm"]
+            entries[pid] = (identity["starttime"], (name, identity["cmdline"], identity["comm"], identity["exe"]))
+        process_identity_cache.prune(processes)
+
+        return dict((pid, entry[1]) for pid, entry in entries.items())
+
+
+# 默认进程名称索引
+process_name_index = ProcessNameIndex()
 
 
 @wrap_process_exceptions
@@ -156,6 +387,7 @@ def start_process(execute_file_full_path):
     execute_file = execute_file_full_path[execute_file_full_path.rindex("/") + 1:]
     # 启动进程
     if execute_file.endswith('.py'):  # python
+        import subprocess  # 仅启动进程时需要,避免导入本模块时加载
         p = subprocess.Popen(["nohup", "python", execute_file_full_path],
                              cwd=cwd,
                              close_fds=True,
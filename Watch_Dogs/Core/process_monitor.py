@@ -6,12 +6,21 @@
 
 主要包括
 - 获取所有进程号
+- 一次遍历获取进程表
 - 获取进程基本信息
+- 获取进程身份信息(comm,cmdline,exe - 带缓存)
 - 获取进程CPU占用率
-- 获取路径文件夹总大小
+- 关注进程状态数据存储(自动清理已退出/pid复用的进程)
+- 批量计算多个进程的CPU占用率,磁盘IO速度及内存
+- 批量计算多个进程中CPU占用率最高的线程
+- 获取路径文件夹总大小(硬链接去重, 并行遍历, 按文件夹mtime增量更新, 可基于inotify实时维护)
 - 获取路径可用大小
 - 获取进程占用内存大小
+- 批量获取多个进程的RSS,PSS,USS,共享内存及swap(smaps_rollup, 带缓存)
 - 获取进程磁盘占用(需要root权限)
+- 批量计算多个进程IO全部字段(rchar,wchar,syscr,syscw,read_bytes,write_bytes,cancelled_write_bytes)的速率
+- 批量计算多个进程的等待指标(块设备IO等待,运行队列等待,缺页,上下文切换)
+- 批量获取多个进程的CPU时间,IO及延迟统计(基于taskstats netlink, 不可用时退回/proc)
 - 获取进程网络监控(基于libnethogs,需要读写net文件权限)
 - 判断日志文件是否存在
 - 获取日志文件前n行
@@ -25,67 +34,198 @@ reference   :   https://github.com/raboof/nethogs
 """
 
 import os
-import ctypes
-import signal
-import datetime
+import sys
+import errno
+import heapq
 import threading
-from copy import deepcopy
+from collections import namedtuple, OrderedDict
 from time import time, sleep, localtime, strftime
 
-from prcess_exception import wrap_process_exceptions
-from sys_monitor import get_total_cpu_time, get_default_net_device
+# scandir (python3.5+ 内置, python2 需要安装 scandir 模块, 都没有时退回 os.listdir)
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+from prcess_exception import wrap_process_exceptions, NoSuchProcess, AccessDenied
+from metric_store import MetricStore
+from proc_file_pool import proc_file_pool, read_proc_file
+from sys_monitor import get_total_cpu_time, read_proc_stat, PAGE_SIZE
 
 calc_func_interval = 2
 
 # 用于存放所有进程信息相关的数据结构
 all_process_info_dict = {}
-all_process_info_dict["watch_pid"] = set()  # 关注的进程pid
-all_process_info_dict["process_info"] = {}  # 关注进程的相关信息
-all_process_info_dict["prev_cpu_total_time"] = 0  # 上次记录的总CPU时间片
+all_process_info_dict["watch_pid"] = MetricStore()  # 关注的进程pid (集合语义, 多线程读写)
+all_process_info_dict["process_info"] = None  # 关注进程的相关信息 (ProcessStateStore, 见下方定义)
 # nethogs相关
 all_process_info_dict["libnethogs_thread"] = None  # nethogs进程流量监控线程
 all_process_info_dict["libnethogs_thread_install"] = False  # libnethogs是否安装成功
 all_process_info_dict["libnethogs"] = None  # nethogs动态链接库对象
-all_process_info_dict["libnethogs_data"] = {}  # nethogs监测进程流量数据
-
-# 标准进程相关信息数据结构
-process_info_dict = {}
-process_info_dict["pre_time"] = 0  # 时间片(用于计算各种占用率 - 注意,这里是整个进程公用的)
-process_info_dict["prev_cpu_time"] = None
-process_info_dict["prev_io"] = None
+all_process_info_dict["libnethogs_data"] = MetricStore()  # nethogs监测进程流量数据 (nethogs线程写入)
 
 # 系统内核数据
-MEM_PAGE_SIZE = 4  # KB
+MEM_PAGE_SIZE = PAGE_SIZE // 1024  # KB (x86一般为4KB, 部分ARM/PowerPC内核为64KB)
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")  # 进程时间片单位 (每秒tick数)
+
+# 进程内存(smaps_rollup)缓存有效期(秒)
+PROCESS_MEM_REFRESH_INTERVAL = 10
 
-# Libnethogs 数据
-# 动态链接库名称
-LIBRARY_NAME = "libnethogs.so"
-# PCAP格式过滤器 eg: "port 80 or port 8080 or port 443"
-FILTER = None
+# 进程身份信息缓存上限(进程数)
+PROCESS_IDENTITY_CACHE_SIZE = 8192
+
+# 关注进程状态数据上限(进程数)与清理已退出进程的间隔(秒)
+PROCESS_STATE_LIMIT = 4096
+PROCESS_STATE_PRUNE_INTERVAL = 30
 
 
 @wrap_process_exceptions
-def get_all_pid():
+def get_all_pid(proc_path="/proc"):
     """获取所有进程号"""
+    if scandir is not None:
+        return [entry.name for entry in scandir(proc_path) if entry.name.isdigit()]
+    return [name for name in os.listdir(proc_path) if name.isdigit()]
+
+
+# /proc/[pid]/stat 字段名 (第1-52个字段, 详见 get_process_cpu_time)
+PROCESS_STAT_FIELDS = ("pid", "comm", "state", "ppid", "pgrp", "session", "tty_nr", "tpgid", "flags",
+                       "minflt", "cminflt", "majflt", "cmajflt", "utime", "stime", "cutime", "cstime",
+                       "priority", "nice", "num_threads", "itrealvalue", "starttime", "vsize", "rss", "rsslim",
+                       "startcode", "endcode", "startstack", "kstkesp", "kstkeip", "signal", "blocked",
+                       "sigignore", "sigcatch", "wchan", "nswap", "cnswap", "exit_signal", "processor",
+                       "rt_priority", "policy", "delayacct_blkio_ticks", "guest_time", "cguest_time",
+                       "start_data", "end_data", "start_brk", "arg_start", "arg_end", "env_start", "env_end",
+                       "exit_code")
+
+
+class ProcessStat(object):
+    """
+    /proc/[pid]/stat 记录
+    comm 中可能含有空格或括号, 以最后一个')'为界划分; comm之后的字段在首次访问时才拆分,
+    每个字段在访问时才转换为整数 (字段名见 PROCESS_STAT_FIELDS, 旧内核中不存在的字段为None)
+    """
+
+    __slots__ = ("data", "comm_end", "fields")
+
+    def __init__(self, data):
+        self.data = data
+        self.comm_end = data.rfind(")")
+        if self.comm_end < 0:
+            raise ValueError("invalid /proc/[pid]/stat data : {!r}".format(data[:64]))
+        self.fields = None
+
+    def split_fields(self):
+        """拆分comm之后的字段 (只拆分一次)"""
+        fields = self.fields
+        if fields is None:
+            fields = self.fields = self.data[self.comm_end + 2:].split()
+        return fields
+
+    def field(self, number):
+        """获取第number个字段的原始字符串 (从1开始, 与 proc(5) 一致, 仅适用于comm之后的字段)"""
+        fields = self.fields or self.split_fields()
+        if number - 3 < len(fields):
+            return fields[number - 3]
+        return None
+
+    @property
+    def pid(self):
+        return int(self.data[:self.data.find("(")])
+
+    @property
+    def comm(self):
+        return self.data[self.data.find("(") + 1:self.comm_end]
+
+    @property
+    def state(self):
+        return self.field(3)
 
-    def isDigit(x):
-        """判断一个字符串是否为正整数"""
+    @property
+    def cpu_time(self):
+        """进程cpu时间片 = utime+stime+cutime+cstime"""
+        fields = self.fields or self.split_fields()
+        return int(fields[11]) + int(fields[12]) + int(fields[13]) + int(fields[14])
+
+
+def _stat_field_property(number):
+    index = number - 3
+
+    def getter(self):
+        fields = self.fields or self.split_fields()
+        return int(fields[index]) if index < len(fields) else None
+
+    return property(getter, doc="/proc/[pid]/stat ({}) {}".format(number, PROCESS_STAT_FIELDS[number - 1]))
+
+
+for _number, _name in enumerate(PROCESS_STAT_FIELDS[3:], 4):
+    setattr(ProcessStat, _name, _stat_field_property(_number))
+del _number, _name
+
+
+@wrap_process_exceptions
+def read_process_stat(pid, proc_path="/proc", pooled=True):
+    """读取 /proc/[pid]/stat -> ProcessStat (pooled=False: 一次性读取, 不占用句柄池)"""
+    path = "{}/{}/stat".format(proc_path, pid)
+    if pooled:
+        return ProcessStat(read_proc_file(path))
+    with open(path, "r") as p_stat:
+        return ProcessStat(p_stat.read())
+
+
+# 进程表记录 (未读取的字段为None)
+ProcessRecord = namedtuple("ProcessRecord", ["pid", "comm", "state", "ppid", "pgrp", "session", "num_threads",
+                                             "starttime", "cpu_time", "rss", "cmdline", "rchar", "wchar"])
+
+# scan_processes 可读取的文件
+SCAN_FIELDS = ("stat", "cmdline", "io")
+
+
+def scan_processes(fields=("stat",), proc_path="/proc"):
+    """
+    一次遍历 /proc 获取进程表 (只读取fields中指定的文件)
+    :param fields: "stat"(基本信息,cpu时间片,rss) "cmdline"(命令行) "io"(rchar/wchar,无权限时为None)
+    :return: [ProcessRecord, ...]
+    """
+    read_stat = "stat" in fields
+    read_cmdline = "cmdline" in fields
+    read_io = "io" in fields
+    table = []
+
+    for pid in get_all_pid(proc_path):
+        pid_path = proc_path + "/" + pid
+        comm = state = ppid = pgrp = session = num_threads = starttime = cpu_time = rss = None
+        cmdline = rchar = wchar = None
         try:
-            x = int(x)
-            return isinstance(x, int)
-        except ValueError:
-            return False
+            if read_stat:
+                with open(pid_path + "/stat", "r") as p_stat:
+                    p_data = ProcessStat(p_stat.read())
+                comm, state, ppid, pgrp, session = p_data.comm, p_data.state, p_data.ppid, p_data.pgrp, p_data.session
+                cpu_time, num_threads, starttime, rss = p_data.cpu_time, p_data.num_threads, p_data.starttime, p_data.rss
+            if read_cmdline:
+                with open(pid_path + "/cmdline", "r") as p_cmdline:
+                    cmdline = p_cmdline.read().replace('\0', ' ').strip()
+        except (OSError, IOError):  # 进程已退出
+            continue
+        if read_io:
+            try:
+                with open(pid_path + "/io", "r") as p_io:
+                    rchar = int(p_io.readline().split(":")[1])
+                    wchar = int(p_io.readline().split(":")[1])
+            except (OSError, IOError):  # 无读取权限
+                pass
+        table.append(ProcessRecord(int(pid), comm, state, ppid, pgrp, session, num_threads,
+                                   starttime, cpu_time, rss, cmdline, rchar, wchar))
 
-    return filter(isDigit, os.listdir("/proc"))
+    return table
 
 
 @wrap_process_exceptions
 def get_process_info(pid):
     """获取进程信息 - /proc/[pid]/stat"""
-    with open("/proc/{}/stat".format(pid), "r") as p_stat:
-        p_data = p_stat.readline()
-
-    p_data = p_data.split(" ")
+    p_stat = read_process_stat(pid)
 
     """
     /proc/[pid]/task (since Linux 2.6.0-test6)
@@ -115,20 +255,98 @@ def get_process_info(pid):
 
     """
 
-    with open("/proc/{}/cmdline".format(pid), "r") as p_cmdline:
-        p_cmdline = p_cmdline.readline().replace('\0', ' ').strip()
+    # cmdline 在进程生命周期内基本不变,从进程身份信息缓存中获取
+    p_comm, p_cmdline, p_exe = process_identity_cache.get(int(pid), p_stat.starttime, p_stat.comm)
 
     return {
-        "pid": int(p_data[0]),
-        "comm": p_data[1].strip(")").strip("("),
-        "state": p_data[2],
-        "ppid": int(p_data[3]),
-        "pgrp": int(p_data[4]),
+        "pid": int(pid),
+        "comm": p_comm,
+        "state": p_stat.state,
+        "ppid": p_stat.ppid,
+        "pgrp": p_stat.pgrp,
         "thread num": len(os.listdir("/proc/{}/task".format(pid))),
         "cmdline": p_cmdline
     }
 
 
+class ProcessIdentityCache(object):
+    """
+    进程身份信息缓存 - comm, cmdline, exe 在进程生命周期内基本不变
+    以 (pid, starttime) 作为进程标识, pid被复用时starttime不同,缓存自动失效
+    exec 后 pid 与 starttime 不变, 以调用方刚读取的 stat comm 与缓存的 comm 不一致判断进程已执行 exec, 同样视为未命中
+    """
+
+    def __init__(self, max_size=PROCESS_IDENTITY_CACHE_SIZE):
+        self.max_size = max_size
+        self.cache = OrderedDict()  # pid -> (starttime, comm, cmdline, exe), 按最近使用排序
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def read_identity(pid, comm):
+        """读取进程 cmdline 与 exe (内核线程没有cmdline, exe可能无权限读取)"""
+        try:
+            with open("/proc/{}/cmdline".format(pid), "r") as p_cmdline:
+                cmdline = p_cmdline.read().replace('\0', ' ').strip()
+        except (OSError, IOError):
+            cmdline = ""
+        try:
+            exe = os.readlink("/proc/{}/exe".format(pid))
+        except (OSError, IOError):
+            exe = ""
+        return comm, cmdline, exe
+
+    def get(self, pid, starttime, comm):
+        """获取进程身份信息 -> (comm, cmdline, exe) (comm 为调用方刚读取的值)"""
+        with self.lock:
+            entry = self.cache.pop(pid, None)
+            if entry is not None and entry[0] == starttime and entry[1] == comm:
+                self.cache[pid] = entry
+                self.hits += 1
+                return entry[1:]
+
+        identity = self.read_identity(pid, comm)
+        with self.lock:
+            self.misses += 1
+            self.cache[pid] = (starttime,) + identity
+            while len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+        return identity
+
+    def invalidate(self, pid):
+        """使进程缓存失效 (如进程执行了exec)"""
+        with self.lock:
+            self.cache.pop(pid, None)
+
+    def prune(self, alive_pids):
+        """移除已退出进程的缓存"""
+        alive_pids = set(alive_pids)
+        with self.lock:
+            for pid in [pid for pid in self.cache if pid not in alive_pids]:
+                del self.cache[pid]
+
+
+# 默认进程身份信息缓存
+process_identity_cache = ProcessIdentityCache()
+
+
+@wrap_process_exceptions
+def get_process_identity(pid, pooled=True):
+    """获取进程身份信息 (comm, cmdline, exe) - 每次调用只读取一次 /proc/[pid]/stat"""
+    p_stat = read_process_stat(pid, pooled=pooled)
+    starttime = p_stat.starttime
+    comm, cmdline, exe = process_identity_cache.get(int(pid), starttime, p_stat.comm)
+
+    return {
+        "pid": int(pid),
+        "starttime": starttime,
+        "comm": comm,
+        "cmdline": cmdline,
+        "exe": exe
+    }
+
+
 @wrap_process_exceptions
 def get_process_cpu_time(pid):
     """获取进程cpu时间片 - /proc/[pid]/stat"""
@@ -339,54 +557,360 @@ def get_process_cpu_time(pid):
         The thread"s exit status in the form reported by waitpid(2).
     """
 
-    with open("/proc/{}/stat".format(pid), "r") as p_stat:
-        p_data = p_stat.readline()
+    return read_process_stat(pid).cpu_time  # 进程cpu时间片 = utime+stime+cutime+cstime
+
 
-    return sum(map(int, p_data.split(" ")[13:17]))  # 进程cpu时间片 = utime+stime+cutime+cstime
+class ProcessState(object):
+    """关注进程的状态数据 (计算各种占用率所需的上一次记录)"""
+    __slots__ = ("pid", "starttime", "pre_time", "prev_cpu_time", "prev_cpu_total_time", "prev_io")
+
+    def __init__(self, pid, starttime):
+        self.pid = pid
+        self.starttime = starttime  # 进程启动时间, 用于识别pid复用
+        self.pre_time = 0  # 上次记录IO数据的时间
+        self.prev_cpu_time = None  # 上次记录的进程CPU时间片
+        self.prev_cpu_total_time = 0  # 上次记录的总CPU时间片(每个进程独立)
+        self.prev_io = None  # 上次记录的 [rchar, wchar]
+
+
+class ProcessStateStore(object):
+    """
+    关注进程状态数据存储
+    - 以 (pid, starttime) 识别进程, pid被复用时自动重置状态
+    - 超过上限时按最近使用淘汰, 并定期清理已退出的进程
+    - 淘汰进程时一并清理 watch_pid 与 libnethogs_data
+    """
+
+    def __init__(self, max_size=PROCESS_STATE_LIMIT, prune_interval=PROCESS_STATE_PRUNE_INTERVAL):
+        self.max_size = max_size
+        self.prune_interval = prune_interval
+        self.states = OrderedDict()  # pid -> ProcessState, 按最近使用排序
+        self.lock = threading.RLock()
+        self.last_prune = time()
+        self.evicted = 0
+
+    def __contains__(self, pid):
+        return int(pid) in self.states
+
+    def __len__(self):
+        return len(self.states)
+
+    def get(self, pid, starttime):
+        """获取进程状态数据 (不存在或pid已被复用时创建新的状态数据)"""
+        pid = int(pid)
+        if time() - self.last_prune >= self.prune_interval:
+            self.prune()
+        with self.lock:
+            state = self.states.pop(pid, None)
+            if state is None or state.starttime != starttime:
+                state = ProcessState(pid, starttime)
+            self.states[pid] = state
+            all_process_info_dict["watch_pid"].add(pid)
+            while len(self.states) > self.max_size:
+                self.forget(next(iter(self.states)))
+        return state
+
+    def is_tracked(self, pid):
+        """进程是否有关注数据 (状态数据, watch_pid, libnethogs_data, 句柄池, 各批量计算实例的基线), 每项为O(1)"""
+        pid = int(pid)
+        return pid in self.states or pid in all_process_info_dict["watch_pid"] or \
+            str(pid) in all_process_info_dict["libnethogs_data"] or proc_file_pool.has_pid(pid) or \
+            pid in process_mem_collector.cache or \
+            any(engine.has_baseline(pid) for engine in (process_rate_engine, thread_rate_engine,
+                                                        process_io_rate_engine, process_stall_engine))
+
+    def forget(self, pid):
+        """移除进程的全部关注数据"""
+        pid = int(pid)
+        with self.lock:
+            if self.states.pop(pid, None) is not None:
+                self.evicted += 1
+            all_process_info_dict["watch_pid"].discard(pid)
+            all_process_info_dict["libnethogs_data"].pop(str(pid), None)
+            proc_file_pool.discard_pid(pid)
+            process_rate_engine.forget([pid])
+            thread_rate_engine.forget([pid])
+            process_mem_collector.forget([pid])
+            process_io_rate_engine.forget([pid])
+            process_stall_engine.forget([pid])
+
+    def prune(self, alive_pids=None):
+        """清理已退出进程的数据 (alive_pids 为空时检查/proc)"""
+        if alive_pids is None:
+            is_alive = lambda pid: os.path.exists("/proc/{}".format(pid))
+        else:
+            alive_pids = set(map(int, alive_pids))
+            is_alive = alive_pids.__contains__
+        with self.lock:
+            self.last_prune = time()
+            watched = set(self.states) | set(all_process_info_dict["watch_pid"]) | \
+                set(map(int, all_process_info_dict["libnethogs_data"]))
+            for pid in [pid for pid in watched if not is_alive(pid)]:
+                self.forget(pid)
+
+    def stats(self):
+        """状态数据统计 (进程数, 淘汰数, 占用内存字节数)"""
+        with self.lock:
+            size = sys.getsizeof(self.states) + all_process_info_dict["watch_pid"].sizeof() + \
+                   all_process_info_dict["libnethogs_data"].sizeof()
+            for state in self.states.values():
+                size += sys.getsizeof(state)
+                if state.prev_io is not None:
+                    size += sys.getsizeof(state.prev_io)
+            return {
+                "tracked": len(self.states),
+                "watch_pid": len(all_process_info_dict["watch_pid"]),
+                "libnethogs_data": len(all_process_info_dict["libnethogs_data"]),
+                "max_size": self.max_size,
+                "evicted": self.evicted,
+                "memory": size,
+            }
+
+
+# 默认关注进程状态数据存储
+process_state_store = ProcessStateStore()
+all_process_info_dict["process_info"] = process_state_store
+
+
+def forget_process(pid):
+    """进程退出 - 清理关注进程相关数据 (每个进程退出事件都会调用, 没有关注数据的进程直接返回)"""
+    if process_state_store.is_tracked(pid):
+        process_state_store.forget(pid)
+
+
+def get_process_state_stats():
+    """获取关注进程状态数据统计"""
+    return process_state_store.stats()
 
 
 def calc_process_cpu_percent(pid, interval=calc_func_interval):
     """计算进程CPU使用率 (计算的cpu总体占用率)"""
-    global all_process_info_dict, process_info_dict
-    # 初始化 - 添加进程信息
-    if int(pid) not in all_process_info_dict["watch_pid"]:
-        all_process_info_dict["watch_pid"].add(int(pid))
-        all_process_info_dict["process_info"][str(pid)] = deepcopy(process_info_dict)  # 添加一个全新的进程数据结构副本
-
-    if all_process_info_dict["process_info"][str(pid)]["prev_cpu_time"] is None:
-        all_process_info_dict["prev_cpu_total_time"] = get_total_cpu_time()[0]
-        all_process_info_dict["process_info"][str(pid)]["prev_cpu_time"] = get_process_cpu_time(pid)
+    from metric_sampler import get_sampled_metric
+    sampled = get_sampled_metric(("process_cpu_percent", int(pid)), wait=interval)
+    if sampled is not None:  # 后台采样线程运行中,直接返回最近一次的采样结果
+        return sampled[0]
+
+    process_stat = read_process_stat(pid)
+    process_info = process_state_store.get(pid, process_stat.starttime)
+    # 基线的 读取-计算-更新 在状态存储的锁内进行 (首次初始化的sleep期间不持有)
+    with process_state_store.lock:
+        initialized = process_info.prev_cpu_time is not None
+        if not initialized:
+            process_info.prev_cpu_total_time = get_total_cpu_time()[0]
+            process_info.prev_cpu_time = process_stat.cpu_time
+    if not initialized:
         sleep(interval)
 
-    current_cpu_total_time = get_total_cpu_time()[0]
-    current_process_cpu_time = get_process_cpu_time(pid)
-    process_cpu_percent = (current_process_cpu_time - all_process_info_dict["process_info"][str(pid)]["prev_cpu_time"]) \
-                          * 100.0 / (current_cpu_total_time - all_process_info_dict["prev_cpu_total_time"])
+    with process_state_store.lock:
+        current_cpu_total_time = get_total_cpu_time()[0]
+        current_process_cpu_time = get_process_cpu_time(pid)
+        if current_cpu_total_time == process_info.prev_cpu_total_time:  # 与上次调用处于同一个tick
+            return 0.0
+        process_cpu_percent = (current_process_cpu_time - process_info.prev_cpu_time) \
+                              * 100.0 / (current_cpu_total_time - process_info.prev_cpu_total_time)
 
-    all_process_info_dict["process_info"][str(pid)]["prev_cpu_time"] = current_process_cpu_time
-    all_process_info_dict["prev_cpu_total_time"] = current_cpu_total_time
+        process_info.prev_cpu_time = current_process_cpu_time
+        process_info.prev_cpu_total_time = current_cpu_total_time
 
     return process_cpu_percent
 
 
-@wrap_process_exceptions
-def get_path_total_size(path, style="M"):
-    """获取文件夹总大小(默认MB)"""
-    total_size = 0
-    # 通过 os.walk() 获取所有文件并计算总大小
-    for dir_path, dir_names, file_names in os.walk(path):
-        for fn in file_names:
-            try:
-                total_size += os.path.getsize(os.path.join(dir_path, fn))
-            except (OSError, IOError):
+class ProcessRateEngine(object):
+    """多进程批量计算CPU占用率,磁盘IO速度及内存 (每个进程使用独立的基线)"""
+
+    def __init__(self):
+        self.baseline = {}  # pid -> (starttime, 进程cpu时间片, rchar, wchar, 总CPU时间片, 时间)
+        self.lock = threading.Lock()  # 多线程同时调用时保护基线的 读取-计算-更新
+
+    def forget(self, pids):
+        """移除进程基线"""
+        with self.lock:
+            for pid in pids:
+                self.baseline.pop(int(pid), None)
+
+    def has_baseline(self, pid):
+        return int(pid) in self.baseline
+
+    def update(self, pids):
+        """
+        计算一个tick内所有进程的速率 (总CPU时间只读取一次)
+        :return: {pid: {"cpu_percent", "read_MBs", "write_MBs", "rss"}}, 首次出现的进程速率为None
+        """
+        with self.lock:
+            cpu_total_time = read_proc_stat().cpu[0]
+            current_time = time()
+            baseline = self.baseline
+            result = {}
+
+            for pid in pids:
+                pid = int(pid)
+                try:
+                    p_data = ProcessStat(read_proc_file("/proc/{}/stat".format(pid)))
+                except (OSError, IOError):  # 进程已退出
+                    baseline.pop(pid, None)
+                    proc_file_pool.discard_pid(pid)
+                    continue
+                starttime = p_data.starttime
+                cpu_time = p_data.cpu_time
+                rss = round(p_data.rss * MEM_PAGE_SIZE / 1024., 2)
+
+                rchar = wchar = None
+                try:
+                    p_io = read_proc_file("/proc/{}/io".format(pid)).split("\n", 2)
+                    rchar = int(p_io[0].split(":")[1])
+                    wchar = int(p_io[1].split(":")[1])
+                except (OSError, IOError):  # 无读取权限(或进程刚刚退出),仅计算CPU与内存
+                    pass
+
+                prev = baseline.get(pid)
+                baseline[pid] = (starttime, cpu_time, rchar, wchar, cpu_total_time, current_time)
+                process_rate = {"cpu_percent": None, "read_MBs": None, "write_MBs": None, "rss": rss}
+                result[pid] = process_rate
+                if prev is None or prev[0] != starttime:  # 新进程(或pid已被复用)
+                    continue
+
+                if cpu_total_time != prev[4]:
+                    process_rate["cpu_percent"] = (cpu_time - prev[1]) * 100.0 / (cpu_total_time - prev[4])
+                else:  # 与上次调用处于同一个tick
+                    process_rate["cpu_percent"] = 0.0
+                if rchar is not None and prev[2] is not None and current_time != prev[5]:
+                    # 注意,这里为了计算磁盘的IO,除以的数字是1000而不是1024
+                    process_rate["read_MBs"] = round((rchar - prev[2]) / 1000. ** 2 / (current_time - prev[5]), 2)
+                    process_rate["write_MBs"] = round((wchar - prev[3]) / 1000. ** 2 / (current_time - prev[5]), 2)
+
+            return result
+
+
+# 默认的批量速率计算实例
+process_rate_engine = ProcessRateEngine()
+
+
+def calc_processes_rate(pids, interval=calc_func_interval):
+    """
+    批量计算多个进程的CPU占用率,磁盘IO速度(MB/s)及内存(MB)
+    首次出现的进程统一只等待一次interval(而不是每个进程各等待一次)
+    """
+    pids = [int(pid) for pid in pids]
+    if interval and any(not process_rate_engine.has_baseline(pid) for pid in pids):
+        process_rate_engine.update(pids)
+        sleep(interval)
+    return process_rate_engine.update(pids)
+
+
+class ThreadRateEngine(object):
+    """多进程批量计算各线程CPU占用率 (/proc/[pid]/task/[tid]/stat, 每个线程使用独立的基线)"""
+
+    def __init__(self, proc_path="/proc"):
+        self.proc_path = proc_path
+        self.baseline = {}  # pid -> (总CPU时间片, {tid: (starttime, 线程cpu时间片)})
+        self.lock = threading.Lock()  # 多线程同时调用时保护基线的 读取-计算-更新
+
+    def forget(self, pids):
+        """移除进程的线程基线"""
+        with self.lock:
+            for pid in pids:
+                self.baseline.pop(int(pid), None)
+
+    def has_baseline(self, pid):
+        return int(pid) in self.baseline
+
+    def read_threads(self, pid):
+        """读取进程所有线程的stat -> {tid: ProcessStat} (进程已退出时抛出 OSError)"""
+        task_path = "{}/{}/task".format(self.proc_path, pid)
+        if scandir is not None:
+            tids = [entry.name for entry in scandir(task_path)]
+        else:
+            tids = os.listdir(task_path)
+
+        threads = {}
+        for tid in tids:
+            try:  # 线程数量可能很多, 直接使用 os.open/os.read 减少文件对象的开销
+                fd = os.open(task_path + "/" + tid + "/stat", os.O_RDONLY)
+                try:
+                    data = os.read(fd, 4096)
+                finally:
+                    os.close(fd)
+            except (OSError, IOError):  # 线程已退出
                 continue
-    # 调整返回单位大小
-    if style == "M":
-        return round(total_size / 1024. ** 2, 2)
-    elif style == "G":
-        return round(total_size / 1024. ** 3, 2)
-    else:  # "KB"
-        return round(total_size / 1024., 2)
+            threads[int(tid)] = ProcessStat(data)
+        return threads
+
+    def update(self, pids):
+        """
+        计算一个tick内所有进程各线程的CPU占用率 (总CPU时间只读取一次)
+        :return: {pid: [{"tid", "name", "state", "processor", "cpu_percent"}, ...]}, 首次出现的线程占用率为None
+        """
+        with self.lock:
+            cpu_total_time = read_proc_stat().cpu[0]
+            baseline = self.baseline
+            result = {}
+
+            for pid in pids:
+                pid = int(pid)
+                try:
+                    threads = self.read_threads(pid)
+                except (OSError, IOError):  # 进程已退出
+                    baseline.pop(pid, None)
+                    continue
+
+                prev_cpu_total_time, prev_threads = baseline.get(pid, (None, {}))
+                current_threads = {}
+                threads_rate = []
+                for tid, t_data in threads.items():
+                    # 线程的 cutime/cstime 为整个进程已回收子进程的累计值, 只使用 utime+stime
+                    starttime, cpu_time = t_data.starttime, t_data.utime + t_data.stime
+                    current_threads[tid] = (starttime, cpu_time)
+                    thread_rate = {"tid": tid, "name": t_data.comm, "state": t_data.state,
+                                   "processor": t_data.processor, "cpu_percent": None}
+                    prev = prev_threads.get(tid)
+                    if prev is not None and prev[0] == starttime:  # 新线程(或tid已被复用)没有占用率
+                        if cpu_total_time != prev_cpu_total_time:
+                            thread_rate["cpu_percent"] = \
+                                (cpu_time - prev[1]) * 100.0 / (cpu_total_time - prev_cpu_total_time)
+                        else:  # 与上次调用处于同一个tick
+                            thread_rate["cpu_percent"] = 0.0
+                    threads_rate.append(thread_rate)
+
+                # 整体替换, 已退出的线程不再保留基线
+                baseline[pid] = (cpu_total_time, current_threads)
+                result[pid] = threads_rate
+
+            return result
+
+
+# 默认的线程CPU占用率计算实例
+thread_rate_engine = ThreadRateEngine()
+
+
+def calc_threads_cpu_percent(pids, top=10, interval=calc_func_interval):
+    """
+    批量计算多个进程中CPU占用率最高的top个线程
+    首次出现的进程统一只等待一次interval
+    :return: {pid: {"threads": 线程数, "top": [{"tid", "name", "state", "processor", "cpu_percent"}, ...]}}
+    """
+    pids = [int(pid) for pid in pids]
+    if interval and any(not thread_rate_engine.has_baseline(pid) for pid in pids):
+        thread_rate_engine.update(pids)
+        sleep(interval)
+
+    result = {}
+    for pid, threads_rate in thread_rate_engine.update(pids).items():
+        result[pid] = {
+            "threads": len(threads_rate),
+            "top": heapq.nlargest(top, threads_rate, key=lambda thread_rate: thread_rate["cpu_percent"])
+        }
+    return result
+
+
+@wrap_process_exceptions
+def get_path_total_size(path, style="M", max_age=0, watch=False):
+    """
+    获取文件夹总大小(默认MB, 硬链接去重, 并行遍历; 首次调用时才加载 dir_size)
+    max_age 为文件夹缓存有效期(秒), 默认0即每次重新获取文件大小, 传入 max_age 时按文件夹mtime增量更新
+    watch=True 时基于 inotify 实时维护该文件夹的大小
+    """
+    from dir_size import get_path_total_size as get_dir_total_size
+    return get_dir_total_size(path, style, max_age, watch)
 
 
 @wrap_process_exceptions
@@ -420,17 +944,129 @@ def get_process_mem(pid, style="M"):
         This does not include pages which have not been  demand-loaded  in,  or which are swapped out.
     """
 
-    with open("/proc/{}/stat".format(pid), "r") as p_stat:
-        p_data = p_stat.readline()
+    rss = read_process_stat(pid).rss
 
-    global MEM_PAGE_SIZE
     # 进程实际占用内存 = rss * page size
     if style == "M":
-        return round(int(p_data.split()[23]) * MEM_PAGE_SIZE / 1024., 2)
+        return round(rss * MEM_PAGE_SIZE / 1024., 2)
     elif style == "G":
-        return round(int(p_data.split()[23]) * MEM_PAGE_SIZE / 1024. ** 2, 2)
+        return round(rss * MEM_PAGE_SIZE / 1024. ** 2, 2)
     else:  # K
-        return int(p_data.split()[23]) * MEM_PAGE_SIZE
+        return rss * MEM_PAGE_SIZE
+
+
+class ProcessMemCollector(object):
+    """
+    多进程批量获取内存占用 (RSS, PSS, USS, 共享内存, swap)
+    - 优先读取 /proc/[pid]/smaps_rollup (Linux 4.14+, 需要与读取 /proc/[pid]/mem 相同的权限)
+    - 不支持或无权限时退回 /proc/[pid]/statm (没有PSS与swap, USS以 RSS-共享页 近似)
+    - smaps_rollup 需要遍历进程页表, 开销较大, 结果在 refresh_interval 秒内缓存
+    """
+
+    def __init__(self, refresh_interval=PROCESS_MEM_REFRESH_INTERVAL, proc_path="/proc"):
+        self.refresh_interval = refresh_interval
+        self.proc_path = proc_path
+        self.cache = {}  # pid -> (starttime, 读取时间, 内存数据)
+        self.lock = threading.Lock()
+
+    def forget(self, pids):
+        """移除进程缓存"""
+        with self.lock:
+            for pid in pids:
+                self.cache.pop(int(pid), None)
+
+    def read_smaps_rollup(self, pid):
+        """读取 /proc/[pid]/smaps_rollup -> 内存数据(字节)"""
+        with open("{}/{}/smaps_rollup".format(self.proc_path, pid), "r") as p_smaps:
+            smaps = {}
+            for line in p_smaps.readlines()[1:]:  # 第一行为地址范围
+                name, _, value = line.partition(":")
+                smaps[name] = int(value.split()[0]) * 1024
+        return {
+            "rss": smaps.get("Rss", 0),
+            "pss": smaps.get("Pss", 0),
+            "uss": smaps.get("Private_Clean", 0) + smaps.get("Private_Dirty", 0),
+            "shared": smaps.get("Shared_Clean", 0) + smaps.get("Shared_Dirty", 0),
+            "swap": smaps.get("Swap", 0),
+            "source": "smaps_rollup"
+        }
+
+    def read_statm(self, pid):
+        """读取 /proc/[pid]/statm -> 内存数据(字节)"""
+        with open("{}/{}/statm".format(self.proc_path, pid), "r") as p_statm:
+            resident, shared = map(int, p_statm.readline().split()[1:3])
+        return {
+            "rss": resident * PAGE_SIZE,
+            "pss": None,
+            "uss": (resident - shared) * PAGE_SIZE,
+            "shared": shared * PAGE_SIZE,
+            "swap": None,
+            "source": "statm"
+        }
+
+    def read(self, pid):
+        """读取进程内存数据 (进程已退出时抛出 OSError/IOError)"""
+        try:
+            return self.read_smaps_rollup(pid)
+        except (OSError, IOError) as e:
+            # 无权限, 或内核不支持 smaps_rollup (进程已退出时 statm 同样会失败)
+            if e.errno not in (errno.EACCES, errno.EPERM, errno.ENOENT):
+                raise
+        return self.read_statm(pid)
+
+    def get(self, pids, max_age=None):
+        """
+        批量获取进程内存数据 (缓存未过期时不重新读取)
+        :return: {pid: {"rss", "pss", "uss", "shared", "swap", "source"}} (单位字节, 已退出的进程不在结果中)
+        """
+        if max_age is None:
+            max_age = self.refresh_interval
+        now = time()
+        result = {}
+
+        for pid in pids:
+            pid = int(pid)
+            try:
+                starttime = read_process_stat(pid, self.proc_path).starttime
+            except (NoSuchProcess, AccessDenied):
+                self.forget([pid])
+                continue
+            with self.lock:
+                cached = self.cache.get(pid)
+            if cached is not None and cached[0] == starttime and now - cached[1] < max_age:
+                result[pid] = cached[2]
+                continue
+            try:
+                mem = self.read(pid)
+            except (OSError, IOError):  # 进程已退出
+                self.forget([pid])
+                continue
+            with self.lock:
+                self.cache[pid] = (starttime, now, mem)
+            result[pid] = mem
+
+        return result
+
+
+# 默认的进程内存采集实例
+process_mem_collector = ProcessMemCollector()
+
+
+def get_processes_mem(pids, style="M", max_age=None):
+    """
+    批量获取多个进程的内存占用 (RSS, PSS, USS, 共享内存, swap)
+    :param style: 单位 K/M/G/B(字节)
+    :param max_age: 缓存有效期(秒), 默认为 PROCESS_MEM_REFRESH_INTERVAL, 0为强制重新读取
+    :return: {pid: {"rss", "pss", "uss", "shared", "swap", "source"}} (statm 方式获取时 pss, swap 为None)
+    """
+    style_size = {"K": 1024., "M": 1024. ** 2, "G": 1024. ** 3}.get(style)
+    result = {}
+    for pid, mem in process_mem_collector.get(pids, max_age).items():
+        if style_size is not None:
+            mem = dict((name, round(value / style_size, 2) if isinstance(value, (int, long)) else value)
+                       for name, value in mem.items())
+        result[pid] = mem
+    return result
 
 
 @wrap_process_exceptions
@@ -559,263 +1195,347 @@ def get_process_io(pid):
     # 通过PyInstaller将核心内容打包成可执行文件后,用setcap提权(看起来是最优雅的,待完成所有功能后试一下,如何交互呢?)
     # ...待完善
 
-    with open("/proc/{}/io".format(pid), "r") as p_io:
-        rchar = p_io.readline().split(":")[1].strip()
-        wchar = p_io.readline().split(":")[1].strip()
-
-    return map(int, [rchar, wchar])
+    process_io = read_process_io(pid)
+    return [process_io["rchar"], process_io["wchar"]]
 
 
 def calc_process_cpu_io(pid, interval=calc_func_interval):
     """计算进程的磁盘IO速度 (单位MB/s)"""
-    global all_process_info_dict, process_info_dict
-    # 初始化 - 添加进程信息
-    if int(pid) not in all_process_info_dict["watch_pid"]:
-        all_process_info_dict["watch_pid"].add(int(pid))
-        all_process_info_dict["process_info"][str(pid)] = deepcopy(process_info_dict)  # 添加一个全新的进程数据结构副本
-
-    # 添加数据结构信息
-    if all_process_info_dict["process_info"][str(pid)]["prev_io"] is None:
-        all_process_info_dict["process_info"][str(pid)]["prev_io"] = get_process_io(pid)
-        all_process_info_dict["process_info"][str(pid)]["pre_time"] = time()
+    from metric_sampler import get_sampled_metric
+    sampled = get_sampled_metric(("process_io", int(pid)), wait=interval)
+    if sampled is not None:  # 后台采样线程运行中,直接返回最近一次的采样结果
+        return sampled[0]
+
+    process_info = process_state_store.get(pid, read_process_stat(pid).starttime)
+    with process_state_store.lock:
+        initialized = process_info.prev_io is not None
+        if not initialized:
+            process_info.prev_io = get_process_io(pid)
+            process_info.pre_time = time()
+    if not initialized:
         sleep(interval)
 
-    current_time = time()
-    current_rchar, current_wchar = get_process_io(pid)
+    with process_state_store.lock:
+        current_time = time()
+        current_rchar, current_wchar = get_process_io(pid)
 
-    # 注意,这里为了计算磁盘的IO,除以的数字是1000而不是1024
-    read_MBs = (current_rchar - all_process_info_dict["process_info"][str(pid)]["prev_io"][0]) \
-               / 1000. ** 2 / (current_time - all_process_info_dict["process_info"][str(pid)]["pre_time"])
-    write_MBs = (current_wchar - all_process_info_dict["process_info"][str(pid)]["prev_io"][1]) \
-                / 1000. ** 2 / (current_time - all_process_info_dict["process_info"][str(pid)]["pre_time"])
+        # 注意,这里为了计算磁盘的IO,除以的数字是1000而不是1024
+        read_MBs = (current_rchar - process_info.prev_io[0]) / 1000. ** 2 / (current_time - process_info.pre_time)
+        write_MBs = (current_wchar - process_info.prev_io[1]) / 1000. ** 2 / (current_time - process_info.pre_time)
 
-    all_process_info_dict["process_info"][str(pid)]["prev_io"] = [current_rchar, current_wchar]
-    all_process_info_dict["process_info"][str(pid)]["pre_time"] = current_time
+        process_info.prev_io = (current_rchar, current_wchar)
+        process_info.pre_time = current_time
 
     return [round(read_MBs, 2), round(write_MBs, 2)]
 
 
-# Note : 获取进程的网络数据
-# 这里可能是整个系统最大的实现难点.
-# 实现的逻辑可以参考 https://www.jianshu.com/p/deb0ed35c1c2 中 <计算进程的网络IO数据> 这一部分
-#
-# 1. 获取进程的所有TCP链接的inode, /proc/pid/fd 目录下代表当前进程所有打开的文件描述符
-# 2. 列出系统中 TCP inode 对应的链接信息，通过命令/proc/net/tcp 可以得到当前 TCP inode 对应的链接信息列表，内容类似：
-# 3. 使用 libcap 抓包的方法，计算出每个TCP链接对应的网络流量后，
-#    然后反向通过步骤一的 pid <-> inode list 信息，最后计算出每个进程的网络流量。
-#
-# 这个完整实现的工作量基本就是一个毕设了. - -!
-#
-# 参考工具
-# nethogs : https://github.com/raboof/nethogs
-# hogwatch : https://github.com/akshayKMR/hogwatch(nethogs+python展示)
-# iftop : http://www.ex-parrot.com/~pdw/iftop/ (2017 更多的是针对链接的监控)
-# ifstat : http://gael.roualland.free.fr/ifstat/ (2004)
-#
-# Nethogs github下的
-# Nethogs监控每个进程进出机器的流量。其他工具则监控哪种类型的流量通过机器或从机器等运行。
-# 我会尝试在这里链接到这些工具。如果您了解另一个问题，请务必打开问题/公关：
-#
-# nettop显示数据包类型，按大小或数量的数据包排序。
-# ettercap是以太网的网络嗅探器/拦截器/记录器
-# darkstat通过主机，协议等来分解流量。旨在分析在较长时间内收集的流量，而不是“实时”查看。
-# iftop按服务和主机显示网络流量
-# ifstat以类似vmstat / iostat的方式通过接口显示网络流量
-# gnethogs基于GTK的GUI（正在进行中）
-# nethogs-qt基于Qt的GUI
-# hogwatch带有桌面/网络图形的带宽监视器（每个进程）。
-
-
-# #########################使用nethogs作为系统监控核心#####################
-
-# Setp - 0
-# 在nethogs的官方github页面上,提供了将nethogs编译成动态链接库供其它程序调用的方法(避免了丑陋的通过命令行方式调用)
-# 详细可参见 https://github.com/raboof/nethogs#libnethogs 这一段
-#
-# Step - 1
-# 主要步骤为:
-# apt-get install build-essential libncurses5-dev libpcap-dev
-# git clone https://github.com/raboof/nethogs.git
-# cd nethogs && make libnethogs && sudo make install_dev
-#
-# 之后根据屏幕输出的提示信息 动态链接库 libnethogs.so 已经创建在 /usr/local/lib 这个目录下了,现在就可以通过各种方式来调用它了
-#
-# Setp - 2
-# libnethogs.so 库主要函数功能说明详见 - https://github.com/raboof/nethogs/blob/master/src/libnethogs.h
-# 通过python调用的demo python-wrapper.py 可见 https://github.com/raboof/nethogs/blob/master/contrib/python-wrapper.py
-#
-
-"基于nethogs的进程网络流量监控实现"
+# /proc/[pid]/io 字段
+# rchar/wchar           - read/write 等系统调用读写的字节数(包括页缓存命中,tty等,不一定产生磁盘IO)
+# syscr/syscw           - read/write 等系统调用次数
+# read_bytes/write_bytes - 实际从存储设备读取/写入存储设备(页缓存回写)的字节数
+# cancelled_write_bytes - 已计入write_bytes但被取消(如截断脏页文件)的字节数
+PROCESS_IO_FIELDS = ("rchar", "wchar", "syscr", "syscw", "read_bytes", "write_bytes", "cancelled_write_bytes")
 
 
 @wrap_process_exceptions
-def is_libnethogs_install(libnethogs_path="/usr/local/lib/libnethogs.so"):
-    """检测libnethogs环境是否安装"""
-    return os.path.exists(libnethogs_path) and os.path.isfile(libnethogs_path)
-
-
-# reference : https://github.com/raboof/nethogs/blob/master/contrib/python-wrapper.py
-
-class Action():
-    """数据动作 SET(add,update),REMOVE(removed)"""
-    SET = 1
-    REMOVE = 2
-
-    MAP = {SET: "SET", REMOVE: "REMOVE"}
-
-
-class LoopStatus():
-    """监控进程循环状态"""
-    OK = 0
-    FAILURE = 1
-    NO_DEVICE = 2
-
-    MAP = {OK: "OK", FAILURE: "FAILURE", NO_DEVICE: "NO_DEVICE"}
-
-
-# The sent/received KB/sec values are averaged over 5 seconds; see PERIOD in nethogs.h.
-# https://github.com/raboof/nethogs/blob/master/src/nethogs.h#L43
-# sent_bytes and recv_bytes are a running total
-class NethogsMonitorRecord(ctypes.Structure):
-    """nethogs进程流量监控线程 - 用于进程浏览监控的数据结构
-    ctypes version of the struct of the same name from libnethogs.h"""
-    _fields_ = (("record_id", ctypes.c_int),
-                ("name", ctypes.c_char_p),
-                ("pid", ctypes.c_int),
-                ("uid", ctypes.c_uint32),
-                ("device_name", ctypes.c_char_p),
-                ("sent_bytes", ctypes.c_uint64),
-                ("recv_bytes", ctypes.c_uint64),
-                ("sent_kbs", ctypes.c_float),
-                ("recv_kbs", ctypes.c_float),
-                )
-
-
-def signal_handler(signal, frame):
-    """nethogs进程流量监控线程 - 退出信号处理"""
-    global all_process_info_dict
-    all_process_info_dict["libnethogs"].nethogsmonitor_breakloop()
-    all_process_info_dict["libnethogs_thread"] = None
-
-
-def dev_args(devnames):
-    """
-    nethogs进程流量监控线程 - 退出信号处理
-    Return the appropriate ctypes arguments for a device name list, to pass
-    to libnethogs ``nethogsmonitor_loop_devices``. The return value is a
-    2-tuple of devc (``ctypes.c_int``) and devicenames (``ctypes.POINTER``)
-    to an array of ``ctypes.c_char``).
-
-    :param devnames: list of device names to monitor
-    :type devnames: list
-    :return: 2-tuple of devc, devicenames ctypes arguments
-    :rtype: tuple
-    """
-    devc = len(devnames)
-    devnames_type = ctypes.c_char_p * devc
-    devnames_arg = devnames_type()
-    for idx, val in enumerate(devnames):
-        devnames_arg[idx] = (val + chr(0)).encode("ascii")
-    return ctypes.c_int(devc), ctypes.cast(
-        devnames_arg, ctypes.POINTER(ctypes.c_char_p)
-    )
-
-
-def run_monitor_loop(lib, devnames):
-    """nethogs进程流量监控线程 - 主循环"""
-    global all_process_info_dict
-
-    # Create a type for my callback func. The callback func returns void (None), and accepts as
-    # params an int and a pointer to a NethogsMonitorRecord instance.
-    # The params and return type of the callback function are mandated by nethogsmonitor_loop().
-    # See libnethogs.h.
-    CALLBACK_FUNC_TYPE = ctypes.CFUNCTYPE(
-        ctypes.c_void_p, ctypes.c_int, ctypes.POINTER(NethogsMonitorRecord)
-    )
-
-    filter_arg = FILTER
-    if filter_arg is not None:
-        filter_arg = ctypes.c_char_p(filter_arg.encode("ascii"))
-
-    if len(devnames) < 1:
-        # monitor all devices
-        rc = lib.nethogsmonitor_loop(
-            CALLBACK_FUNC_TYPE(network_activity_callback),
-            filter_arg
-        )
+def read_process_io(pid):
+    """
+    读取 /proc/[pid]/io 全部字段 -> {字段: 计数} (需要与 ptrace 相同的权限)
+    进程仍存在但没有io文件(内核未开启 CONFIG_TASK_IO_ACCOUNTING)时抛出 EnvironmentError(EOPNOTSUPP), 而不是 NoSuchProcess
+    """
+    path = "/proc/{}/io".format(pid)
+    try:
+        data = read_proc_file(path)
+    except EnvironmentError as err:
+        if err.errno == errno.ENOENT and os.path.exists("/proc/{}".format(pid)):
+            raise EnvironmentError(errno.EOPNOTSUPP, "io accounting not supported (CONFIG_TASK_IO_ACCOUNTING)", path)
+        raise
+    process_io = {}
+    for line in data.splitlines():
+        name, _, value = line.partition(":")
+        if value:
+            process_io[name] = int(value)
+    return process_io
+
+
+class ProcessIORateEngine(object):
+    """多进程批量计算 /proc/[pid]/io 全部字段的速率 (每个进程使用独立的基线)"""
+
+    def __init__(self):
+        self.baseline = {}  # pid -> (starttime, (PROCESS_IO_FIELDS 对应计数), 时间)
+        self.lock = threading.Lock()  # 多线程同时调用时保护基线的 读取-计算-更新
+
+    def forget(self, pids):
+        """移除进程基线"""
+        with self.lock:
+            for pid in pids:
+                self.baseline.pop(int(pid), None)
+
+    def has_baseline(self, pid):
+        return int(pid) in self.baseline
+
+    def update(self, pids):
+        """
+        计算一个tick内所有进程的IO速率
+        :return: {pid: {"rchar", ..., "cancelled_write_bytes", "error"}}
+                 速率单位为 字节/秒(syscr/syscw为次/秒), 首次出现的进程速率为None
+                 单个进程无权限, 已退出或内核不支持时 error 为 "AccessDenied"/"NoSuchProcess"/"NotSupported", 不影响其他进程
+        """
+        with self.lock:
+            baseline = self.baseline
+            result = {}
+
+            for pid in pids:
+                pid = int(pid)
+                process_io_rate = dict.fromkeys(PROCESS_IO_FIELDS)
+                process_io_rate["error"] = None
+                result[pid] = process_io_rate
+                try:
+                    starttime = read_process_stat(pid).starttime
+                    process_io = read_process_io(pid)
+                except NoSuchProcess:
+                    baseline.pop(pid, None)
+                    process_io_rate["error"] = "NoSuchProcess"
+                    continue
+                except AccessDenied:
+                    baseline.pop(pid, None)
+                    process_io_rate["error"] = "AccessDenied"
+                    continue
+                except EnvironmentError:  # 内核未开启 CONFIG_TASK_IO_ACCOUNTING
+                    baseline.pop(pid, None)
+                    process_io_rate["error"] = "NotSupported"
+                    continue
+                current_time = time()
+                counters = tuple(process_io.get(field, 0) for field in PROCESS_IO_FIELDS)
+
+                prev = baseline.get(pid)
+                baseline[pid] = (starttime, counters, current_time)
+                if prev is None or prev[0] != starttime:  # 新进程(或pid已被复用)
+                    continue
+                interval = current_time - prev[2]
+                for i, field in enumerate(PROCESS_IO_FIELDS):
+                    process_io_rate[field] = (counters[i] - prev[1][i]) / interval if interval > 0 else 0.0
+
+            return result
+
+
+# 默认的批量IO速率计算实例
+process_io_rate_engine = ProcessIORateEngine()
+
+
+def calc_processes_io(pids, interval=calc_func_interval):
+    """
+    批量计算多个进程 /proc/[pid]/io 全部字段的速率
+    read_bytes/write_bytes 为实际磁盘IO, 与 rchar/wchar 的差值即为页缓存命中等不产生磁盘IO的部分
+    首次出现的进程统一只等待一次interval
+    """
+    pids = [int(pid) for pid in pids]
+    if interval and any(not process_io_rate_engine.has_baseline(pid) for pid in pids):
+        process_io_rate_engine.update(pids)
+        sleep(interval)
+    return process_io_rate_engine.update(pids)
 
+
+@wrap_process_exceptions
+def read_process_schedstat(pid):
+    """读取 /proc/[pid]/schedstat -> (运行时间ns, 在运行队列中等待CPU的时间ns, 调度次数) (需要内核开启 CONFIG_SCHED_INFO)"""
+    return tuple(int(value) for value in read_proc_file("/proc/{}/schedstat".format(pid)).split()[:3])
+
+
+def parse_ctxt_switches(status):
+    """解析 status 中的上下文切换次数 -> (主动, 被动)"""
+    nvcsw = nivcsw = None
+    for line in status.splitlines():
+        if line.startswith("voluntary_ctxt_switches"):
+            nvcsw = int(line.split()[1])
+        elif line.startswith("nonvoluntary_ctxt_switches"):
+            nivcsw = int(line.split()[1])
+    return nvcsw, nivcsw
+
+
+@wrap_process_exceptions
+def read_process_ctxt_switches(pid):
+    """读取 /proc/[pid]/status 中的上下文切换次数 -> (主动, 被动) (只是主线程的值, 进程的值见 read_thread_counters)"""
+    return parse_ctxt_switches(read_proc_file("/proc/{}/status".format(pid)))
+
+
+def read_task_file(path):
+    """直接读取线程文件 (线程数量可能很多, 使用 os.open/os.read 且不占用句柄池)"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        chunks = []
+        while True:
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                return "".join(chunks)
+            chunks.append(chunk)
+    finally:
+        os.close(fd)
+
+
+# 按线程读取的计数 - /proc/[pid] 下的 delayacct_blkio_ticks, schedstat, 上下文切换 只是主线程的值
+# blkio_ticks - stat 第42个字段 delayacct_blkio_ticks
+# run_time/run_delay/pcount - schedstat 的 运行时间ns, 在运行队列中等待CPU的时间ns, 调度次数
+# nvcsw/nivcsw - status 的 主动/被动 上下文切换次数
+THREAD_COUNTER_FIELDS = ("blkio_ticks", "run_time", "run_delay", "pcount", "nvcsw", "nivcsw")
+
+
+@wrap_process_exceptions
+def read_thread_counters(pid, proc_path="/proc"):
+    """
+    读取进程各线程的计数 -> {tid: (starttime, (THREAD_COUNTER_FIELDS 对应计数))}
+    读取期间退出的线程跳过, 内核不支持的字段(未开启 CONFIG_SCHED_INFO/delayacct)为None
+    """
+    task_path = "{}/{}/task".format(proc_path, pid)
+    if scandir is not None:
+        tids = [entry.name for entry in scandir(task_path)]
     else:
-        devc, devicenames = dev_args(devnames)
-        rc = lib.nethogsmonitor_loop_devices(
-            CALLBACK_FUNC_TYPE(network_activity_callback),
-            filter_arg,
-            devc,
-            devicenames,
-            ctypes.c_bool(False)
-        )
-
-    if rc != LoopStatus.OK:
-        print("nethogsmonitor loop returned {}".format(LoopStatus.MAP[rc]))
-    else:
-        print("exiting nethogsmonitor loop")
-
-
-def network_activity_callback(action, data):
-    """nethogs进程流量监控线程 - 回掉函数"""
-    global all_process_info_dict
-    if data.contents.pid in all_process_info_dict["watch_pid"]:
-        # 初始化一个新的进程网络监控数据,并替代原来的
-        process_net_data = {}
-        process_net_data["pid"] = data.contents.pid
-        process_net_data["uid"] = data.contents.uid
-        process_net_data["action"] = Action.MAP.get(action, "Unknown")
-        process_net_data["pid_name"] = data.contents.name
-        process_net_data["record_id"] = data.contents.record_id
-        process_net_data["time"] = datetime.datetime.now().strftime("%H:%M:%S")  # 这里获取的是本地时间
-        process_net_data["device"] = data.contents.device_name.decode("ascii")
-        process_net_data["sent_bytes"] = data.contents.sent_bytes
-        process_net_data["recv_bytes"] = data.contents.recv_bytes
-        process_net_data["sent_kbs"] = round(data.contents.sent_kbs, 2)
-        process_net_data["recv_kbs"] = round(data.contents.recv_kbs, 2)
-
-        all_process_info_dict["libnethogs_data"][str(data.contents.pid)] = process_net_data
-
-
-def init_nethogs_thread():
-    """nethogs进程流量监控线程 - 初始化"""
-    global all_process_info_dict
-    # 处理退出信号
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
-    # 调用动态链接库
-    all_process_info_dict["libnethogs"] = ctypes.CDLL(LIBRARY_NAME)
-    # 初始化并创建监控线程
-    monitor_thread = threading.Thread(
-        target=run_monitor_loop, args=(all_process_info_dict["libnethogs"],
-                                       [get_default_net_device()],)
-    )
-    all_process_info_dict["libnethogs_thread"] = monitor_thread
-    monitor_thread.start()
-    monitor_thread.join(0.5)
-
-    return
+        tids = os.listdir(task_path)
+
+    threads = {}
+    for tid in tids:
+        tid_path = task_path + "/" + tid
+        try:
+            t_stat = ProcessStat(read_task_file(tid_path + "/stat"))
+            try:
+                schedstat = tuple(int(value) for value in read_task_file(tid_path + "/schedstat").split()[:3])
+            except (OSError, IOError):  # 内核未开启 CONFIG_SCHED_INFO (线程是否退出由下面的 status 判断)
+                schedstat = (None, None, None)
+            ctxt_switches = parse_ctxt_switches(read_task_file(tid_path + "/status"))
+        except (OSError, IOError):  # 线程已退出
+            continue
+        threads[int(tid)] = (t_stat.starttime, (t_stat.delayacct_blkio_ticks,) + schedstat + ctxt_switches)
+    return threads
 
 
-def get_process_net_info(pid):
-    """获取进程的网络信息(基于nethogs)"""
-    global all_process_info_dict
+def sum_thread_counters(threads, prev_threads=None):
+    """
+    累加各线程的计数 -> (THREAD_COUNTER_FIELDS 对应的和, 内核不支持的字段为None)
+    传入 prev_threads 时累加各线程的增量 (新线程从0开始计算, 已退出线程不计入, 总和不会因线程退出而减少)
+    """
+    totals = [0] * len(THREAD_COUNTER_FIELDS)
+    for tid, (starttime, counters) in threads.items():
+        last = prev_threads.get(tid) if prev_threads else None
+        if last is not None and last[0] != starttime:  # tid已被复用
+            last = None
+        for index, current in enumerate(counters):
+            if current is None or totals[index] is None:
+                totals[index] = None
+            elif last is not None and last[1][index] is not None:
+                totals[index] += current - last[1][index]
+            else:
+                totals[index] += current
+    return tuple(totals)
+
+
+# 进程等待(stall)指标
+# blkio_delay      - 等待块设备IO的时间占比(%) (stat 第42个字段 delayacct_blkio_ticks, 需要开启 sysctl kernel.task_delayacct)
+# run_delay        - 在运行队列中等待CPU的时间占比(%) (schedstat 第2个字段)
+#                    (以上两项为各线程之和, 多线程进程可超过100%)
+# minflt/majflt    - 次缺页/主缺页(需要读磁盘) 次数/秒
+# nvcsw/nivcsw     - 主动(等待资源)/被动(时间片用完被抢占) 上下文切换次数/秒
+PROCESS_STALL_FIELDS = ("blkio_delay", "run_delay", "minflt", "majflt", "nvcsw", "nivcsw")
+
+
+class ProcessStallEngine(object):
+    """
+    多进程批量计算等待(stall)指标的速率 - 解释进程为什么慢, 而不只是用了多少CPU
+    每个进程每个tick读取一次 stat, 以及各线程的 stat/schedstat/status
+    (delayacct_blkio_ticks, schedstat 与上下文切换在 /proc/[pid] 下只是主线程的值, 按线程累加增量;
+     缺页次数为进程 stat 中的整个进程累计值)
+    """
+
+    def __init__(self):
+        self.baseline = {}  # pid -> (starttime, (minflt, majflt), {tid: (starttime, 线程计数)}, 时间)
+        self.lock = threading.Lock()  # 多线程同时调用时保护基线的 读取-计算-更新
+
+    def forget(self, pids):
+        """移除进程基线"""
+        with self.lock:
+            for pid in pids:
+                self.baseline.pop(int(pid), None)
+
+    def has_baseline(self, pid):
+        return int(pid) in self.baseline
+
+    def read_counters(self, pid):
+        """读取进程的等待计数 -> (starttime, (minflt, majflt), {tid: (starttime, 线程计数)})"""
+        p_stat = read_process_stat(pid)
+        return p_stat.starttime, (p_stat.minflt, p_stat.majflt), read_thread_counters(pid)
+
+    def update(self, pids):
+        """
+        计算一个tick内所有进程的等待指标
+        :return: {pid: {"blkio_delay", "run_delay", "minflt", "majflt", "nvcsw", "nivcsw", "error"}}
+                 blkio_delay/run_delay 为时间占比(%), 其余为 次/秒, 首次出现的进程(或内核不支持的字段)为None
+                 单个进程无权限或已退出时 error 为 "AccessDenied"/"NoSuchProcess", 不影响其他进程
+        """
+        with self.lock:
+            baseline = self.baseline
+            result = {}
+
+            for pid in pids:
+                pid = int(pid)
+                process_stall = dict.fromkeys(PROCESS_STALL_FIELDS)
+                process_stall["error"] = None
+                result[pid] = process_stall
+                try:
+                    starttime, faults, threads = self.read_counters(pid)
+                except NoSuchProcess:
+                    baseline.pop(pid, None)
+                    process_stall["error"] = "NoSuchProcess"
+                    continue
+                except AccessDenied:
+                    baseline.pop(pid, None)
+                    process_stall["error"] = "AccessDenied"
+                    continue
+                current_time = time()
+
+                prev = baseline.get(pid)
+                baseline[pid] = (starttime, faults, threads, current_time)
+                if prev is None or prev[0] != starttime:  # 新进程(或pid已被复用)
+                    continue
+                interval = current_time - prev[3]
+                if interval <= 0:
+                    continue
+                blkio_ticks, run_time, run_delay, pcount, nvcsw, nivcsw = sum_thread_counters(threads, prev[2])
+                deltas = (blkio_ticks, run_delay, faults[0] - prev[1][0], faults[1] - prev[1][1], nvcsw, nivcsw)
+                rates = [None if delta is None else delta / interval for delta in deltas]
+                if rates[0] is not None:
+                    rates[0] = round(rates[0] * 100.0 / CLOCK_TICKS, 2)
+                if rates[1] is not None:
+                    rates[1] = round(rates[1] / 10000000.0, 2)  # ns/s -> %
+                process_stall.update(zip(PROCESS_STALL_FIELDS, rates))
+
+            return result
+
+
+# 默认的批量等待指标计算实例
+process_stall_engine = ProcessStallEngine()
+
+
+def calc_processes_stall(pids, interval=calc_func_interval):
+    """
+    批量计算多个进程的等待指标 (块设备IO等待,运行队列等待,缺页,上下文切换)
+    首次出现的进程统一只等待一次interval
+    """
+    pids = [int(pid) for pid in pids]
+    if interval and any(not process_stall_engine.has_baseline(pid) for pid in pids):
+        process_stall_engine.update(pids)
+        sleep(interval)
+    return process_stall_engine.update(pids)
 
-    if not all_process_info_dict["libnethogs_thread_install"]:
-        all_process_info_dict["libnethogs_thread_install"] = is_libnethogs_install()
-        if not all_process_info_dict["libnethogs_thread_install"]:
-            print "Error : libnethogs is not installed!"
-            exit(-1)
 
-    all_process_info_dict["watch_pid"].add(int(pid))
-    if not all_process_info_dict["libnethogs_thread"]:
-        init_nethogs_thread()
+def get_processes_taskstats(pids, tgid=True):
+    """批量获取多个进程的CPU时间,IO及延迟统计(基于taskstats netlink, 不可用时退回/proc, 首次调用时才加载 taskstats)"""
+    from taskstats import get_processes_taskstats as get_taskstats
+    return get_taskstats(pids, tgid)
 
-    return all_process_info_dict["libnethogs_data"].get(str(pid), {})
+
+def get_process_net_info(pid):
+    """获取进程的网络信息(基于nethogs, 首次调用时才加载 nethogs_monitor)"""
+    from nethogs_monitor import get_process_net_info as get_nethogs_process_net_info
+    return get_nethogs_process_net_info(pid)
 
 
 def is_log_exist(path):
@@ -7,33 +7,122 @@
 主要包括
 - 总体CPU占用率
 - 总体内存占用率
+- 内存详细信息(/proc/meminfo 全部字段)及脏页增长,换入换出速度
 - 总体网络上下载速度
 - 各核心CPU占用率
+- 所有网卡的流量/包/错误/丢弃计数及速率(一次读取 /proc/net/dev)
 - 系统信息
 - 系统总内存
 - 系统启动时间
 - 系统平均负载
-- 系统磁盘占用
+- 系统调度统计(上下文切换,运行/阻塞进程数,软中断)
+- 系统磁盘占用(挂载表缓存, 并发statvfs, 超时挂载点标记为stale)
+- 系统磁盘IO(各块设备的IOPS,吞吐量,平均延迟,队列深度,使用率)
 
 reference   :   https://www.jianshu.com/p/deb0ed35c1c2
 reference   :   https://www.kernel.org/doc/Documentation/filesystems/proc.txt
 """
 
-from os import statvfs
+import os
+import Queue
+import select
+import threading
+from os import statvfs, sysconf
 from time import sleep, time
 
-from prcess_exception import wrap_process_exceptions
+from proc_file_pool import read_proc_file
 
 calc_func_interval = 2
 prev_cpu_work_time = 0
 prev_cpu_total_time = 0
 prev_cpu_time_by_cores = {}
-prev_net_receive_byte = 0
-prev_net_send_byte = 0
-prev_net_time = 0
+prev_net_data = {}  # 网卡 -> ((接收字节数, 发送字节数), 时间)
+
+# /proc/stat 快照 - 同一个tick内的所有CPU相关采集共用一次读取
+proc_stat_tick = 0.5  # 快照有效期(秒)
+proc_stat_snapshot = None
+
+# /proc/meminfo, /proc/vmstat 快照
+mem_snapshot = None
+prev_mem_snapshot = None
+
+# /proc/net/dev 快照
+net_dev_snapshot = None
+prev_net_dev_snapshot = None
+
+# /proc/diskstats 快照
+diskstats_snapshot = None
+prev_diskstats_snapshot = None
+disk_device_info = {}  # 块设备 -> 设备信息(分区,所属磁盘,dm名称)
+
+# calc_* 系列函数基线(prev_*)的锁 - 多线程同时调用时保护 读取-计算-更新基线 的过程 (首次初始化的sleep期间不持有)
+baseline_lock = threading.Lock()
+
+# statvfs 工作线程数与超时时间(秒)
+STATVFS_WORKERS = 8
+STATVFS_TIMEOUT = 2
+
+# 内存页大小(字节)
+PAGE_SIZE = sysconf("SC_PAGE_SIZE")
+
+
+class ProcStatSnapshot(object):
+    """/proc/stat 快照 (一次读取,解析出所有CPU相关采集需要的数据)"""
+
+    __slots__ = ("time", "cpu", "cpu_by_cores", "ctxt", "processes", "procs_running", "procs_blocked", "softirq")
+
+    def __init__(self, stat_data, snapshot_time):
+        self.time = snapshot_time
+        self.cpu = (0, 0)  # 总体CPU时间片 (total, work)
+        self.cpu_by_cores = {}  # 各核心CPU时间片 {cpuN: [total, work]}
+        self.ctxt = 0
+        self.processes = 0
+        self.procs_running = 0
+        self.procs_blocked = 0
+        self.softirq = 0
+
+        for line in stat_data.splitlines():
+            fields = line.split()
+            if not fields:
+                continue
+            name = fields[0]
+            if name.startswith("cpu"):
+                # user, nice, system, idle, iowait, irq, softirq, steal (guest/guest_nice 已包含在user/nice中)
+                cpu_time = map(int, fields[1:9])
+                total_time, work_time = sum(cpu_time), sum(cpu_time[:3])
+                if name == "cpu":
+                    self.cpu = (total_time, work_time)
+                else:
+                    self.cpu_by_cores[name] = [total_time, work_time]
+            elif name == "ctxt":
+                self.ctxt = int(fields[1])
+            elif name == "processes":
+                self.processes = int(fields[1])
+            elif name == "procs_running":
+                self.procs_running = int(fields[1])
+            elif name == "procs_blocked":
+                self.procs_blocked = int(fields[1])
+            elif name == "softirq":
+                self.softirq = int(fields[1])
+
+
+def read_proc_stat():
+    """读取 /proc/stat 并生成新的快照"""
+    global proc_stat_snapshot
+    proc_stat_snapshot = ProcStatSnapshot(read_proc_file("/proc/stat"), time())
+    return proc_stat_snapshot
+
+
+def get_proc_stat(max_age=None):
+    """获取当前tick的 /proc/stat 快照 (快照超过有效期才会重新读取)"""
+    if max_age is None:
+        max_age = proc_stat_tick
+    snapshot = proc_stat_snapshot
+    if snapshot is None or time() - snapshot.time >= max_age:
+        snapshot = read_proc_stat()
+    return snapshot
 
 
-@wrap_process_exceptions
 def get_total_cpu_time():
     """获取总cpu时间 - /proc/stat"""
 
@@ -121,65 +210,169 @@ def get_total_cpu_time():
     # sum everything up (except guest and guestnice since they are already included
     # in user and nice, see http://unix.stackexchange.com/q/178045/20626)
 
-    with open("/proc/stat", "r") as cpu_stat:
-        total_cpu_time = cpu_stat.readline().replace('cpu', '').strip()
-        user, nice, system, idle, iowait, irq, softirq, steal, guest, guestnice = map(int, total_cpu_time.split(' '))
-        return user + nice + system + idle + iowait + irq + softirq + steal, user + nice + system
+    return get_proc_stat().cpu
 
 
 def calc_cpu_percent(interval=calc_func_interval):
     """计算CPU总占用率 (返回的是百分比)"""
     # 两次调用之间的间隔最好不要小于2s,否则可能会为0
+    from metric_sampler import get_sampled_metric
+    sampled = get_sampled_metric(("cpu_percent",), wait=interval)
+    if sampled is not None:  # 后台采样线程运行中,直接返回最近一次的采样结果
+        return sampled[0]
+
     global prev_cpu_work_time, prev_cpu_total_time
-    if prev_cpu_work_time == 0:  # 未初始化
-        prev_cpu_total_time, prev_cpu_work_time = get_total_cpu_time()
+    with baseline_lock:
+        initialized = prev_cpu_work_time != 0
+        if not initialized:
+            prev_cpu_total_time, prev_cpu_work_time = get_total_cpu_time()
+    if not initialized:
         sleep(interval)
-    current_total_time, current_work_time = get_total_cpu_time()
-    cpu_percent = (current_work_time - prev_cpu_work_time) * 100.0 / (current_total_time - prev_cpu_total_time)
-    prev_cpu_total_time, prev_cpu_work_time = current_total_time, current_work_time
+    with baseline_lock:
+        current_total_time, current_work_time = get_total_cpu_time()
+        if current_total_time == prev_cpu_total_time:  # 与上次调用处于同一个tick
+            return 0.0
+        cpu_percent = (current_work_time - prev_cpu_work_time) * 100.0 / (current_total_time - prev_cpu_total_time)
+        prev_cpu_total_time, prev_cpu_work_time = current_total_time, current_work_time
     return cpu_percent
 
 
-@wrap_process_exceptions
 def get_cpu_total_time_by_cores():
     """获取各核心cpu时间 - /proc/stat"""
-    cpu_total_times = {}
-
-    with open("/proc/stat", "r") as cpu_stat:
-        for line in cpu_stat:
-            if line.startswith("cpu"):
-                cpu_name = line.split(' ')[0].strip()
-                if cpu_name != "cpu":
-                    user, nice, system, idle, iowait, irq, softirq, steal, guest, guestnice = \
-                        map(int, line.split(' ')[1:])
-                    cpu_total_times[cpu_name] = [user + nice + system + idle + iowait + irq + softirq + steal,
-                                                 user + nice + system]
-
-    return cpu_total_times
+    return get_proc_stat().cpu_by_cores
 
 
 def calc_cpu_percent_by_cores(interval=calc_func_interval):
     """计算CPU各核占用率 (返回的是百分比)"""
 
+    from metric_sampler import get_sampled_metric
+    sampled = get_sampled_metric(("cpu_percent_by_cores",), wait=interval)
+    if sampled is not None:  # 后台采样线程运行中,直接返回最近一次的采样结果
+        return sampled[0]
+
     cpu_percent_by_cores = {}
     global prev_cpu_time_by_cores
-    if not prev_cpu_time_by_cores:  # 未初始化
-        prev_cpu_time_by_cores = get_cpu_total_time_by_cores()
+    with baseline_lock:
+        initialized = bool(prev_cpu_time_by_cores)
+        if not initialized:
+            prev_cpu_time_by_cores = get_cpu_total_time_by_cores()
+    if not initialized:
         sleep(interval)
-    current_cpu_time_by_cores = get_cpu_total_time_by_cores()
-
-    for cpu_name in current_cpu_time_by_cores.keys():
-        cpu_percent_by_cores[cpu_name] = \
-            (current_cpu_time_by_cores[cpu_name][1] - prev_cpu_time_by_cores[cpu_name][1]) * 100.0 / \
-            (current_cpu_time_by_cores[cpu_name][0] - prev_cpu_time_by_cores[cpu_name][0])
-    prev_cpu_time_by_cores = current_cpu_time_by_cores
+    with baseline_lock:
+        current_cpu_time_by_cores = get_cpu_total_time_by_cores()
+        for cpu_name in current_cpu_time_by_cores.keys():
+            if cpu_name not in prev_cpu_time_by_cores:  # CPU热插拔
+                continue
+            if current_cpu_time_by_cores[cpu_name][0] == prev_cpu_time_by_cores[cpu_name][0]:  # 同一个tick
+                cpu_percent_by_cores[cpu_name] = 0.0
+                continue
+            cpu_percent_by_cores[cpu_name] = \
+                (current_cpu_time_by_cores[cpu_name][1] - prev_cpu_time_by_cores[cpu_name][1]) * 100.0 / \
+                (current_cpu_time_by_cores[cpu_name][0] - prev_cpu_time_by_cores[cpu_name][0])
+        prev_cpu_time_by_cores = current_cpu_time_by_cores
 
     return cpu_percent_by_cores
 
 
-@wrap_process_exceptions
+class MemSnapshot(object):
+    """/proc/meminfo 与 /proc/vmstat 快照 (每个tick各读取一次)"""
+
+    __slots__ = ("time", "meminfo", "vmstat")
+
+    def __init__(self, meminfo_data, vmstat_data, snapshot_time):
+        self.time = snapshot_time
+        self.meminfo = {}  # 字段 -> 字节数 (HugePages_* 等无单位的字段为数量)
+        self.vmstat = {}  # 字段 -> 计数
+
+        for line in meminfo_data.splitlines():
+            name, _, value = line.partition(":")
+            value = value.split()
+            if not value:
+                continue
+            if len(value) > 1 and value[1] == "kB":
+                self.meminfo[name] = int(value[0]) * 1024
+            else:
+                self.meminfo[name] = int(value[0])
+
+        for line in vmstat_data.splitlines():
+            fields = line.split()
+            if len(fields) == 2:
+                self.vmstat[fields[0]] = int(fields[1])
+
+
+def read_mem_snapshot():
+    """读取 /proc/meminfo, /proc/vmstat 并生成新的快照"""
+    global mem_snapshot
+    mem_snapshot = MemSnapshot(read_proc_file("/proc/meminfo"), read_proc_file("/proc/vmstat"), time())
+    return mem_snapshot
+
+
+def get_mem_snapshot(max_age=None):
+    """获取当前tick的内存快照 (快照超过有效期才会重新读取)"""
+    if max_age is None:
+        max_age = proc_stat_tick
+    snapshot = mem_snapshot
+    if snapshot is None or time() - snapshot.time >= max_age:
+        snapshot = read_mem_snapshot()
+    return snapshot
+
+
+def get_meminfo():
+    """获取 /proc/meminfo 全部字段 {字段: 字节数} (HugePages_* 为页数)"""
+    return dict(get_mem_snapshot().meminfo)
+
+
+def calc_mem_rates_between(prev, current):
+    """
+    根据前后两次内存快照计算内存速率
+    :return: {"dirty_growth": 脏页增长速度, "writeback_growth": 回写页增长速度,
+              "swap_in": 换入速度, "swap_out": 换出速度} (单位 Byte/s)
+    """
+    interval = current.time - prev.time
+    if interval <= 0:
+        return {"dirty_growth": 0.0, "writeback_growth": 0.0, "swap_in": 0.0, "swap_out": 0.0}
+
+    def meminfo_rate(name):
+        return (current.meminfo.get(name, 0) - prev.meminfo.get(name, 0)) / interval
+
+    def vmstat_rate(name):  # 页数 -> 字节数
+        return (current.vmstat.get(name, 0) - prev.vmstat.get(name, 0)) * PAGE_SIZE / interval
+
+    return {
+        "dirty_growth": meminfo_rate("Dirty"),
+        "writeback_growth": meminfo_rate("Writeback"),
+        "swap_in": vmstat_rate("pswpin"),
+        "swap_out": vmstat_rate("pswpout")
+    }
+
+
+def calc_mem_rates(interval=calc_func_interval):
+    """计算内存速率 (脏页/回写页增长速度, 换入/换出速度, 单位 Byte/s)"""
+    from metric_sampler import get_sampled_metric
+    sampled = get_sampled_metric(("mem_rates",), wait=interval)
+    if sampled is not None:  # 后台采样线程运行中,直接返回最近一次的采样结果
+        return sampled[0]
+
+    global prev_mem_snapshot
+    with baseline_lock:
+        initialized = prev_mem_snapshot is not None
+        if not initialized:
+            prev_mem_snapshot = read_mem_snapshot()
+    if not initialized:
+        sleep(interval)
+
+    with baseline_lock:
+        current_mem_snapshot = get_mem_snapshot()
+        if current_mem_snapshot is prev_mem_snapshot:  # 与上次调用处于同一个tick
+            current_mem_snapshot = read_mem_snapshot()
+        mem_rates = calc_mem_rates_between(prev_mem_snapshot, current_mem_snapshot)
+        prev_mem_snapshot = current_mem_snapshot
+
+    return mem_rates
+
+
 def get_mem_info():
-    """获取内存信息 - /proc/meminfo"""
+    """获取内存信息 - /proc/meminfo -> [MemTotal, MemFree, MemAvailable] (单位KB)"""
 
     """
     /proc/meminfo
@@ -376,12 +569,12 @@ def get_mem_info():
         (x86 with CONFIG_X86_64 and CONFIG_X86_DIRECT_GBPAGES enabled.)
     """
 
-    with open("/proc/meminfo", "r") as mem_info:
-        MemTotal = mem_info.readline().split(":")[1].strip().strip("kB")
-        MemFree = mem_info.readline().split(":")[1].strip().strip("kB")
-        MemAvailable = mem_info.readline().split(":")[1].strip().strip("kB")
-        # 只需要前三行
-        return map(int, [MemTotal, MemFree, MemAvailable])
+    meminfo = get_mem_snapshot().meminfo
+    MemTotal = meminfo["MemTotal"]
+    MemFree = meminfo["MemFree"]
+    # MemAvailable 自 Linux 3.14 起才有, 旧内核以 MemFree + Buffers + Cached 近似
+    MemAvailable = meminfo.get("MemAvailable", MemFree + meminfo.get("Buffers", 0) + meminfo.get("Cached", 0))
+    return [MemTotal // 1024, MemFree // 1024, MemAvailable // 1024]
 
 
 def calc_mem_percent():
@@ -396,7 +589,98 @@ def calc_mem_percent():
     return mem_percent
 
 
-@wrap_process_exceptions
+# /proc/net/dev 各网卡统计字段 (接收8项, 发送8项)
+NET_DEV_FIELDS = ("rx_bytes", "rx_packets", "rx_errs", "rx_drop", "rx_fifo", "rx_frame", "rx_compressed",
+                  "rx_multicast", "tx_bytes", "tx_packets", "tx_errs", "tx_drop", "tx_fifo", "tx_colls",
+                  "tx_carrier", "tx_compressed")
+
+
+class NetDevSnapshot(object):
+    """/proc/net/dev 快照 (一次读取,解析出所有网卡的计数器)"""
+
+    __slots__ = ("time", "devices")
+
+    def __init__(self, net_dev_data, snapshot_time):
+        self.time = snapshot_time
+        self.devices = {}  # 网卡 -> (NET_DEV_FIELDS 对应的16个计数器)
+        for line in net_dev_data.splitlines()[2:]:  # 跳过两行表头
+            name, _, counters = line.partition(":")
+            counters = counters.split()
+            if len(counters) == len(NET_DEV_FIELDS):
+                self.devices[name.strip()] = tuple(map(int, counters))
+
+    def get(self, device, field):
+        """某一网卡的某项计数器"""
+        return self.devices[device][NET_DEV_FIELDS.index(field)]
+
+
+def read_net_dev_snapshot():
+    """读取 /proc/net/dev 并生成新的快照"""
+    global net_dev_snapshot
+    net_dev_snapshot = NetDevSnapshot(read_proc_file("/proc/net/dev"), time())
+    return net_dev_snapshot
+
+
+def get_net_dev_snapshot(max_age=None):
+    """获取当前tick的 /proc/net/dev 快照 (快照超过有效期才会重新读取)"""
+    if max_age is None:
+        max_age = proc_stat_tick
+    snapshot = net_dev_snapshot
+    if snapshot is None or time() - snapshot.time >= max_age:
+        snapshot = read_net_dev_snapshot()
+    return snapshot
+
+
+def get_all_net_dev_data():
+    """获取所有网卡的全部计数器 {网卡: {字段: 计数}}"""
+    return dict((device, dict(zip(NET_DEV_FIELDS, counters)))
+                for device, counters in get_net_dev_snapshot().devices.items())
+
+
+def calc_net_rates_between(prev, current):
+    """
+    根据前后两次 /proc/net/dev 快照计算所有网卡的速率
+    :return: {网卡: {字段: 每秒变化量}} (字节/包/错误/丢弃数每秒, 两次快照中都存在的网卡)
+    """
+    interval = current.time - prev.time
+    net_rates = {}
+    for device, counters in current.devices.items():
+        prev_counters = prev.devices.get(device)
+        if prev_counters is None:  # 新出现的网卡
+            continue
+        if interval <= 0:
+            net_rates[device] = dict.fromkeys(NET_DEV_FIELDS, 0.0)
+        else:
+            net_rates[device] = dict((field, (counters[i] - prev_counters[i]) / interval)
+                                     for i, field in enumerate(NET_DEV_FIELDS))
+    return net_rates
+
+
+def calc_all_net_rates(interval=calc_func_interval):
+    """计算所有网卡的速率 {网卡: {字段: 每秒变化量}} (一次读取 /proc/net/dev)"""
+    from metric_sampler import get_sampled_metric
+    sampled = get_sampled_metric(("net_rates",), wait=interval)
+    if sampled is not None:  # 后台采样线程运行中,直接返回最近一次的采样结果
+        return sampled[0]
+
+    global prev_net_dev_snapshot
+    with baseline_lock:
+        initialized = prev_net_dev_snapshot is not None
+        if not initialized:
+            prev_net_dev_snapshot = read_net_dev_snapshot()
+    if not initialized:
+        sleep(interval)
+
+    with baseline_lock:
+        current_net_dev_snapshot = get_net_dev_snapshot()
+        if current_net_dev_snapshot is prev_net_dev_snapshot:  # 与上次调用处于同一个tick
+            current_net_dev_snapshot = read_net_dev_snapshot()
+        net_rates = calc_net_rates_between(prev_net_dev_snapshot, current_net_dev_snapshot)
+        prev_net_dev_snapshot = current_net_dev_snapshot
+
+    return net_rates
+
+
 def get_all_net_device():
     """获取所有网卡(不包括本地回环)"""
 
@@ -409,36 +693,29 @@ def get_all_net_device():
     # ppp0      -   ppp拨号
     # tpp0      -   ...
 
-    devices = []
-    with open("/proc/net/dev", "r") as net_dev:
-        for line in net_dev:
-            if not line.count("lo:") and line.count(":"):
-                devices.append(line.split(":")[0].strip())
-
-    return devices
+    return [device for device in get_net_dev_snapshot().devices if device != "lo"]
 
 
 def get_default_net_device():
     """获取默认网卡 - 默认选取流量最大的网卡作为默认监控网卡(本地回环除外)"""
-    devices = get_all_net_device()
+    devices = get_net_dev_snapshot().devices
     default_net_device = 'eth0'
 
     if default_net_device in devices:
         return default_net_device
 
-    else:  # 获取流量最大的网卡作为默认网卡
-        temp_d = ''
-        max_byte = -1
-        for device_name in devices:
-            if max_byte < sum(get_net_dev_data(device_name)):
-                max_byte = get_net_dev_data(device_name)
-                temp_d = device_name
-        return temp_d
+    # 获取流量最大的网卡作为默认网卡
+    temp_d = ''
+    max_byte = -1
+    for device_name, counters in devices.items():
+        if device_name != "lo" and max_byte < counters[0] + counters[8]:
+            max_byte = counters[0] + counters[8]
+            temp_d = device_name
+    return temp_d
 
 
-@wrap_process_exceptions
 def get_net_dev_data(device):
-    """获取系统网络数据(某一网卡) -  /proc/net/dev"""
+    """获取系统网络数据(某一网卡) -  /proc/net/dev -> (接收字节数, 发送字节数)"""
 
     """
     The dev pseudo-file contains network device status information.  This gives the number of received and sent packets, 
@@ -453,39 +730,46 @@ def get_net_dev_data(device):
         tap0:    7714      81    0    0    0     0          0         0     7714      81    0    0    0     0       0          0
 
     """
-    receive_bytes = -1
-    send_bytes = -1
-    with open("/proc/net/dev", "r") as net_dev:
-        for line in net_dev:
-            if line.count(device):
-                dev_data = map(int, filter(lambda x: x, line.split(":", 2)[1].strip().split(" ")))
-                receive_bytes += dev_data[0]
-                send_bytes += dev_data[8]
-
-    return receive_bytes, send_bytes
+    counters = get_net_dev_snapshot().devices.get(device)
+    if counters is None:  # 网卡不存在
+        return 0, 0
+    return counters[0], counters[8]
 
 
-@wrap_process_exceptions
-def calc_net_speed(device_name=get_default_net_device(), interval=calc_func_interval):
+def calc_net_speed(device_name=None, interval=calc_func_interval):
     """
-    计算某一网卡的网络速度
+    计算某一网卡的网络速度 (device_name 为空时使用默认网卡)
     :return: [上传速度,下载速度] (单位为Kbps)
     """
-    global prev_net_receive_byte, prev_net_send_byte, prev_net_time
-    if prev_net_receive_byte == 0:  # 未初始化
-        prev_net_receive_byte, prev_net_send_byte = get_net_dev_data(device_name)
-        prev_net_time = time()
+    if device_name is None:
+        device_name = get_default_net_device()
+    from metric_sampler import get_sampled_metric
+    sampled = get_sampled_metric(("net_speed", device_name), wait=interval)
+    if sampled is not None:  # 后台采样线程运行中,直接返回最近一次的采样结果
+        return sampled[0]
+
+    global prev_net_data
+    with baseline_lock:
+        initialized = device_name in prev_net_data
+        if not initialized:  # 未初始化(每个网卡独立的基线)
+            snapshot = read_net_dev_snapshot()
+            prev_net_data[device_name] = get_net_dev_data(device_name), snapshot.time
+    if not initialized:
         sleep(interval)
-    current_net_receive_byte, current_net_send_byte = get_net_dev_data(device_name)
-    current_net_time = time()
-    download_speed = (current_net_receive_byte - prev_net_receive_byte) / 1024.0 / (current_net_time - prev_net_time)
-    upload_speed = (current_net_send_byte - prev_net_send_byte) / 1024.0 / (current_net_time - prev_net_time)
-    prev_net_receive_byte, prev_net_send_byte = current_net_receive_byte, current_net_send_byte
-    prev_net_time = current_net_time
+    with baseline_lock:
+        snapshot = get_net_dev_snapshot()
+        (prev_net_receive_byte, prev_net_send_byte), prev_net_time = prev_net_data[device_name]
+        if snapshot.time == prev_net_time:  # 与上次调用处于同一个tick
+            snapshot = read_net_dev_snapshot()
+        current_net_receive_byte, current_net_send_byte = get_net_dev_data(device_name)
+        current_net_time = snapshot.time
+        download_speed = \
+            (current_net_receive_byte - prev_net_receive_byte) / 1024.0 / (current_net_time - prev_net_time)
+        upload_speed = (current_net_send_byte - prev_net_send_byte) / 1024.0 / (current_net_time - prev_net_time)
+        prev_net_data[device_name] = (current_net_receive_byte, current_net_send_byte), current_net_time
     return download_speed, upload_speed
 
 
-@wrap_process_exceptions
 def get_cpu_info():
     """系统CPU信息 - /proc/cpuinfo"""
 
@@ -516,7 +800,6 @@ def get_cpu_info():
     return result
 
 
-@wrap_process_exceptions
 def get_sys_info():
     """系统信息 - /proc/version"""
 
@@ -538,17 +821,11 @@ def get_sys_info():
     return sys_info
 
 
-@wrap_process_exceptions
 def get_sys_total_mem():
-    """获取总内存大小 - /proc/meminfo"""
+    """获取总内存大小(KB) - /proc/meminfo"""
+    return get_mem_snapshot().meminfo["MemTotal"] // 1024
 
-    with open("/proc/meminfo", "r") as mem_info:
-        MemTotal = mem_info.readline().split(":")[1].strip().strip("kB")
 
-    return MemTotal
-
-
-@wrap_process_exceptions
 def get_sys_loadavg():
     """获取系统平均负载 - /proc/loadavg"""
 
@@ -572,7 +849,18 @@ def get_sys_loadavg():
     return la
 
 
-@wrap_process_exceptions
+def get_sys_sched_info():
+    """获取系统调度统计 - /proc/stat (上下文切换次数,fork次数,运行/阻塞进程数,软中断总数)"""
+    snapshot = get_proc_stat()
+    return {
+        "ctxt": snapshot.ctxt,
+        "processes": snapshot.processes,
+        "procs_running": snapshot.procs_running,
+        "procs_blocked": snapshot.procs_blocked,
+        "softirq": snapshot.softirq
+    }
+
+
 def get_sys_uptime():
     """获取系统运行时间 - /proc/uptime"""
 
@@ -599,37 +887,169 @@ def get_sys_uptime():
     return ut
 
 
-@wrap_process_exceptions
-def get_disk_stat(style='G'):
-    """获取磁盘占用情况"""
+class MountTable(object):
+    """
+    挂载表缓存 - /proc/mounts
+    挂载表变化时内核会在 /proc/mounts 上产生 POLLPRI|POLLERR 事件, 只有此时才重新读取
+    """
+
+    def __init__(self, mounts_path="/proc/mounts"):
+        self.mounts_path = mounts_path
+        self.fd = None
+        self.poller = None
+        self.mount_points = None  # 挂载点 -> (设备, 文件系统, 挂载选项)
+        self.lock = threading.Lock()
+
+    def changed(self):
+        """挂载表是否已变化 (需持有锁)"""
+        if self.fd is None:
+            self.fd = os.open(self.mounts_path, os.O_RDONLY)
+            self.poller = select.poll()
+            self.poller.register(self.fd, select.POLLPRI | select.POLLERR)
+            return True
+        return bool(self.poller.poll(0))
+
+    def read(self):
+        """读取挂载表 (需持有锁)"""
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        chunks = []
+        while True:
+            chunk = os.read(self.fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+
+        mount_points = {}
+        for line in "".join(chunks).splitlines():
+            spl = line.split()
+            if len(spl) < 4:
+                continue
+            device, mp, typ, opts = spl[0:4]
+            opts = opts.split(',')
+            mount_points[mp] = (device, typ, opts)
+        return mount_points
+
+    def get(self):
+        """获取挂载表 {挂载点: (设备, 文件系统, 挂载选项)}"""
+        with self.lock:
+            if self.changed() or self.mount_points is None:
+                self.mount_points = self.read()
+            return self.mount_points
+
+    def close(self):
+        with self.lock:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+                self.poller = None
+                self.mount_points = None
+
+
+class StatvfsJob(object):
+    """一次 statvfs 调用"""
+
+    __slots__ = ("mount_point", "done", "result", "start_time")
+
+    def __init__(self, mount_point):
+        self.mount_point = mount_point
+        self.done = threading.Event()
+        self.result = None  # statvfs 结果, 失败时为异常
+        self.start_time = time()
 
-    # statvfs() http://www.runoob.com/python/os-statvfs.html
-    # reference pydf - https://github.com/k4rtik/pydf/tree/c59c16df1d1086d03f8948338238bf380431deb9
-    disk_stat = []
 
-    def get_all_mount_points():
-        """获取所有挂载点 - /proc/mounts"""
+class StatvfsPool(object):
+    """
+    statvfs 工作线程池
+    - 所有挂载点并发 statvfs, 整体等待时间不超过超时时间
+    - 超时的挂载点(如NFS服务器无响应)标记为stale, 其未完成的 statvfs 不会重复提交
+    - 卡住的工作线程不计入线程池大小, 会补充新的工作线程, 不影响其他挂载点
+    """
 
+    def __init__(self, workers=STATVFS_WORKERS, timeout=STATVFS_TIMEOUT):
+        self.workers = workers
+        self.timeout = timeout
+        self.tasks = Queue.Queue()
+        self.lock = threading.Lock()
+        self.pending = {}  # 挂载点 -> 未完成的 StatvfsJob
+        self.hung = set()  # 超时仍未完成的挂载点
+        self.threads = 0
+
+    def worker(self):
+        while True:
+            job = self.tasks.get()
+            try:
+                job.result = statvfs(job.mount_point)
+            except (OSError, IOError) as e:
+                job.result = e
+            with self.lock:
+                self.pending.pop(job.mount_point, None)
+                self.hung.discard(job.mount_point)
+                job.done.set()
+                if self.threads > self.workers + len(self.hung):  # 卡住期间补充的线程已多余
+                    self.threads -= 1
+                    return
+
+    def submit(self, mount_point):
+        """提交 statvfs (该挂载点已有未完成的调用时直接返回该调用)"""
+        with self.lock:
+            job = self.pending.get(mount_point)
+            if job is None:
+                job = self.pending[mount_point] = StatvfsJob(mount_point)
+                self.tasks.put(job)
+            while self.threads < min(self.workers, len(self.pending)) + len(self.hung):
+                thread = threading.Thread(target=self.worker, name="Watch_Dogs-Statvfs")
+                thread.daemon = True
+                thread.start()
+                self.threads += 1
+            return job
+
+    def statvfs(self, mount_points, timeout=None):
         """
-        /proc/mounts
-    
-        Before kernel 2.4.19, this file was a list of all the filesystems currently mounted on the system.  
-        With the introduction of per-process mount namespaces in Linux 2.4.19 (see mount_namespaces(7)), this file became a link
-        to /proc/self/mounts, which lists the mount points of the process's own mount namespace.  
-        The format of this file is documented in fstab(5).
+        并发获取多个挂载点的 statvfs
+        :return: {挂载点: statvfs结果}, 超时(stale)的挂载点为 None, 调用失败的挂载点不在结果中
         """
+        if timeout is None:
+            timeout = self.timeout
+        deadline = time() + timeout
+        jobs = [self.submit(mount_point) for mount_point in mount_points]
 
-        mount_points = {}
-        with open("/proc/mounts", "r") as mounts:
-            for line in mounts.readlines():
-                spl = line.split()
-                if len(spl) < 4:
-                    continue
-                device, mp, typ, opts = spl[0:4]
-                opts = opts.split(',')
-                mount_points[mp] = (device, typ, opts)
+        res = {}
+        for job in jobs:
+            if not job.done.wait(max(deadline - time(), 0)) and not job.done.is_set():
+                with self.lock:
+                    if not job.done.is_set():
+                        self.hung.add(job.mount_point)
+                res[job.mount_point] = None
+            elif not isinstance(job.result, EnvironmentError):
+                res[job.mount_point] = job.result
+        return res
 
-        return mount_points
+    def get_stale(self):
+        """获取当前卡住的挂载点 {挂载点: 已等待秒数}"""
+        with self.lock:
+            return dict((mount_point, time() - self.pending[mount_point].start_time)
+                        for mount_point in self.hung if mount_point in self.pending)
+
+
+# 默认挂载表缓存与 statvfs 线程池 (首次使用时才打开文件/创建线程)
+mount_table = MountTable()
+statvfs_pool = StatvfsPool()
+
+
+def get_stale_mount_points():
+    """获取 statvfs 超时的挂载点 {挂载点: 已等待秒数}"""
+    return statvfs_pool.get_stale()
+
+
+def get_disk_stat(style='G', timeout=None):
+    """
+    获取磁盘占用情况
+    挂载表缓存, 各挂载点并发 statvfs, 超时(stale)的挂载点大小与使用率为 None
+    """
+
+    # statvfs() http://www.runoob.com/python/os-statvfs.html
+    # reference pydf - https://github.com/k4rtik/pydf/tree/c59c16df1d1086d03f8948338238bf380431deb9
+    disk_stat = []
 
     def is_remote_fs(fs):
         """test if fs (as type) is a remote one"""
@@ -647,17 +1067,27 @@ def get_disk_stat(style='G'):
 
         return fs.lower() in ["tmpfs", "devpts", "devtmpfs", "proc", "sysfs", "usbfs", "devfs", "fdescfs", "linprocfs"]
 
-    mp = get_all_mount_points()
+    mp = mount_table.get()
+    # 过滤掉非物理磁盘
+    mount_points = [mount_point for mount_point, (device, fstype, opts) in mp.items() if not is_special_fs(fstype)]
+    disk_status_list = statvfs_pool.statvfs(mount_points, timeout)
 
-    for mount_point in mp.keys():
-        device, fstype, opts = mp[mount_point]
+    # 设置返回结果单位(默认为G)
+    style_size = 1024.0 ** 3
+    if style == 'M':
+        style_size = 1024.0 ** 2
+    elif style == 'T':
+        style_size = 1024.0 ** 4
 
-        # 过滤掉非物理磁盘
-        if is_special_fs(fstype):
+    for mount_point in mount_points:
+        if mount_point not in disk_status_list:  # statvfs 失败
             continue
-        try:
-            disk_status = statvfs(mount_point)
-        except (OSError, IOError):
+        device, fstype, opts = mp[mount_point]
+        disk_status = disk_status_list[mount_point]
+
+        # statvfs 超时(如NFS服务器无响应), 大小未知
+        if disk_status is None:
+            disk_stat.append((device, fstype, None, None, None, mount_point))
             continue
 
         # 处理磁盘数据
@@ -676,13 +1106,6 @@ def get_disk_stat(style='G'):
 
         used_percent = round(used * 100.0 / total, 2)
 
-        # 设置返回结果单位(默认为G)
-        style_size = 1024.0 ** 3
-        if style == 'M':
-            style_size = 1024.0 ** 2
-        elif style == 'T':
-            style_size = 1024.0 ** 4
-
         # 磁盘状态 : 设备, 文件系统, 总大小, 已用大小, 使用率, 挂载点
         disk_stat.append(
             (device,
@@ -694,3 +1117,131 @@ def get_disk_stat(style='G'):
         )
 
     return disk_stat
+
+
+# /proc/diskstats 各设备统计字段 (第4-14个字段, 4.18+内核还有 discard/flush 字段, 这里不使用)
+DISK_STATS_FIELDS = ("reads", "reads_merged", "sectors_read", "read_ticks", "writes", "writes_merged",
+                     "sectors_written", "write_ticks", "in_flight", "io_ticks", "time_in_queue")
+
+# /proc/diskstats 中的扇区大小固定为512字节(与设备实际扇区大小无关)
+DISK_SECTOR_SIZE = 512
+
+
+class DiskStatsSnapshot(object):
+    """/proc/diskstats 快照 (一次读取,解析出所有块设备的计数器)"""
+
+    __slots__ = ("time", "devices")
+
+    def __init__(self, diskstats_data, snapshot_time):
+        self.time = snapshot_time
+        self.devices = {}  # 设备 -> (DISK_STATS_FIELDS 对应的11个计数器)
+        for line in diskstats_data.splitlines():
+            fields = line.split()
+            if len(fields) >= 14:
+                self.devices[fields[2]] = tuple(map(int, fields[3:14]))
+
+
+def read_diskstats_snapshot():
+    """读取 /proc/diskstats 并生成新的快照"""
+    global diskstats_snapshot
+    diskstats_snapshot = DiskStatsSnapshot(read_proc_file("/proc/diskstats"), time())
+    return diskstats_snapshot
+
+
+def get_diskstats_snapshot(max_age=None):
+    """获取当前tick的 /proc/diskstats 快照 (快照超过有效期才会重新读取)"""
+    if max_age is None:
+        max_age = proc_stat_tick
+    snapshot = diskstats_snapshot
+    if snapshot is None or time() - snapshot.time >= max_age:
+        snapshot = read_diskstats_snapshot()
+    return snapshot
+
+
+def get_disk_device_info(device):
+    """
+    获取块设备信息 - /sys/block, /sys/class/block (结果缓存, 设备名不变信息就不变)
+    :return: {"partition": 是否为分区, "disk": 所属磁盘, "name": 显示名称(device-mapper设备为dm名称)}
+    """
+    info = disk_device_info.get(device)
+    if info is not None:
+        return info
+
+    sys_name = device.replace("/", "!")  # sysfs 中以 ! 代替设备名中的 / (如 cciss/c0d0)
+    sys_path = "/sys/class/block/{}".format(sys_name)
+    partition = os.path.exists(sys_path + "/partition")
+    disk = device
+    if partition:  # 分区的上级目录为所属磁盘
+        disk = os.path.basename(os.path.dirname(os.path.realpath(sys_path))).replace("!", "/")
+    name = device
+    try:
+        with open(sys_path + "/dm/name", "r") as dm_name:
+            name = dm_name.read().strip() or device
+    except (OSError, IOError):  # 不是device-mapper设备
+        pass
+
+    info = {"partition": partition, "disk": disk, "name": name}
+    disk_device_info[device] = info
+    return info
+
+
+def calc_disk_io_between(prev, current):
+    """
+    根据前后两次 /proc/diskstats 快照计算所有块设备的IO速率
+    :return: {设备: {"read_iops", "write_iops", "read_MBs", "write_MBs", "read_await", "write_await", "await",
+                     "queue_depth", "util", "partition", "disk", "name"}}
+             await单位为ms/次, util为百分比; 两次快照中都存在的设备
+    """
+    interval = current.time - prev.time
+    disk_io = {}
+    for device, counters in current.devices.items():
+        prev_counters = prev.devices.get(device)
+        if prev_counters is None:  # 新出现的设备
+            continue
+        delta = [c - p for c, p in zip(counters, prev_counters)]
+        reads, writes = delta[0], delta[4]
+
+        device_io = dict(get_disk_device_info(device))
+        if interval <= 0:
+            device_io.update(dict.fromkeys(("read_iops", "write_iops", "read_MBs", "write_MBs", "read_await",
+                                            "write_await", "await", "queue_depth", "util"), 0.0))
+        else:
+            device_io["read_iops"] = reads / interval
+            device_io["write_iops"] = writes / interval
+            # 注意,这里为了计算磁盘的IO,除以的数字是1000而不是1024
+            device_io["read_MBs"] = delta[2] * DISK_SECTOR_SIZE / 1000. ** 2 / interval
+            device_io["write_MBs"] = delta[6] * DISK_SECTOR_SIZE / 1000. ** 2 / interval
+            device_io["read_await"] = delta[3] * 1.0 / reads if reads else 0.0
+            device_io["write_await"] = delta[7] * 1.0 / writes if writes else 0.0
+            device_io["await"] = (delta[3] + delta[7]) * 1.0 / (reads + writes) if reads + writes else 0.0
+            device_io["queue_depth"] = delta[10] / 1000.0 / interval  # time_in_queue 单位为ms
+            device_io["util"] = min(delta[9] / 10.0 / interval, 100.0)  # io_ticks(ms) / (interval * 1000) * 100
+        disk_io[device] = device_io
+    return disk_io
+
+
+def calc_disk_io(interval=calc_func_interval, include_partition=False):
+    """计算所有块设备的IO速率(IOPS,吞吐量,平均延迟,队列深度,使用率) - 一次读取 /proc/diskstats"""
+    from metric_sampler import get_sampled_metric
+    sampled = get_sampled_metric(("disk_io",), wait=interval)
+    if sampled is not None:  # 后台采样线程运行中,直接返回最近一次的采样结果
+        disk_io = sampled[0]
+    else:
+        global prev_diskstats_snapshot
+        with baseline_lock:
+            initialized = prev_diskstats_snapshot is not None
+            if not initialized:
+                prev_diskstats_snapshot = read_diskstats_snapshot()
+        if not initialized:
+            sleep(interval)
+
+        with baseline_lock:
+            current_diskstats_snapshot = get_diskstats_snapshot()
+            if current_diskstats_snapshot is prev_diskstats_snapshot:  # 与上次调用处于同一个tick
+                current_diskstats_snapshot = read_diskstats_snapshot()
+            disk_io = calc_disk_io_between(prev_diskstats_snapshot, current_diskstats_snapshot)
+            prev_diskstats_snapshot = current_diskstats_snapshot
+
+    if not include_partition:
+        disk_io = dict((device, device_io) for device, device_io in disk_io.items() if not device_io["partition"])
+    return disk_io
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# encoding:utf-8
+
+"""
+进程监测核心功能实现 - taskstats (generic netlink) 进程统计
+
+通过内核 TASKSTATS generic netlink 接口, 一次请求即可获得进程(或整个线程组)的
+- CPU时间 (utime, stime, 实际运行时间)
+- IO (rchar, wchar, syscr, syscw, read_bytes, write_bytes, cancelled_write_bytes)
+- 延迟统计 (等待CPU, 等待块设备IO, 等待swap换入 的次数与总时间)
+- 缺页次数, 上下文切换次数
+无需为每个进程分别打开 /proc/[pid]/stat 与 /proc/[pid]/io (io 需要 ptrace 权限)
+
+需要 CAP_NET_ADMIN 权限与内核 CONFIG_TASKSTATS, 延迟统计还需要开启 delayacct (sysctl kernel.task_delayacct=1),
+taskstats 不可用时退回读取 /proc (延迟统计由各线程 stat 的 delayacct_blkio_ticks 与 schedstat 近似, 无swap换入延迟)
+
+reference   :   https://www.kernel.org/doc/Documentation/accounting/taskstats.txt
+reference   :   https://github.com/torvalds/linux/blob/master/include/uapi/linux/taskstats.h
+"""
+
+import os
+import errno
+import socket
+import struct
+import threading
+
+from prcess_exception import NoSuchProcess, AccessDenied
+from process_monitor import read_process_stat, read_process_io, read_process_schedstat, read_process_ctxt_switches, \
+    read_thread_counters, sum_thread_counters, CLOCK_TICKS
+
+# netlink / generic netlink 常量
+NETLINK_GENERIC = 16
+NLM_F_REQUEST = 1
+NLMSG_ERROR = 2
+GENL_ID_CTRL = 0x10
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+
+# taskstats 常量
+TASKSTATS_GENL_NAME = "TASKSTATS"
+TASKSTATS_GENL_VERSION = 1
+TASKSTATS_CMD_GET = 1
+TASKSTATS_CMD_ATTR_PID = 1
+TASKSTATS_CMD_ATTR_TGID = 2
+TASKSTATS_TYPE_STATS = 3
+TASKSTATS_TYPE_AGGR_PID = 4
+TASKSTATS_TYPE_AGGR_TGID = 5
+
+NLMSG_HEADER = struct.Struct("=IHHII")  # nlmsghdr : len, type, flags, seq, pid
+GENL_HEADER = struct.Struct("=BBH")  # genlmsghdr : cmd, version, reserved
+NLA_HEADER = struct.Struct("=HH")  # nlattr : len, type
+
+# struct taskstats (version 8+) 从开头到 nivcsw 的部分, 之后新增的字段不解析
+TASKSTATS_STRUCT = struct.Struct("=H2xIBB6x" + "8Q" + "32sB3x4x" + "5I4x" + "18Q")
+TASKSTATS_FIELDS = ("version", "ac_exitcode", "ac_flag", "ac_nice",
+                    "cpu_count", "cpu_delay_total", "blkio_count", "blkio_delay_total",
+                    "swapin_count", "swapin_delay_total", "cpu_run_real_total", "cpu_run_virtual_total",
+                    "ac_comm", "ac_sched", "ac_uid", "ac_gid", "ac_pid", "ac_ppid", "ac_btime",
+                    "ac_etime", "ac_utime", "ac_stime", "ac_minflt", "ac_majflt",
+                    "coremem", "virtmem", "hiwater_rss", "hiwater_vm",
+                    "rchar", "wchar", "syscr", "syscw", "read_bytes", "write_bytes", "cancelled_write_bytes",
+                    "nvcsw", "nivcsw")
+
+# 对外统一的进程统计字段 (时间单位均为ns, taskstats 与 /proc 两种方式返回相同的键)
+PROCESS_TASKSTATS_FIELDS = ("utime", "stime", "cpu_run_real_total",
+                            "cpu_count", "cpu_delay_total", "blkio_count", "blkio_delay_total",
+                            "swapin_count", "swapin_delay_total", "minflt", "majflt", "nvcsw", "nivcsw",
+                            "rchar", "wchar", "syscr", "syscw", "read_bytes", "write_bytes", "cancelled_write_bytes")
+
+# 默认的 taskstats 连接 (首次使用时创建, 不可用时为False)
+taskstats_client = None
+taskstats_client_lock = threading.Lock()
+
+
+def nla_pack(nla_type, payload):
+    """打包 netlink 属性 (补齐到4字节)"""
+    nla = NLA_HEADER.pack(NLA_HEADER.size + len(payload), nla_type) + payload
+    return nla + "\0" * (-len(nla) % 4)
+
+
+def nla_parse(data, offset=0, end=None):
+    """解析 netlink 属性 -> {类型: 数据}"""
+    end = len(data) if end is None else end
+    attrs = {}
+    while offset + NLA_HEADER.size <= end:
+        nla_len, nla_type = NLA_HEADER.unpack_from(data, offset)
+        if nla_len < NLA_HEADER.size:
+            break
+        attrs[nla_type & 0x3fff] = data[offset + NLA_HEADER.size:offset + nla_len]  # 去掉 NLA_F_NESTED 等标志位
+        offset += (nla_len + 3) & ~3  # NLA_ALIGN
+    return attrs
+
+
+def parse_taskstats(data):
+    """解析 struct taskstats -> dict (ac_utime/ac_stime 为us, 延迟总时间为ns)"""
+    if len(data) < TASKSTATS_STRUCT.size:
+        raise ValueError("taskstats too short : {} bytes".format(len(data)))
+    stats = dict(zip(TASKSTATS_FIELDS, TASKSTATS_STRUCT.unpack_from(data)))
+    stats["ac_comm"] = stats["ac_comm"].split("\0", 1)[0]
+    return stats
+
+
+class TaskstatsClient(object):
+    """taskstats generic netlink 连接 (创建失败时抛出 socket.error/EnvironmentError)"""
+
+    def __init__(self, timeout=1):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_GENERIC)
+        self.sock.settimeout(timeout)
+        self.seq = 0
+        self.lock = threading.Lock()
+        try:
+            self.sock.bind((0, 0))
+            self.family_id = self.resolve_family(TASKSTATS_GENL_NAME)
+        except (socket.error, EnvironmentError):
+            self.sock.close()
+            raise
+
+    def request(self, msg_type, cmd, version, attrs):
+        """发送 generic netlink 请求并接收应答 -> 应答的属性 (内核返回错误时抛出 OSError)"""
+        self.seq += 1
+        payload = GENL_HEADER.pack(cmd, version, 0) + attrs
+        self.sock.send(NLMSG_HEADER.pack(NLMSG_HEADER.size + len(payload), msg_type, NLM_F_REQUEST,
+                                         self.seq, 0) + payload)
+        while True:
+            data = self.sock.recv(65536)
+            msg_len, reply_type, flags, seq, port = NLMSG_HEADER.unpack_from(data)
+            if seq != self.seq:  # 之前超时请求的应答
+                continue
+            if reply_type == NLMSG_ERROR:
+                err = -struct.unpack_from("=i", data, NLMSG_HEADER.size)[0]
+                if err:
+                    raise OSError(err, os.strerror(err))
+                continue  # ACK
+            return nla_parse(data, NLMSG_HEADER.size + GENL_HEADER.size, msg_len)
+
+    def resolve_family(self, name):
+        """查询 generic netlink 族id"""
+        attrs = self.request(GENL_ID_CTRL, CTRL_CMD_GETFAMILY, 1, nla_pack(CTRL_ATTR_FAMILY_NAME, name + "\0"))
+        return struct.unpack("=H", attrs[CTRL_ATTR_FAMILY_ID][:2])[0]
+
+    def get(self, pid, tgid=True):
+        """
+        获取进程统计 (tgid=True 时为整个线程组的累计值, 否则为单个线程)
+        进程不存在时抛出 NoSuchProcess, 无权限时抛出 AccessDenied
+        """
+        cmd_attr = TASKSTATS_CMD_ATTR_TGID if tgid else TASKSTATS_CMD_ATTR_PID
+        aggr_type = TASKSTATS_TYPE_AGGR_TGID if tgid else TASKSTATS_TYPE_AGGR_PID
+        with self.lock:
+            try:
+                attrs = self.request(self.family_id, TASKSTATS_CMD_GET, TASKSTATS_GENL_VERSION,
+                                     nla_pack(cmd_attr, struct.pack("=I", int(pid))))
+            except EnvironmentError as err:
+                if err.errno == errno.ESRCH:
+                    raise NoSuchProcess(pid)
+                if err.errno in (errno.EPERM, errno.EACCES):
+                    raise AccessDenied(pid)
+                raise
+        aggr = attrs.get(aggr_type)
+        if aggr is None:
+            raise NoSuchProcess(pid)
+        return parse_taskstats(nla_parse(aggr)[TASKSTATS_TYPE_STATS])
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+def get_taskstats_client():
+    """获取默认的 taskstats 连接 (不可用时为None, 只尝试一次)"""
+    global taskstats_client
+    if taskstats_client is None:
+        with taskstats_client_lock:
+            if taskstats_client is None:
+                try:
+                    taskstats_client = TaskstatsClient()
+                except (socket.error, EnvironmentError, KeyError, AttributeError):
+                    taskstats_client = False
+    return taskstats_client or None
+
+
+def is_taskstats_available():
+    """是否可以使用 taskstats (内核支持且有 CAP_NET_ADMIN 权限)"""
+    client = get_taskstats_client()
+    if client is None:
+        return False
+    try:
+        client.get(os.getpid())
+        return True
+    except (AccessDenied, EnvironmentError):
+        return False
+
+
+# 内核的线程组累计值中不包含的字段 (只有单个线程的统计中才有)
+TASKSTATS_TGID_MISSING_FIELDS = ("minflt", "majflt", "rchar", "wchar", "syscr", "syscw",
+                                 "read_bytes", "write_bytes", "cancelled_write_bytes")
+
+
+def convert_taskstats(stats, tgid=False):
+    """struct taskstats -> 统一的进程统计字段 (时间单位为ns, 线程组累计值中没有的字段为None)"""
+    process_stats = dict((field, stats.get(field)) for field in PROCESS_TASKSTATS_FIELDS)
+    process_stats["utime"] = stats["ac_utime"] * 1000
+    process_stats["stime"] = stats["ac_stime"] * 1000
+    process_stats["minflt"] = stats["ac_minflt"]
+    process_stats["majflt"] = stats["ac_majflt"]
+    if tgid:
+        process_stats.update(dict.fromkeys(TASKSTATS_TGID_MISSING_FIELDS))
+    return process_stats
+
+
+def get_proc_taskstats(pid, tgid=True):
+    """
+    通过 /proc 获取进程统计 (taskstats 不可用时的退回方式, 与 convert_taskstats 返回相同的键)
+    tgid=True 时 blkio/schedstat/上下文切换 为各存活线程之和 (/proc/[pid] 下只是主线程的值), io 无权限时为None
+    """
+    ns_per_tick = 1000000000 // CLOCK_TICKS
+    p_stat = read_process_stat(pid)
+    process_stats = dict.fromkeys(PROCESS_TASKSTATS_FIELDS)
+    process_stats["utime"] = p_stat.utime * ns_per_tick
+    process_stats["stime"] = p_stat.stime * ns_per_tick
+    process_stats["minflt"] = p_stat.minflt
+    process_stats["majflt"] = p_stat.majflt
+    if tgid:
+        blkio_ticks, process_stats["cpu_run_real_total"], process_stats["cpu_delay_total"], \
+            process_stats["cpu_count"], process_stats["nvcsw"], process_stats["nivcsw"] = \
+            sum_thread_counters(read_thread_counters(pid))
+    else:
+        blkio_ticks = p_stat.delayacct_blkio_ticks
+        try:
+            process_stats["cpu_run_real_total"], process_stats["cpu_delay_total"], process_stats["cpu_count"] = \
+                read_process_schedstat(pid)
+        except (AccessDenied, NoSuchProcess):  # 内核未开启 CONFIG_SCHED_INFO 时没有 schedstat (进程是否退出由下面的 status 判断)
+            pass
+        process_stats["nvcsw"], process_stats["nivcsw"] = read_process_ctxt_switches(pid)
+    if blkio_ticks is not None:
+        process_stats["blkio_delay_total"] = blkio_ticks * ns_per_tick
+    try:
+        process_stats.update(read_process_io(pid))
+    except (AccessDenied, EnvironmentError):  # 无权限或内核未开启 CONFIG_TASK_IO_ACCOUNTING
+        pass
+    return process_stats
+
+
+def get_process_taskstats(pid, tgid=True):
+    """
+    获取进程统计 (优先使用 taskstats, 不可用时退回 /proc; 返回的键见 PROCESS_TASKSTATS_FIELDS)
+    内核的线程组累计值不包含IO字段, tgid=True 时IO由 /proc/[pid]/io 补充 (无权限或内核不支持时为None), 缺页次数为None
+    """
+    client = get_taskstats_client()
+    if client is not None:
+        try:
+            process_stats = convert_taskstats(client.get(pid, tgid), tgid)
+        except (AccessDenied, EnvironmentError, KeyError, ValueError):
+            return get_proc_taskstats(pid, tgid)
+        if tgid:
+            try:
+                process_stats.update(read_process_io(pid))
+            except (AccessDenied, EnvironmentError):  # 无权限或内核未开启 CONFIG_TASK_IO_ACCOUNTING
+                pass
+        return process_stats
+    return get_proc_taskstats(pid, tgid)
+
+
+def get_processes_taskstats(pids, tgid=True):
+    """
+    批量获取多个进程统计
+    :return: {pid: 进程统计} , 单个进程无权限或已退出时为 {"error": "AccessDenied"/"NoSuchProcess"}, 不影响其他进程
+    """
+    res = {}
+    for pid in pids:
+        pid = int(pid)
+        try:
+            res[pid] = get_process_taskstats(pid, tgid)
+            res[pid]["error"] = None
+        except NoSuchProcess:
+            res[pid] = {"error": "NoSuchProcess"}
+        except AccessDenied:
+            res[pid] = {"error": "AccessDenied"}
+    return res
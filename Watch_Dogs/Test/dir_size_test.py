@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# encoding:utf-8
+
+"""
+文件夹总大小测试
+
+- 默认(max_age=0)能获取到已有文件大小的变化 (写入内容不改变文件夹 mtime)
+- 实时维护线程已停止时不返回停止前的大小, 并在重试间隔后替换
+- inotify 初始化失败(EMFILE等)时退回按mtime增量遍历, 不抛出异常
+python dir_size_test.py
+"""
+
+import os
+import errno
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "Core"))
+
+import dir_size
+from dir_size import get_path_total_size, unwatch_path_size, dir_size_watchers, load_inotify
+
+
+class DirSizeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.path, "data")
+
+    def tearDown(self):
+        unwatch_path_size(self.path)
+        shutil.rmtree(self.path)
+
+    def write(self, size):
+        with open(self.file_path, "ab") as f:
+            f.write(b"x" * size)
+
+    def test_file_growth(self):
+        self.write(3632)
+        self.assertEqual(get_path_total_size(self.path, "KB"), round(3632 / 1024., 2))
+        self.write(5000)
+        self.assertEqual(get_path_total_size(self.path, "KB"), round(8632 / 1024., 2))
+
+    def test_dead_watcher(self):
+        self.write(1024)
+        self.assertEqual(get_path_total_size(self.path, "KB", watch=True), 1.0)
+        watcher = dir_size_watchers[self.path]
+        watcher.stop()
+        watcher.join()
+        self.write(1024)
+        self.assertEqual(get_path_total_size(self.path, "KB", watch=True), 2.0)
+        self.assertIs(dir_size_watchers[self.path], watcher)  # 重试间隔内不替换
+        watcher.end_time -= dir_size.DIR_WATCH_RETRY_INTERVAL
+        self.write(1024)
+        self.assertEqual(get_path_total_size(self.path, "KB", watch=True), 3.0)
+        self.assertIsNot(dir_size_watchers[self.path], watcher)
+        self.assertTrue(dir_size_watchers[self.path].live)
+
+    def test_inotify_unavailable(self):
+        ctypes, inotify_init1, inotify_add_watch, inotify_rm_watch = load_inotify()
+
+        def inotify_init1_emfile(flags):
+            ctypes.set_errno(errno.EMFILE)
+            return -1
+
+        dir_size.inotify_libc = ctypes, inotify_init1_emfile, inotify_add_watch, inotify_rm_watch
+        try:
+            self.write(1024)
+            self.assertEqual(get_path_total_size(self.path, "KB", watch=True), 1.0)
+            self.assertFalse(dir_size_watchers[self.path].live)
+        finally:
+            dir_size.inotify_libc = ctypes, inotify_init1, inotify_add_watch, inotify_rm_watch
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# encoding:utf-8
+
+"""
+导入耗时性能测试 - 防止导入时的额外开销回归
+
+每个模块在新的解释器中导入多次, 减去空解释器启动耗时后取平均值(先预热一次生成 .pyc, 与实际部署一致),
+并检查导入后没有加载 ctypes/socket, 也没有读取 /proc 快照
+超过预算(默认每个模块 15ms)时返回非0, 可用于 CI
+python import_time_benchmark.py [次数] [预算ms]
+"""
+
+import os
+import sys
+import subprocess
+from time import time
+
+ROOT_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..")
+
+MODULES = ["Watch_Dogs.Core",
+           "Watch_Dogs.Core.sys_monitor",
+           "Watch_Dogs.Core.process_monitor",
+           "Watch_Dogs.Core.process_manage",
+           "Watch_Dogs.Core.metric_sampler",
+           "Watch_Dogs.Core.proc_connector"]
+
+# 导入后检查: 没有加载 ctypes/socket, 没有读取过任何 /proc 快照
+CHECK_CODE = """
+import sys
+import {module}
+assert "ctypes" not in sys.modules, "ctypes loaded"
+assert "socket" not in sys.modules, "socket loaded"
+sys_monitor = sys.modules.get("Watch_Dogs.Core.sys_monitor")
+if sys_monitor is not None:
+    assert sys_monitor.proc_stat_snapshot is None, "/proc/stat read"
+    assert sys_monitor.mem_snapshot is None, "/proc/meminfo read"
+    assert sys_monitor.net_dev_snapshot is None, "/proc/net/dev read"
+"""
+
+
+# 允许写入 .pyc
+ENV = dict(os.environ)
+ENV.pop("PYTHONDONTWRITEBYTECODE", None)
+
+
+def run(code, times):
+    """-> 平均耗时(ms)"""
+    subprocess.check_call([sys.executable, "-c", code], cwd=ROOT_PATH, env=ENV)  # 预热
+    start = time()
+    for _ in xrange(times):
+        subprocess.check_call([sys.executable, "-c", code], cwd=ROOT_PATH, env=ENV)
+    return (time() - start) / times * 1000
+
+
+if __name__ == '__main__':
+    times = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else 15
+
+    baseline = run("pass", times)
+    print "python startup                        : {:.1f}ms".format(baseline)
+
+    failed = []
+    for module in MODULES:
+        cost = run(CHECK_CODE.format(module=module), times) - baseline
+        print "{:<38}: {:.1f}ms".format(module, cost)
+        if cost > budget:
+            failed.append(module)
+
+    if failed:
+        print "over budget ({}ms) : {}".format(budget, ", ".join(failed))
+        sys.exit(1)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# encoding:utf-8
+
+"""
+后台采样测试 - 采样线程运行时 calc_* 系列函数的返回值
+
+- 无法采样的指标(进程不存在)退回同步计算并抛出相应异常, 而不是返回None
+- 等待超时(interval 小于采样间隔)时退回同步计算
+- calc_disk_io 对采样结果的后处理(过滤分区)
+- 首次采样在基线之后至少半个采样间隔
+- 启动时预先采样全部系统指标, 首次调用不等待; calc_with_age 返回采样结果的距今秒数
+- 首次调用的进程指标只同步计算一次(等待一次interval), 之后直接返回采样结果
+python metric_sampler_test.py
+"""
+
+import os
+import sys
+import unittest
+from time import time, sleep
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "Core"))
+
+from prcess_exception import NoSuchProcess
+import metric_sampler
+import sys_monitor
+import process_monitor
+
+NO_SUCH_PID = 999999
+
+
+class MetricSamplerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.start_time = time()
+        self.sampler = metric_sampler.start_sampler(interval=1)
+
+    def tearDown(self):
+        metric_sampler.stop_sampler()
+        self.sampler.join()
+
+    def test_unwatchable_key(self):
+        self.assertIsNone(metric_sampler.get_sampled_metric(("process_cpu_percent", NO_SUCH_PID)))
+        self.assertRaises(NoSuchProcess, process_monitor.calc_process_cpu_percent, NO_SUCH_PID, 0.1)
+        self.assertRaises(NoSuchProcess, process_monitor.calc_process_cpu_io, NO_SUCH_PID, 0.1)
+
+    def test_wait_timeout(self):
+        self.assertIsInstance(sys_monitor.calc_cpu_percent(interval=0.1), float)
+        self.assertIsInstance(sys_monitor.calc_mem_rates(interval=0.1), dict)
+
+    def test_disk_io(self):
+        disk_io = sys_monitor.calc_disk_io(interval=0.1)  # 等待超时, 退回同步计算
+        self.assertIsInstance(disk_io, dict)
+        self.assertTrue(all(not device_io["partition"] for device_io in disk_io.values()))
+        disk_io = sys_monitor.calc_disk_io(interval=3, include_partition=True)  # 使用采样结果
+        self.assertIsInstance(disk_io, dict)
+        self.assertIsNotNone(metric_sampler.get_sampled_metric(("disk_io",)))
+
+    def test_first_sample(self):
+        sampled = metric_sampler.get_sampled_metric(("cpu_percent",), wait=3)
+        self.assertIsNotNone(sampled)
+        sample_time = metric_sampler.get_sampled_history(("cpu_percent",))[0][0]
+        self.assertGreaterEqual(sample_time - self.start_time, self.sampler.interval / 2.0)
+
+    def test_default_keys(self):
+        sleep(self.sampler.interval * 1.5)
+        for calc_func in (sys_monitor.calc_cpu_percent, sys_monitor.calc_cpu_percent_by_cores,
+                          sys_monitor.calc_mem_rates, sys_monitor.calc_all_net_rates, sys_monitor.calc_disk_io):
+            start_time = time()
+            value, age = metric_sampler.calc_with_age(calc_func, interval=2)
+            self.assertLess(time() - start_time, 0.5, calc_func.__name__)
+            self.assertIsNotNone(value)
+            self.assertTrue(0 <= age < 2, calc_func.__name__)
+
+    def test_cold_process_key(self):
+        pid = os.getpid()
+        start_time = time()
+        value, age = metric_sampler.calc_with_age(process_monitor.calc_process_cpu_percent, pid, 0.3)
+        self.assertLess(time() - start_time, 0.55)  # 只同步等待一次interval
+        self.assertEqual(age, 0.0)
+        sleep(self.sampler.interval * 2.2)
+        start_time = time()
+        value, age = metric_sampler.calc_with_age(process_monitor.calc_process_cpu_percent, pid, 2)
+        self.assertLess(time() - start_time, 0.5)
+        self.assertGreater(age, 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# encoding:utf-8
+
+"""
+并发指标存储性能测试 - MetricStore(GIL下原子的字典操作, 不加锁) vs 单锁字典
+
+每个线程写入/读取各自的进程指标, 同时有一个读线程不断获取快照, 分别统计不同线程数下的吞吐量
+python metric_store_benchmark.py [线程数 ...]
+"""
+
+import os
+import sys
+import threading
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "Core"))
+
+from metric_store import MetricStore
+
+OPERATIONS = 50000  # 每个线程的操作次数
+
+
+class LockedDict(object):
+    """旧方式 - 一把全局锁保护的字典"""
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+
+    def get(self, key, default=None):
+        with self.lock:
+            return self.data.get(key, default)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.data)
+
+
+def worker(store, thread_id):
+    for i in xrange(OPERATIONS):
+        key = (thread_id, i % 256)
+        store.set(key, i)
+        store.get(key)
+
+
+def run(store, thread_num):
+    """-> 每秒操作数"""
+    stop_event = threading.Event()
+
+    def reader():
+        while not stop_event.is_set():
+            store.snapshot()
+
+    snapshot_thread = threading.Thread(target=reader)
+    snapshot_thread.start()
+    threads = [threading.Thread(target=worker, args=(store, i)) for i in xrange(thread_num)]
+    start = time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    cost = time() - start
+    stop_event.set()
+    snapshot_thread.join()
+    return thread_num * OPERATIONS * 2 / cost
+
+
+if __name__ == '__main__':
+    thread_nums = map(int, sys.argv[1:]) or [1, 2, 4, 8]
+
+    for thread_num in thread_nums:
+        print "{} threads".format(thread_num)
+        print "  locked dict     : {:.0f} ops/s".format(run(LockedDict(), thread_num))
+        print "  MetricStore     : {:.0f} ops/s".format(run(MetricStore(), thread_num))
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# encoding:utf-8
+
+"""
+并发指标存储测试 - 多个线程同时写入/移除时, 快照与集合语义保持一致
+
+python metric_store_test.py
+"""
+
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "Core"))
+
+from metric_store import MetricStore
+
+
+class MetricStoreTest(unittest.TestCase):
+
+    def test_set_semantics(self):
+        store = MetricStore()
+        store.add(1)
+        added = store.get(1)
+        store.add(1)
+        self.assertEqual(store.get(1), added)
+        self.assertIn(1, store)
+        store.discard(1)
+        store.discard(1)
+        self.assertNotIn(1, store)
+
+    def test_concurrent_snapshot(self):
+        store = MetricStore()
+        errors = []
+
+        def writer(thread_id):
+            for i in xrange(20000):
+                store.set((thread_id, i % 64), i)
+                store.pop((thread_id, (i + 32) % 64))
+
+        def reader():
+            try:
+                for _ in xrange(2000):
+                    snapshot = store.snapshot()
+                    self.assertTrue(all(isinstance(value, int) for value in snapshot.values()))
+                    store.sizeof()
+            except Exception as err:
+                errors.append(err)
+
+        threads = [threading.Thread(target=writer, args=(i,)) for i in range(4)] + [threading.Thread(target=reader)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(store), 4 * 64)
+
+
+if __name__ == '__main__':
+    unittest.main()
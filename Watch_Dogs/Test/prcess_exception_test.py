@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# encoding:utf-8
+
+"""
+进程异常转换测试 (wrap_process_exceptions)
+
+- 带pid参数的函数: ENOENT/ESRCH -> NoSuchProcess, EPERM/EACCES -> AccessDenied
+- 系统信息读取函数(sys_monitor)不使用该装饰器: 原样抛出 IOError/OSError, 与参数个数无关
+python prcess_exception_test.py
+"""
+
+import os
+import sys
+import errno
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "Core"))
+
+from prcess_exception import wrap_process_exceptions, NoSuchProcess, AccessDenied
+import sys_monitor
+
+
+@wrap_process_exceptions
+def read_process_file(pid, err=errno.ENOENT):
+    raise IOError(err, os.strerror(err))
+
+
+class WrapProcessExceptionsTest(unittest.TestCase):
+
+    def test_process_reader(self):
+        with self.assertRaises(NoSuchProcess) as context:
+            read_process_file(123)
+        self.assertEqual(context.exception.pid, 123)
+        with self.assertRaises(AccessDenied):
+            read_process_file(123, errno.EACCES)
+
+    def test_sys_reader(self):
+        def read_net_dev_snapshot():
+            raise IOError(errno.ENOENT, os.strerror(errno.ENOENT))
+
+        origin = sys_monitor.read_net_dev_snapshot
+        sys_monitor.read_net_dev_snapshot = read_net_dev_snapshot
+        try:
+            with self.assertRaises(IOError) as context:
+                sys_monitor.calc_net_speed("eth0")
+            self.assertNotIsInstance(context.exception, (NoSuchProcess, AccessDenied))
+        finally:
+            sys_monitor.read_net_dev_snapshot = origin
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# encoding:utf-8
+
+"""
+进程事件源测试 - 接收缓冲区溢出(ENOBUFS)丢失退出事件时, 重建进程树后清理已退出的关注进程
+
+python proc_connector_test.py
+"""
+
+import os
+import sys
+import errno
+import socket
+import unittest
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "Core"))
+
+from process_monitor import all_process_info_dict, process_state_store, read_process_stat
+from process_manage import ProcessTree
+from proc_connector import ProcEventMonitor
+
+
+class OverflowSocket(object):
+    """第一次接收时缓冲区溢出, 之后停止事件循环"""
+
+    def __init__(self, monitor):
+        self.monitor = monitor
+        self.overflowed = False
+
+    def recv(self, size):
+        if self.overflowed:
+            self.monitor.stop_event.set()
+            raise socket.timeout()
+        self.overflowed = True
+        raise socket.error(errno.ENOBUFS, os.strerror(errno.ENOBUFS))
+
+
+class ProcConnectorTest(unittest.TestCase):
+
+    def test_overflow_forgets_exited(self):
+        process = subprocess.Popen(["sleep", "60"])
+        pid = process.pid
+        process_state_store.get(pid, read_process_stat(pid).starttime)
+        self.assertIn(pid, all_process_info_dict["watch_pid"])
+        process.kill()
+        process.wait()  # 退出事件已丢失
+
+        monitor = ProcEventMonitor(ProcessTree())
+        monitor.sock = OverflowSocket(monitor)
+        monitor.run_events()
+        self.assertNotIn(pid, all_process_info_dict["watch_pid"])
+        self.assertNotIn(pid, process_state_store)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# encoding:utf-8
+
+"""
+/proc 文件句柄池测试
+
+- 多线程并发读取 (pread 在锁外进行, 读取期间被淘汰的文件描述符由读取者关闭)
+- 上限默认根据 RLIMIT_NOFILE 计算, 可修改
+- 一次性读取(pooled=False)不占用句柄池
+- 按进程关闭文件只关闭该进程的文件, 没有关注数据的进程退出时直接返回
+python proc_file_pool_test.py
+"""
+
+import os
+import sys
+import resource
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "Core"))
+
+from proc_file_pool import ProcFilePool, proc_file_pool, default_max_open, PROC_FILE_POOL_MAX_SIZE
+from process_monitor import read_process_stat, process_state_store, forget_process
+
+
+class ProcFilePoolTest(unittest.TestCase):
+
+    def test_concurrent_read(self):
+        pool = ProcFilePool(max_open=2)
+        paths = ["/proc/self/stat", "/proc/self/status", "/proc/meminfo", "/proc/stat", "/proc/self/io"]
+        errors = []
+
+        def reader():
+            try:
+                for _ in range(200):
+                    for path in paths:
+                        self.assertTrue(pool.read(path))
+            except Exception as err:
+                errors.append(err)
+
+        threads = [threading.Thread(target=reader) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(pool.fds), 2)
+        self.assertTrue(all(entry.users == 0 for entry in pool.fds.values()))
+        pool.clear()
+
+    def test_max_open(self):
+        soft_limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+        self.assertLessEqual(default_max_open(), min(max(soft_limit, 16), PROC_FILE_POOL_MAX_SIZE))
+        pool = ProcFilePool()
+        self.assertEqual(pool.max_open, default_max_open())
+        for path in ["/proc/self/stat", "/proc/self/status", "/proc/meminfo"]:
+            pool.read(path)
+        pool.set_max_open(1)
+        self.assertEqual(list(pool.fds), ["/proc/meminfo"])
+        pool.clear()
+
+    def test_unpooled_read(self):
+        proc_file_pool.clear()
+        pid = os.getpid()
+        self.assertEqual(read_process_stat(pid, pooled=False).pid, pid)
+        self.assertEqual(len(proc_file_pool.fds), 0)
+        self.assertEqual(read_process_stat(pid).pid, pid)
+        self.assertEqual(len(proc_file_pool.fds), 1)
+        proc_file_pool.clear()
+
+    def test_discard_pid(self):
+        pool = ProcFilePool()
+        pid = os.getpid()
+        for path in ["/proc/{}/stat".format(pid), "/proc/{}/status".format(pid), "/proc/meminfo"]:
+            pool.read(path)
+        self.assertTrue(pool.has_pid(pid))
+        pool.discard_pid(pid)
+        self.assertFalse(pool.has_pid(pid))
+        self.assertEqual(list(pool.fds), ["/proc/meminfo"])
+        self.assertEqual(pool.dirs, {"/proc": set(["/proc/meminfo"])})
+        pool.clear()
+        self.assertEqual(pool.dirs, {})
+
+    def test_forget_process(self):
+        proc_file_pool.clear()
+        pid = os.getpid()
+        self.assertFalse(process_state_store.is_tracked(pid))
+        read_process_stat(pid)
+        self.assertTrue(process_state_store.is_tracked(pid))
+        forget_process(pid)
+        self.assertFalse(process_state_store.is_tracked(pid))
+        self.assertEqual(len(proc_file_pool.fds), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
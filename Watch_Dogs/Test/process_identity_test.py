@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# encoding:utf-8
+
+"""
+进程身份信息缓存测试 - exec 后 pid 与 starttime 不变, 身份信息应随之更新
+
+- 身份信息缓存与进程名称索引在 exec 后返回新的 comm/cmdline
+- 进程名称索引不依赖身份信息缓存, 缓存被淘汰时不重新读取
+
+python process_identity_test.py
+"""
+
+import os
+import sys
+import unittest
+import subprocess
+from time import sleep, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "Core"))
+
+from process_monitor import get_process_info, get_process_identity, process_identity_cache
+from process_manage import ProcessTree, ProcessNameIndex
+
+
+class ProcessIdentityTest(unittest.TestCase):
+
+    def setUp(self):
+        self.process = subprocess.Popen(["sh", "-c", "sleep 0.5; exec sleep 7777"])
+
+    def tearDown(self):
+        self.process.kill()
+        self.process.wait()
+
+    def wait_exec(self):
+        """等待子进程执行 exec"""
+        deadline = time() + 5
+        while time() < deadline:
+            with open("/proc/{}/comm".format(self.process.pid)) as f:
+                if f.read().strip() == "sleep":
+                    return
+            sleep(0.05)
+        self.fail("exec timeout")
+
+    def test_exec(self):
+        pid = self.process.pid
+        self.assertEqual(get_process_info(pid)["comm"], "sh")
+        self.assertEqual(get_process_identity(pid)["cmdline"], "sh -c sleep 0.5; exec sleep 7777")
+        self.wait_exec()
+        self.assertEqual(get_process_info(pid)["comm"], "sleep")
+        identity = get_process_identity(pid)
+        self.assertEqual((identity["comm"], identity["cmdline"]), ("sleep", "sleep 7777"))
+        self.assertTrue(identity["exe"].endswith("sleep"))
+
+    def test_name_index_exec(self):
+        pid = self.process.pid
+        index = ProcessNameIndex(ProcessTree())
+        self.assertEqual(index.refresh()[pid][2], "sh")
+        self.wait_exec()
+        self.assertEqual(index.refresh()[pid][:3], ("sleep 7777", "sleep 7777", "sleep"))
+
+    def test_name_index_cache_eviction(self):
+        self.wait_exec()  # 两次刷新之间不应有进程 exec
+        index = ProcessNameIndex(ProcessTree())
+        max_size, process_identity_cache.max_size = process_identity_cache.max_size, 1
+        try:
+            index.refresh()
+            lookups = process_identity_cache.hits + process_identity_cache.misses
+            index.refresh()
+            self.assertEqual(process_identity_cache.hits + process_identity_cache.misses, lookups)
+        finally:
+            process_identity_cache.max_size = max_size
+
+
+if __name__ == '__main__':
+    unittest.main()
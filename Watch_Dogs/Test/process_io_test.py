@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# encoding:utf-8
+
+"""
+进程IO读取测试 - 没有 /proc/[pid]/io 时区分 进程已退出 与 内核未开启 CONFIG_TASK_IO_ACCOUNTING
+
+- 进程已退出: NoSuchProcess
+- 进程仍存在(内核不支持): EnvironmentError(EOPNOTSUPP), 批量计算时 error 为 "NotSupported"
+python process_io_test.py
+"""
+
+import os
+import sys
+import errno
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "Core"))
+
+import process_monitor
+from prcess_exception import NoSuchProcess
+from process_monitor import read_process_io, ProcessIORateEngine
+
+NO_SUCH_PID = 999999
+
+
+class ProcessIOTest(unittest.TestCase):
+
+    def setUp(self):
+        self.read_proc_file = process_monitor.read_proc_file
+
+        def read_proc_file_without_io(path):
+            if path.endswith("/io"):
+                raise IOError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+            return self.read_proc_file(path)
+
+        process_monitor.read_proc_file = read_proc_file_without_io
+
+    def tearDown(self):
+        process_monitor.read_proc_file = self.read_proc_file
+
+    def test_no_such_process(self):
+        self.assertRaises(NoSuchProcess, read_process_io, NO_SUCH_PID)
+
+    def test_not_supported(self):
+        with self.assertRaises(EnvironmentError) as context:
+            read_process_io(os.getpid())
+        self.assertEqual(context.exception.errno, errno.EOPNOTSUPP)
+        result = ProcessIORateEngine().update([os.getpid(), NO_SUCH_PID])
+        self.assertEqual(result[os.getpid()]["error"], "NotSupported")
+        self.assertEqual(result[NO_SUCH_PID]["error"], "NoSuchProcess")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# encoding:utf-8
+
+"""
+进程管理测试
+
+- 获取子进程/同组进程返回 str 类型的pid
+- 关闭进程时不占用句柄池
+python process_manage_test.py
+"""
+
+import os
+import sys
+import time
+import subprocess
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "Core"))
+
+from proc_file_pool import proc_file_pool
+from process_manage import get_all_child_process, get_same_group_process, kill_all_process
+
+
+class ProcessManageTest(unittest.TestCase):
+
+    def setUp(self):
+        # 新进程组, 避免同组关闭影响测试进程本身
+        self.p = subprocess.Popen(["sh", "-c", "sleep 100 & sleep 100; wait"],
+                                  preexec_fn=os.setpgrp, stderr=open(os.devnull, "w"))
+        time.sleep(0.2)
+
+    def tearDown(self):
+        try:
+            os.killpg(self.p.pid, 9)
+        except OSError:
+            pass
+        self.p.wait()
+
+    def test_pid_type(self):
+        children = get_all_child_process(self.p.pid)
+        self.assertEqual(len(children), 2)
+        self.assertTrue(all(isinstance(p, str) for p in children))
+        group = get_same_group_process(self.p.pid)
+        self.assertEqual(sorted(group), sorted(children + [str(self.p.pid)]))
+
+    def test_kill_unpooled(self):
+        proc_file_pool.clear()
+        children = get_all_child_process(self.p.pid)
+        self.assertTrue(kill_all_process(self.p.pid))
+        self.p.wait()
+        for pid in children:
+            self.assertFalse(proc_file_pool.has_pid(pid))
+        self.assertFalse(proc_file_pool.has_pid(self.p.pid))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# encoding:utf-8
+
+"""
+进程等待(stall)指标测试 - 多线程进程的计数为各线程之和
+
+- 主线程空闲, 工作线程频繁 sleep 时, 进程的主动上下文切换速率应包含工作线程
+- 线程退出后速率不为负
+- taskstats 的 /proc 退回方式同样累加各线程
+python process_stall_test.py
+"""
+
+import os
+import sys
+import threading
+import unittest
+from time import sleep
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "Core"))
+
+from process_monitor import ProcessStallEngine, read_process_ctxt_switches
+from taskstats import get_proc_taskstats
+
+WORKERS = 4
+
+
+class ProcessStallTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pid = os.getpid()
+        self.stop_events = [threading.Event() for _ in range(WORKERS)]
+        self.workers = [threading.Thread(target=self.work, args=(event,)) for event in self.stop_events]
+        for worker in self.workers:
+            worker.start()
+
+    def tearDown(self):
+        for event in self.stop_events:
+            event.set()
+        for worker in self.workers:
+            worker.join()
+
+    @staticmethod
+    def work(stop_event):
+        while not stop_event.is_set():
+            sleep(0.001)
+
+    def test_thread_sum(self):
+        engine = ProcessStallEngine()
+        engine.update([self.pid])
+        sleep(0.5)
+        stall = engine.update([self.pid])[self.pid]
+        self.assertIsNone(stall["error"])
+        self.assertGreater(stall["nvcsw"], 100 * WORKERS)
+
+    def test_thread_exit(self):
+        engine = ProcessStallEngine()
+        engine.update([self.pid])
+        sleep(0.2)
+        for event, worker in zip(self.stop_events, self.workers)[:WORKERS // 2]:
+            event.set()
+            worker.join()
+        stall = engine.update([self.pid])[self.pid]
+        for field in ("blkio_delay", "run_delay", "minflt", "majflt", "nvcsw", "nivcsw"):
+            self.assertTrue(stall[field] is None or stall[field] >= 0, field)
+
+    def test_proc_taskstats(self):
+        sleep(0.2)
+        main_nvcsw = read_process_ctxt_switches(self.pid)[0]
+        self.assertGreater(get_proc_taskstats(self.pid)["nvcsw"], main_nvcsw + 10 * WORKERS)
+
+
+if __name__ == '__main__':
+    unittest.main()
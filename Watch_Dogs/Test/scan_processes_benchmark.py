@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# encoding:utf-8
+
+"""
+进程表扫描性能测试 - scan_processes vs 旧的 get_all_pid + get_process_info 方式
+
+在临时目录中构造 1w / 5w 个进程的伪 /proc 目录, 分别计时
+python scan_processes_benchmark.py [进程数 ...]
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "Core"))
+
+from process_monitor import scan_processes
+
+STAT_TEMPLATE = "{pid} (python) S 1 {pid} {pid} 0 -1 4194560 1531 0 0 0 12 3 0 0 20 0 1 0 " \
+                "1234567 24174592 2301 18446744073709551615 1 1 0 0 0 0 0 16781312 2 0 0 0 17 0 0 0 0 0 0 " \
+                "0 0 0 0 0 0 0\n"
+
+
+def make_fake_proc(path, process_num):
+    """构造伪 /proc 目录"""
+    for pid in xrange(1, process_num + 1):
+        pid_path = os.path.join(path, str(pid))
+        os.makedirs(os.path.join(pid_path, "task", str(pid)))
+        with open(os.path.join(pid_path, "stat"), "w") as f:
+            f.write(STAT_TEMPLATE.format(pid=pid))
+        with open(os.path.join(pid_path, "cmdline"), "w") as f:
+            f.write("python\0worker.py\0--id\0{}\0".format(pid))
+        with open(os.path.join(pid_path, "io"), "w") as f:
+            f.write("rchar: 1024\nwchar: 2048\nsyscr: 1\nsyscw: 2\n")
+    # 非进程目录
+    os.makedirs(os.path.join(path, "sys"))
+    with open(os.path.join(path, "meminfo"), "w") as f:
+        f.write("MemTotal: 1 kB\n")
+
+
+def legacy_get_all_pid_name(proc_path):
+    """旧实现 - listdir + int() 过滤, 每个进程调用两次 get_process_info"""
+
+    def isDigit(x):
+        try:
+            x = int(x)
+            return isinstance(x, int)
+        except ValueError:
+            return False
+
+    def get_process_info(pid):
+        with open("{}/{}/stat".format(proc_path, pid), "r") as p_stat:
+            p_data = p_stat.readline().split(" ")
+        with open("{}/{}/cmdline".format(proc_path, pid), "r") as p_cmdline:
+            p_cmdline = p_cmdline.readline().replace('\0', ' ').strip()
+        return {
+            "pid": int(p_data[0]),
+            "comm": p_data[1].strip(")").strip("("),
+            "state": p_data[2],
+            "ppid": int(p_data[3]),
+            "pgrp": int(p_data[4]),
+            "thread num": len(os.listdir("{}/{}/task".format(proc_path, pid))),
+            "cmdline": p_cmdline
+        }
+
+    res = {}
+    for pid in filter(isDigit, os.listdir(proc_path)):
+        process_info = get_process_info(pid)
+        res[pid] = process_info["cmdline"] if get_process_info(pid)["cmdline"].strip() else process_info["comm"]
+    return res
+
+
+def scan_get_all_pid_name(proc_path):
+    """新实现 - scan_processes"""
+    res = {}
+    for record in scan_processes(("stat", "cmdline"), proc_path):
+        res[str(record.pid)] = record.cmdline if record.cmdline else record.comm
+    return res
+
+
+def timeit(func, *args):
+    start = time()
+    func(*args)
+    return time() - start
+
+
+if __name__ == '__main__':
+    process_nums = map(int, sys.argv[1:]) or [10000, 50000]
+
+    for process_num in process_nums:
+        fake_proc = tempfile.mkdtemp(prefix="fake_proc_")
+        try:
+            make_fake_proc(fake_proc, process_num)
+            assert legacy_get_all_pid_name(fake_proc) == scan_get_all_pid_name(fake_proc)
+            print "{} processes".format(process_num)
+            print "  legacy get_all_pid_name         : {:.3f}s".format(timeit(legacy_get_all_pid_name, fake_proc))
+            print "  scan_processes(stat, cmdline)   : {:.3f}s".format(timeit(scan_get_all_pid_name, fake_proc))
+            print "  scan_processes(stat)            : {:.3f}s".format(timeit(scan_processes, ("stat",), fake_proc))
+        finally:
+            shutil.rmtree(fake_proc)
+
+    print "real /proc ({} processes)".format(len(os.listdir("/proc")))
+    print "  scan_processes(stat, cmdline)   : {:.3f}s".format(timeit(scan_processes, ("stat", "cmdline")))
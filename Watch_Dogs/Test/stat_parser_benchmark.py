@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# encoding:utf-8
+
+"""
+/proc/[pid]/stat 解析性能测试 - ProcessStat vs 旧的 split(" ") 方式
+
+一次采样需要 进程信息(ppid,pgrp) + cpu时间片 + rss, 旧方式对同一行拆分多次
+python stat_parser_benchmark.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "Core"))
+
+from process_monitor import ProcessStat
+
+with open("/proc/self/stat", "r") as f:
+    STAT_LINE = f.read()
+
+# comm 中含有空格与括号的进程 (旧方式会解析出错误的字段)
+ODD_STAT_LINE = STAT_LINE.replace("(" + ProcessStat(STAT_LINE).comm + ")", "(tmux: server) (1))")
+
+
+def legacy_parse(p_data):
+    """旧实现 - get_process_info + get_process_cpu_time + get_process_mem"""
+    fields = p_data.split(" ")
+    info = (int(fields[3]), int(fields[4]), fields[1].strip(")").strip("("))
+    cpu_time = sum(map(int, p_data.split(" ")[13:17]))
+    rss = int(p_data.split()[23])
+    return info, cpu_time, rss
+
+
+def stat_parse(p_data):
+    """新实现 - ProcessStat"""
+    p_stat = ProcessStat(p_data)
+    return (p_stat.ppid, p_stat.pgrp, p_stat.comm), p_stat.cpu_time, p_stat.rss
+
+
+def stat_parse_one_field(p_data):
+    """新实现 - 只访问一个字段"""
+    return ProcessStat(p_data).starttime
+
+
+if __name__ == '__main__':
+    number = 200000
+    assert legacy_parse(STAT_LINE) == stat_parse(STAT_LINE)
+    try:
+        legacy_result = legacy_parse(ODD_STAT_LINE)
+    except ValueError as e:
+        legacy_result = "ValueError : {}".format(e)
+    print "legacy parse (odd comm)  :", legacy_result
+    print "ProcessStat (odd comm)   :", stat_parse(ODD_STAT_LINE)
+
+    for name, func in (("legacy split parse", legacy_parse),
+                       ("ProcessStat", stat_parse),
+                       ("ProcessStat (1 field)", stat_parse_one_field)):
+        cost = timeit.timeit(lambda: func(STAT_LINE), number=number)
+        print "{:<24}: {:.2f} us/record".format(name, cost / number * 10 ** 6)
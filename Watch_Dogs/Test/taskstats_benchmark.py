@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# encoding:utf-8
+
+"""
+进程统计性能测试 - taskstats netlink vs /proc
+
+对当前所有进程获取一次 CPU时间,IO及延迟统计, 比较
+- taskstats 单个线程 (一次netlink请求)
+- taskstats 线程组 (一次netlink请求 + /proc/[pid]/io)
+- /proc (stat + schedstat + status + io)
+需要 root 权限 (CAP_NET_ADMIN), taskstats 不可用时只测试 /proc
+python taskstats_benchmark.py [次数]
+"""
+
+import os
+import sys
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "Core"))
+
+from prcess_exception import NoSuchProcess, AccessDenied
+from process_monitor import get_all_pid
+from proc_file_pool import proc_file_pool
+import taskstats
+
+
+def run(func, pids, times):
+    """-> 每个进程平均耗时(us)"""
+    start = time()
+    for _ in xrange(times):
+        for pid in pids:
+            try:
+                func(pid)
+            except (NoSuchProcess, AccessDenied):
+                pass
+    return (time() - start) / times / len(pids) * 1000000
+
+
+if __name__ == '__main__':
+    times = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    pids = get_all_pid()
+    print "{} processes, {} times".format(len(pids), times)
+
+    client = taskstats.get_taskstats_client()
+    if client is None or not taskstats.is_taskstats_available():
+        print "taskstats not available"
+    else:
+        print "taskstats (pid)       : {:.1f}us".format(run(lambda pid: client.get(pid, False), pids, times))
+        print "taskstats (tgid + io) : {:.1f}us".format(
+            run(lambda pid: taskstats.get_process_taskstats(pid, True), pids, times))
+    print "/proc                 : {:.1f}us".format(run(taskstats.get_proc_taskstats, pids, times))
+    proc_file_pool.clear()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# encoding:utf-8
+
+"""
+线程CPU占用率测试 - 回收子进程不应计入线程的CPU占用率
+
+/proc/[pid]/task/[tid]/stat 中的 cutime/cstime 是整个进程已回收子进程的累计值,
+fork 一个消耗CPU的子进程并回收后, 空闲的主线程占用率应接近0
+python thread_rate_test.py
+"""
+
+import os
+import sys
+import unittest
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "Core"))
+
+from process_monitor import ThreadRateEngine
+
+BUSY_SECONDS = 1
+
+
+class ThreadRateTest(unittest.TestCase):
+
+    def test_reaped_child_not_counted(self):
+        engine = ThreadRateEngine()
+        pid = os.getpid()
+        engine.update([pid])
+
+        child = os.fork()
+        if child == 0:  # 子进程 - 消耗CPU后退出
+            deadline = time() + BUSY_SECONDS
+            while time() < deadline:
+                pass
+            os._exit(0)
+        os.waitpid(child, 0)
+
+        threads = dict((thread["tid"], thread) for thread in engine.update([pid])[pid])
+        main_thread = threads[pid]
+        self.assertIsNotNone(main_thread["cpu_percent"])
+        # 子进程在整个间隔内几乎占满一个核, 占总CPU时间的 100/核数 %
+        self.assertLess(main_thread["cpu_percent"], 100.0 / os.sysconf("SC_NPROCESSORS_ONLN") / 4)
+
+
+if __name__ == '__main__':
+    unittest.main()